@@ -7,6 +7,10 @@ import CodeEditor from './components/CodeEditor';
 import MapPreview from './components/MapPreview';
 import AutocompleteInput from './components/AutocompleteInput';
 import { isPythonValue, getPythonExpr } from './utils/pythonValue';
+import { decodeBinaryPayload, fetchBinaryPayload } from './utils/binaryPayload';
+import { restoreFullGeometry } from './utils/progressivePayload';
+import { thumbnailSrc } from './utils/thumbnails';
+import { useLoadMoreOnScroll, mergeListingPage } from './utils/infiniteScroll';
 import {
   DEFAULT_INDIC_IMPORT,
   DEFAULT_INDIC_IMPORT_CODE,
@@ -14,7 +18,7 @@ import {
   createDefaultBuilderOptions,
   createDefaultBuilderElements,
 } from './lib/editorDefaults';
-import { API_BASE } from './config';
+import { API_BASE, PUBLIC_API_BASE } from './config';
 const HUB_NAME_RE = /^[a-z0-9_.]+$/;
 const RESERVED_MAP_NAMES = new Set([
   'guest', 'admin', 'explore', 'users', 'login', 'logout', 'new-map', 'new_map',
@@ -134,7 +138,8 @@ function App() {
   const [activeTab, setActiveTab] = useState('builder'); // 'builder' or 'code'
   const [activePreviewTab, setActivePreviewTab] = useState('main'); // 'main' | 'picker' | 'library'
   const [mapHtml, setMapHtml] = useState('');
-  const [mapPayload, setMapPayload] = useState(null);
+  // Full-detail payload of the last main render (a promise), kept client-side for JSON export.
+  const mapExportRef = useRef(null);
   const [pickerHtml, setPickerHtml] = useState('');
   const [territoryLibraryHtml, setTerritoryLibraryHtml] = useState('');
   const [territoryLibrarySource, setTerritoryLibrarySource] = useState('custom'); // custom | hub
@@ -171,15 +176,12 @@ function App() {
   const [profileEdit, setProfileEdit] = useState({ full_name: '', bio: '' });
   const [passwordEdit, setPasswordEdit] = useState({ current_password: '', new_password: '' });
   const [profileSearch, setProfileSearch] = useState('');
-  const [profilePage, setProfilePage] = useState(1);
   const [profileSort, setProfileSort] = useState('default');
-  const [exploreData, setExploreData] = useState({ items: [], page: 1, per_page: 12, total: 0 });
+  const [exploreData, setExploreData] = useState({ items: [], per_page: 12, total: 0, next_cursor: null });
   const [exploreQuery, setExploreQuery] = useState('');
-  const [explorePage, setExplorePage] = useState(1);
   const [exploreSort, setExploreSort] = useState('default');
-  const [usersData, setUsersData] = useState({ items: [], page: 1, per_page: 20, total: 0 });
+  const [usersData, setUsersData] = useState({ items: [], per_page: 20, total: 0, next_cursor: null });
   const [usersQuery, setUsersQuery] = useState('');
-  const [usersPage, setUsersPage] = useState(1);
   const [exploreLoading, setExploreLoading] = useState(false);
   const [profileLoading, setProfileLoading] = useState(false);
   const [usersLoading, setUsersLoading] = useState(false);
@@ -560,7 +562,7 @@ ${DEFAULT_MAP_CODE}
       ];
       for (const [kind, setter] of pairs) {
         try {
-          const resp = await apiFetch(`/hub/${kind}/${normalizedMapName}`);
+          const resp = await apiFetch(`/hub/${kind}/${normalizedMapName}?include_content=false`);
           if (!resp.ok) {
             setter('alpha');
             continue;
@@ -768,7 +770,7 @@ ${DEFAULT_MAP_CODE}
     const selectedVersion = importVersionDraft[key] || (options[0]?.value || 'alpha');
     const path = `/${item.kind}/${item.name}/${selectedVersion}`;
     try {
-      const verifyResp = await apiFetch(`/hub/${item.kind}/${item.name}`);
+      const verifyResp = await apiFetch(`/hub/${item.kind}/${item.name}?include_content=false`);
       if (!verifyResp.ok) {
         setError(`Cannot import ${item.kind}: /${item.kind}/${item.name} does not exist.`);
         return;
@@ -806,7 +808,7 @@ ${DEFAULT_MAP_CODE}
     setImportLoading(true);
     setExploreQuery(hubQuery);
     try {
-      await loadExplore(1, hubQuery, importSort);
+      await loadExplore(null, hubQuery, importSort);
     } finally {
       setImportLoading(false);
     }
@@ -816,7 +818,7 @@ ${DEFAULT_MAP_CODE}
     const key = artifactKey(username, kind, name);
     if (!force && artifactVersionOptions[key] !== undefined) return artifactVersionOptions[key];
     try {
-      const resp = await apiFetch(`/hub/${kind}/${name}`);
+      const resp = await apiFetch(`/hub/${kind}/${name}?include_content=false`);
       if (!resp.ok) {
         setArtifactVersionOptions((prev) => ({ ...prev, [key]: null }));
         return null;
@@ -1021,7 +1023,7 @@ ${DEFAULT_MAP_CODE}
       if (viewResp.ok) setMapViews(Number(viewData.views || 0));
       setMapVotes(Number(data.votes || 0));
       setMapUserVoted(!!data.viewer_voted);
-      const artifactResp = await apiFetch(`/hub/map/${name}`);
+      const artifactResp = await apiFetch(`/hub/map/${name}?include_content=false`);
       const artifactData = await artifactResp.json();
       if (artifactResp.ok) {
         setMapVotes(Number(artifactData.votes || 0));
@@ -1136,15 +1138,17 @@ ${DEFAULT_MAP_CODE}
     return () => clearTimeout(t);
   }, [normalizedMapName, builderElements, builderOptions, runtimeBuilderElements, runtimeBuilderOptions, code, predefinedCode, importsCode, themeCode, runtimeImportsCode, runtimeThemeCode, runtimePredefinedCode, runtimeCode, pickerOptions, currentUser.is_authenticated]);
 
-  const loadExplore = async (page = 1, query = exploreQuery, sort = exploreSort) => {
+  // Listings are cursor-paginated: no cursor loads the first page, a next_cursor appends the page after it.
+  const loadExplore = async (cursor = null, query = exploreQuery, sort = exploreSort) => {
     setExploreLoading(true);
     try {
-      const params = new URLSearchParams({ page: String(page), per_page: '12', q: query || '', sort: sort || 'default' });
+      const params = new URLSearchParams({ per_page: '12', q: query || '', sort: sort || 'default' });
+      if (cursor) params.set('cursor', cursor);
       const resp = await apiFetch(`/explore?${params.toString()}`);
       const data = await resp.json();
       if (!resp.ok) throw new Error(getApiErrorMessage(data, 'Failed to load explore'));
-      setExploreData(data);
-      setHubSearchResults(Array.isArray(data.items) ? data.items : []);
+      setExploreData((prev) => mergeListingPage(prev, { ...data, query, sort }, cursor));
+      if (!cursor) setHubSearchResults(Array.isArray(data.items) ? data.items : []);
     } catch (err) {
       setError(err.message);
     } finally {
@@ -1152,15 +1156,16 @@ ${DEFAULT_MAP_CODE}
     }
   };
 
-  const loadProfile = async (username, page = 1, query = profileSearch, sort = profileSort) => {
+  const loadProfile = async (username, cursor = null, query = profileSearch, sort = profileSort) => {
     if (!username) return;
     setProfileLoading(true);
     try {
-      const params = new URLSearchParams({ page: String(page), per_page: '12', q: query || '', sort: sort || 'default' });
+      const params = new URLSearchParams({ per_page: '12', q: query || '', sort: sort || 'default' });
+      if (cursor) params.set('cursor', cursor);
       const resp = await apiFetch(`/users/${username}?${params.toString()}`);
       const data = await resp.json();
       if (!resp.ok) throw new Error(getApiErrorMessage(data, 'Failed to load profile'));
-      setProfileData(data);
+      setProfileData((prev) => mergeListingPage(prev, { ...data, query, sort }, cursor, 'maps'));
       setProfileEdit({ full_name: data?.profile?.full_name || '', bio: data?.profile?.bio || '' });
     } catch (err) {
       setError(err.message);
@@ -1183,14 +1188,15 @@ ${DEFAULT_MAP_CODE}
     }
   };
 
-  const loadUsers = async (page = 1, query = usersQuery) => {
+  const loadUsers = async (cursor = null, query = usersQuery) => {
     setUsersLoading(true);
     try {
-      const params = new URLSearchParams({ page: String(page), per_page: '20', q: query || '' });
+      const params = new URLSearchParams({ per_page: '20', q: query || '' });
+      if (cursor) params.set('cursor', cursor);
       const resp = await apiFetch(`/users?${params.toString()}`);
       const data = await resp.json();
       if (!resp.ok) throw new Error(getApiErrorMessage(data, 'Failed to load users'));
-      setUsersData(data);
+      setUsersData((prev) => mergeListingPage(prev, { ...data, query }, cursor));
     } catch (err) {
       setError(err.message);
     } finally {
@@ -1198,6 +1204,12 @@ ${DEFAULT_MAP_CODE}
     }
   };
 
+  // Later pages continue the query/sort the listing was loaded with, not whatever is typed in the box now.
+  const exploreSentinelRef = useRef(null);
+  const profileSentinelRef = useRef(null);
+  useLoadMoreOnScroll(exploreSentinelRef, exploreData.next_cursor, (cursor) => loadExplore(cursor, exploreData.query, exploreData.sort), route.page === 'explore');
+  useLoadMoreOnScroll(profileSentinelRef, profileData?.next_cursor, (cursor) => loadProfile(route.username, cursor, profileData.query, profileData.sort), route.page === 'profile');
+
   const setUserTrusted = async (username, trusted) => {
     try {
       const resp = await apiFetch(`/auth/users/${encodeURIComponent(username)}/trusted`, {
@@ -1297,7 +1309,7 @@ ${DEFAULT_MAP_CODE}
     setNewMapDialogChecking(true);
     setNewMapDialogError('');
     try {
-      const resp = await apiFetch(`/hub/map/${name}`);
+      const resp = await apiFetch(`/hub/map/${name}?include_content=false`);
       if (resp.ok) {
         setNewMapDialogError(`Map '${name}' already exists. Choose a different name.`);
         return;
@@ -1377,8 +1389,8 @@ ${DEFAULT_MAP_CODE}
   };
 
   useEffect(() => {
-    if (route.page === 'explore') { loadExplore(explorePage, exploreQuery, exploreSort); loadUsers(usersPage, usersQuery); }
-    if (route.page === 'profile') loadProfile(route.username, profilePage, profileSearch, profileSort);
+    if (route.page === 'explore') { loadExplore(null, exploreQuery, exploreSort); loadUsers(null, usersQuery); }
+    if (route.page === 'profile') loadProfile(route.username, null, profileSearch, profileSort);
     // Reset editor init key when leaving editor so re-entry always reloads draft
     if (route.page !== 'editor') { editorInitKeyRef.current = ''; setMapFeatured(false); return; }
     if (route.page === 'editor' && route.map) {
@@ -1417,7 +1429,7 @@ ${DEFAULT_MAP_CODE}
 
   useEffect(() => {
     if (route.page === 'explore' && currentUser.is_authenticated && authReady) {
-      loadProfile(normalizedHubUsername, 1, '');
+      loadProfile(normalizedHubUsername, null, '');
       loadUserDraftMeta();
     }
   // eslint-disable-next-line react-hooks/exhaustive-deps
@@ -1486,7 +1498,7 @@ ${DEFAULT_MAP_CODE}
       const data = await resp.json();
       if (!resp.ok) throw new Error(getApiErrorMessage(data, 'Failed to save profile'));
       await loadMe();
-      if (route.page === 'profile' && route.username) loadProfile(route.username, profilePage, profileSearch);
+      if (route.page === 'profile' && route.username) loadProfile(route.username, null, profileSearch);
       setStatusNotice('Profile saved');
       setTimeout(() => setStatusNotice(''), 1500);
     } catch (err) {
@@ -2126,6 +2138,7 @@ ${DEFAULT_MAP_CODE}
           const payload = {
             ...buildPickerRenderOptions(pickerOptions),
             basemaps: builderOptions.basemaps || [],
+            payload_encoding: 'binary',
           };
           const response = await fetch(`${API_BASE}/render/picker`, {
               method: 'POST',
@@ -2195,6 +2208,7 @@ ${DEFAULT_MAP_CODE}
             predefined_code: predefinedCode || '',
             basemaps: builderOptions.basemaps || [],
             hub_path: hubPath || undefined,
+            payload_encoding: 'binary',
           };
           if (!useDefaultSelection) {
             body.selected_names = selectedTerritoryNames;
@@ -2242,6 +2256,9 @@ ${DEFAULT_MAP_CODE}
         runtime_theme_code: rtcCode || undefined,
         runtime_predefined_code: rpcCode || undefined,
         runtime_code: rCode || undefined,
+        payload_encoding: 'binary',
+        progressive_geometry: true,
+        api_base_url: PUBLIC_API_BASE,
       };
       const response = await apiFetch(endpoint, {
         method: 'POST',
@@ -2254,8 +2271,8 @@ ${DEFAULT_MAP_CODE}
         setError(getApiErrorMessage(data, 'Failed to render map'));
         console.error(data.traceback);
       } else if (typeof data.html === 'string' && data.html) {
-        setMapHtml(injectThumbnailCapture(data.html));
-        setMapPayload(data.payload);
+        setMapHtml(injectGeometryBufferExport(injectThumbnailCapture(data.html)));
+        mapExportRef.current = { endpoint, body, payload: data.payload, detailUrl: data.geometry_detail_url };
       } else {
         setError('Render completed but returned no HTML.');
       }
@@ -2288,6 +2305,9 @@ ${DEFAULT_MAP_CODE}
             runtime_code: runtimeCode || undefined,
             runtime_theme_code: runtimeThemeCode || undefined,
             runtime_predefined_code: runtimePredefinedCode || undefined,
+            payload_encoding: 'binary',
+            progressive_geometry: true,
+            api_base_url: PUBLIC_API_BASE,
           }
         : {
             elements: builderElements,
@@ -2301,6 +2321,9 @@ ${DEFAULT_MAP_CODE}
             runtime_code: runtimeCode || undefined,
             runtime_theme_code: runtimeThemeCode || undefined,
             runtime_predefined_code: runtimePredefinedCode || undefined,
+            payload_encoding: 'binary',
+            progressive_geometry: true,
+            api_base_url: PUBLIC_API_BASE,
           };
 
       const response = await apiFetch(endpoint, {
@@ -2315,8 +2338,8 @@ ${DEFAULT_MAP_CODE}
         setError(getApiErrorMessage(data, 'Failed to render map'));
         console.error(data.traceback);
       } else if (typeof data.html === 'string' && data.html) {
-        setMapHtml(injectThumbnailCapture(data.html));
-        setMapPayload(data.payload);
+        setMapHtml(injectGeometryBufferExport(injectThumbnailCapture(data.html)));
+        mapExportRef.current = { endpoint, body, payload: data.payload, detailUrl: data.geometry_detail_url };
       } else {
         setError('Render completed but returned no HTML.');
       }
@@ -2375,6 +2398,40 @@ window.addEventListener('message', function(e) {
     return html.includes('</body>') ? html.replace('</body>', script + '</body>') : html + script;
   };
 
+  // Lets the editor read back the geometry buffer the preview decoded from its inline copy.
+  const injectGeometryBufferExport = (html) => {
+    const script = `<script>
+window.addEventListener('message', function(e) {
+  if (e.source !== parent) return;
+  if (!e.data || e.data.type !== 'xatra_request_geometry_buffer') return;
+  var targetOrigin = (e.origin && e.origin !== 'null') ? e.origin : '*';
+  var buffer = window.__xatraGeometryBuffer ? window.__xatraGeometryBuffer.slice(0) : null;
+  parent.postMessage({ type: 'xatra_geometry_buffer_response', buffer: buffer }, targetOrigin, buffer ? [buffer] : []);
+});<\/script>`;
+    return html.includes('</body>') ? html.replace('</body>', script + '</body>') : html + script;
+  };
+
+  const requestGeometryBufferFromIframe = async (iframe, timeoutMs = 3000) => {
+    if (!iframe?.contentWindow) return null;
+    return new Promise((resolve) => {
+      const handler = (event) => {
+        if (event.source !== iframe.contentWindow) return;
+        if (event.origin !== 'null' && event.origin !== window.location.origin) return;
+        if (event.data?.type === 'xatra_geometry_buffer_response') {
+          clearTimeout(timeout);
+          window.removeEventListener('message', handler);
+          resolve(event.data.buffer || null);
+        }
+      };
+      const timeout = setTimeout(() => {
+        window.removeEventListener('message', handler);
+        resolve(null);
+      }, timeoutMs);
+      window.addEventListener('message', handler);
+      iframe.contentWindow.postMessage({ type: 'xatra_request_geometry_buffer' }, '*');
+    });
+  };
+
   const requestThumbnailFromIframe = async (iframe, timeoutMs = 3000) => {
     if (!iframe?.contentWindow) return null;
     return new Promise((resolve) => {
@@ -2563,8 +2620,35 @@ window.addEventListener('message', function(e) {
     if (mapHtml) downloadFile(mapHtml, "map.html", "text/html");
   };
 
-  const handleExportJson = () => {
-    if (mapPayload) downloadFile(JSON.stringify(mapPayload, null, 2), "map.json", "application/json");
+  // Rebuild the full payload for export: the geometry buffer comes from the preview
+  // iframe (or the server), then held-back detail is fetched. If the server has
+  // already evicted either, render once more without progressive geometry.
+  const buildExportPayload = async () => {
+    const { endpoint, body, payload, detailUrl } = mapExportRef.current;
+    try {
+      const buffer = await requestGeometryBufferFromIframe(iframeRef.current);
+      const decoded = buffer ? decodeBinaryPayload(payload, buffer) : await fetchBinaryPayload(payload, API_BASE);
+      return await restoreFullGeometry(decoded, detailUrl || null, API_BASE);
+    } catch (err) {
+      const response = await apiFetch(endpoint, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ...body, payload_encoding: undefined, progressive_geometry: false }),
+      });
+      const data = await response.json();
+      if (!response.ok || data.error) throw new Error(getApiErrorMessage(data, err.message));
+      return data.payload;
+    }
+  };
+
+  const handleExportJson = async () => {
+    if (!mapExportRef.current) return;
+    try {
+      const payload = await buildExportPayload();
+      downloadFile(JSON.stringify(payload, null, 2), "map.json", "application/json");
+    } catch (err) {
+      setError(`Export JSON failed: ${err.message}`);
+    }
   };
 
   const handleSaveProject = async () => {
@@ -2677,7 +2761,7 @@ window.addEventListener('message', function(e) {
       // (i.e. route.map is set — an existing map was loaded — but mapName was changed to something different)
       const isRename = !!(route.map && route.map !== normalizedMapName);
       if (isRename) {
-        const check = await apiFetch(`/hub/map/${normalizedMapName}`);
+        const check = await apiFetch(`/hub/map/${normalizedMapName}?include_content=false`);
         if (check.ok) {
           setAutoSaveStatus('conflict');
           return;
@@ -2800,7 +2884,7 @@ window.addEventListener('message', function(e) {
         return;
       }
       await ensureLatestThumbnail();
-      const check = await apiFetch(`/hub/map/${targetName}`);
+      const check = await apiFetch(`/hub/map/${targetName}?include_content=false`);
       const exists = check.ok;
       const isSameCurrent = !!(mapOwner === normalizedHubUsername && route.map === targetName);
       if (exists && !isSameCurrent) {
@@ -2845,7 +2929,7 @@ window.addEventListener('message', function(e) {
     const forkSourceOwner = mapOwner;
     const forkSourceMap = route.map;
     try {
-      const checkResp = await apiFetch(`/hub/map/${name}`);
+      const checkResp = await apiFetch(`/hub/map/${name}?include_content=false`);
       if (checkResp.ok) {
         setForkDialogError(`Map '${name}' already exists. Choose a different name.`);
         return;
@@ -2880,7 +2964,7 @@ window.addEventListener('message', function(e) {
       // Navigate to profile and reload map list (navigateTo is a no-op if already on profile page,
       // so always call loadProfile explicitly to ensure the map disappears from the grid)
       navigateTo(`/user/${normalizedHubUsername}`);
-      loadProfile(normalizedHubUsername, profilePage, profileSearch);
+      loadProfile(normalizedHubUsername, null, profileSearch);
     } catch (err) {
       setDisassociateConfirm((p) => ({ ...p, loading: false, error: err.message }));
     }
@@ -3811,7 +3895,7 @@ window.addEventListener('message', function(e) {
           <Star size={12} className={item.featured ? 'text-amber-500 fill-amber-500' : (isDarkMode ? 'text-slate-400' : 'text-gray-400')} />
         </button>
       )}
-      <img src={item.thumbnail || '/vite.svg'} alt="" className={`w-full h-28 object-cover ${isDarkMode ? 'bg-slate-700' : 'bg-gray-100'}`} />
+      <img src={thumbnailSrc(item.thumbnail)} alt="" className={`w-full h-28 object-cover ${isDarkMode ? 'bg-slate-700' : 'bg-gray-100'}`} />
       <div className="p-3">
         <div className={`font-mono text-xs font-medium group-hover:text-blue-500 transition-colors ${isDarkMode ? 'text-slate-200' : 'text-slate-800'}`}>{item.name}</div>
         <div className={`text-[10px] mt-0.5 truncate inline-flex items-center gap-1 ${isDarkMode ? 'text-slate-400' : 'text-gray-500'}`}>
@@ -3878,7 +3962,7 @@ window.addEventListener('message', function(e) {
           }
         }}
       >
-        <img src={item.thumbnail || '/vite.svg'} alt="" className="w-full h-20 object-cover bg-gray-100 rounded-t" />
+        <img src={thumbnailSrc(item.thumbnail)} alt="" className="w-full h-20 object-cover bg-gray-100 rounded-t" />
         <div className="p-2">
           <div className="flex items-center justify-between gap-2">
             <a href={item.slug || `/${item.name}`} target="_blank" rel="noreferrer" className="font-mono text-[11px] text-blue-700 hover:underline">{item.name}</a>
@@ -4529,8 +4613,6 @@ window.addEventListener('message', function(e) {
   );
 
   if (route.page === 'explore') {
-    const totalPages = Math.max(1, Math.ceil((exploreData.total || 0) / (exploreData.per_page || 12)));
-    const usersTotalPages = Math.max(1, Math.ceil((usersData.total || 0) / (usersData.per_page || 20)));
     return (
       <>
       <div className={`h-screen w-full flex flex-col ${isDarkMode ? 'theme-dark bg-slate-950 text-slate-100' : 'bg-gray-50'}`}>
@@ -4581,7 +4663,7 @@ window.addEventListener('message', function(e) {
                         </button>
                       )}
                       <a href={item.slug || `/${item.name}`} className="block h-full">
-                        <img src={item.thumbnail || '/vite.svg'} alt="" className={`w-full h-16 object-cover ${isDarkMode ? 'bg-slate-700' : 'bg-gray-100'}`} />
+                        <img src={thumbnailSrc(item.thumbnail)} alt="" className={`w-full h-16 object-cover ${isDarkMode ? 'bg-slate-700' : 'bg-gray-100'}`} />
                         <div className="px-2 py-1">
                           <div className={`font-mono text-[11px] font-medium truncate group-hover:text-blue-500 transition-colors ${isDarkMode ? 'text-slate-200' : 'text-slate-800'}`}>{item.name}</div>
                         </div>
@@ -4602,24 +4684,22 @@ window.addEventListener('message', function(e) {
             )}
             {exploreLoading && <div className={`mb-4 text-xs px-3 py-2 border rounded-lg ${isDarkMode ? 'bg-blue-900/20 text-blue-300 border-blue-700' : 'bg-blue-50 text-blue-700 border-blue-200'}`}>Loading maps…</div>}
             <div className="flex gap-2 mb-5">
-              <input value={exploreQuery} onChange={(e) => setExploreQuery(e.target.value)} onKeyDown={(e) => { if (e.key === 'Enter') { setExplorePage(1); loadExplore(1, exploreQuery, exploreSort); } }} placeholder='Search maps, e.g. "indica user:srajma"' className={`flex-1 rounded-lg border px-3 py-2 text-sm focus:outline-none focus:ring-2 focus:ring-blue-300 ${isDarkMode ? 'bg-slate-800 border-slate-600 text-white placeholder-slate-500 focus:border-blue-400' : 'bg-white border-gray-300 focus:border-blue-400'}`} />
+              <input value={exploreQuery} onChange={(e) => setExploreQuery(e.target.value)} onKeyDown={(e) => { if (e.key === 'Enter') loadExplore(null, exploreQuery, exploreSort); }} placeholder='Search maps, e.g. "indica user:srajma"' className={`flex-1 rounded-lg border px-3 py-2 text-sm focus:outline-none focus:ring-2 focus:ring-blue-300 ${isDarkMode ? 'bg-slate-800 border-slate-600 text-white placeholder-slate-500 focus:border-blue-400' : 'bg-white border-gray-300 focus:border-blue-400'}`} />
               <select
                 value={exploreSort}
-                onChange={(e) => { const next = e.target.value; setExploreSort(next); setExplorePage(1); loadExplore(1, exploreQuery, next); }}
+                onChange={(e) => { const next = e.target.value; setExploreSort(next); loadExplore(null, exploreQuery, next); }}
                 className={`rounded-lg border px-2 py-2 text-sm ${isDarkMode ? 'bg-slate-800 border-slate-600 text-white' : 'bg-white border-gray-300 text-gray-700'}`}
                 title="Sort maps"
               >
                 {MAP_SORT_OPTIONS.map((opt) => <option key={opt.value} value={opt.value}>{opt.label}</option>)}
               </select>
-              <button className="px-4 py-2 bg-blue-600 text-white rounded-lg text-sm hover:bg-blue-700 transition-colors" onClick={() => { setExplorePage(1); loadExplore(1, exploreQuery, exploreSort); }}>Search</button>
+              <button className="px-4 py-2 bg-blue-600 text-white rounded-lg text-sm hover:bg-blue-700 transition-colors" onClick={() => loadExplore(null, exploreQuery, exploreSort)}>Search</button>
             </div>
             <div className="grid grid-cols-2 md:grid-cols-3 lg:grid-cols-4 xl:grid-cols-5 gap-3">
               {(exploreData.items || []).map((item) => renderExploreCatalogCard(item))}
             </div>
-            <div className={`flex items-center gap-3 mt-5 ${isDarkMode ? 'text-slate-400' : 'text-gray-500'}`}>
-              <button disabled={explorePage <= 1} className={`px-3 py-1.5 rounded-lg border text-xs disabled:opacity-40 transition-colors ${isDarkMode ? 'border-slate-700 hover:bg-slate-800' : 'border-gray-300 hover:bg-gray-100'}`} onClick={() => { const p = Math.max(1, explorePage - 1); setExplorePage(p); loadExplore(p, exploreQuery, exploreSort); }}>← Prev</button>
-              <span className="text-xs">Page {explorePage} / {totalPages}</span>
-              <button disabled={explorePage >= totalPages} className={`px-3 py-1.5 rounded-lg border text-xs disabled:opacity-40 transition-colors ${isDarkMode ? 'border-slate-700 hover:bg-slate-800' : 'border-gray-300 hover:bg-gray-100'}`} onClick={() => { const p = Math.min(totalPages, explorePage + 1); setExplorePage(p); loadExplore(p, exploreQuery, exploreSort); }}>Next →</button>
+            <div ref={exploreSentinelRef} className={`mt-5 text-xs ${isDarkMode ? 'text-slate-400' : 'text-gray-500'}`}>
+              {exploreLoading ? 'Loading…' : `${(exploreData.items || []).length} of ${exploreData.total || 0} maps`}
             </div>
           </div>
           {/* Users sidebar */}
@@ -4627,8 +4707,8 @@ window.addEventListener('message', function(e) {
             <div className={`text-xs font-semibold mb-3 ${isDarkMode ? 'text-slate-400' : 'text-gray-500'}`}>Users</div>
             {usersLoading && <div className={`mb-3 text-xs px-2 py-1 border rounded ${isDarkMode ? 'bg-blue-900/20 text-blue-300 border-blue-700' : 'bg-blue-50 text-blue-700 border-blue-200'}`}>Loading…</div>}
             <div className={`flex gap-1.5 mb-3`}>
-              <input value={usersQuery} onChange={(e) => setUsersQuery(e.target.value)} onKeyDown={(e) => { if (e.key === 'Enter') { setUsersPage(1); loadUsers(1, usersQuery); } }} placeholder="Search users…" className={`flex-1 rounded-lg border px-2 py-1.5 text-xs focus:outline-none focus:ring-2 focus:ring-blue-300 ${isDarkMode ? 'bg-slate-800 border-slate-600 text-white placeholder-slate-500 focus:border-blue-400' : 'bg-white border-gray-300 focus:border-blue-400'}`} />
-              <button className="px-2 py-1.5 bg-blue-600 text-white rounded-lg text-xs hover:bg-blue-700 transition-colors" onClick={() => { setUsersPage(1); loadUsers(1, usersQuery); }}>Go</button>
+              <input value={usersQuery} onChange={(e) => setUsersQuery(e.target.value)} onKeyDown={(e) => { if (e.key === 'Enter') loadUsers(null, usersQuery); }} placeholder="Search users…" className={`flex-1 rounded-lg border px-2 py-1.5 text-xs focus:outline-none focus:ring-2 focus:ring-blue-300 ${isDarkMode ? 'bg-slate-800 border-slate-600 text-white placeholder-slate-500 focus:border-blue-400' : 'bg-white border-gray-300 focus:border-blue-400'}`} />
+              <button className="px-2 py-1.5 bg-blue-600 text-white rounded-lg text-xs hover:bg-blue-700 transition-colors" onClick={() => loadUsers(null, usersQuery)}>Go</button>
             </div>
             <div className="space-y-1.5">
               {(usersData.items || []).map((u) => (
@@ -4660,11 +4740,10 @@ window.addEventListener('message', function(e) {
                 </div>
               ))}
             </div>
-            {usersTotalPages > 1 && (
+            {usersData.next_cursor && (
               <div className={`flex items-center gap-2 mt-4 ${isDarkMode ? 'text-slate-400' : 'text-gray-500'}`}>
-                <button disabled={usersPage <= 1} className={`px-2 py-1 rounded border text-[11px] disabled:opacity-40 ${isDarkMode ? 'border-slate-700 hover:bg-slate-800' : 'border-gray-300 hover:bg-gray-100'}`} onClick={() => { const p = Math.max(1, usersPage - 1); setUsersPage(p); loadUsers(p, usersQuery); }}>←</button>
-                <span className="text-[11px]">{usersPage}/{usersTotalPages}</span>
-                <button disabled={usersPage >= usersTotalPages} className={`px-2 py-1 rounded border text-[11px] disabled:opacity-40 ${isDarkMode ? 'border-slate-700 hover:bg-slate-800' : 'border-gray-300 hover:bg-gray-100'}`} onClick={() => { const p = Math.min(usersTotalPages, usersPage + 1); setUsersPage(p); loadUsers(p, usersQuery); }}>→</button>
+                <button disabled={usersLoading} className={`px-2 py-1 rounded border text-[11px] disabled:opacity-40 ${isDarkMode ? 'border-slate-700 hover:bg-slate-800' : 'border-gray-300 hover:bg-gray-100'}`} onClick={() => loadUsers(usersData.next_cursor, usersData.query)}>More</button>
+                <span className="text-[11px]">{(usersData.items || []).length}/{usersData.total || 0}</span>
               </div>
             )}
           </div>
@@ -4678,7 +4757,6 @@ window.addEventListener('message', function(e) {
   if (route.page === 'profile') {
     const profile = profileData?.profile;
     const maps = profileData?.maps || [];
-    const totalPages = Math.max(1, Math.ceil((profileData?.total || 0) / (profileData?.per_page || 12)));
     const viewingOwnProfilePath = route.username && route.username === normalizedHubUsername;
     if (viewingOwnProfilePath && !authReady) {
       return (
@@ -4761,16 +4839,16 @@ window.addEventListener('message', function(e) {
           <div className="flex-1 overflow-y-auto px-6 py-5">
             {profileLoading && <div className={`mb-4 text-xs px-3 py-2 border rounded-lg ${isDarkMode ? 'bg-blue-900/20 text-blue-300 border-blue-700' : 'bg-blue-50 text-blue-700 border-blue-200'}`}>Loading maps…</div>}
             <div className="flex gap-2 mb-5">
-              <input value={profileSearch} onChange={(e) => setProfileSearch(e.target.value)} onKeyDown={(e) => { if (e.key === 'Enter') { setProfilePage(1); loadProfile(route.username, 1, profileSearch, profileSort); } }} className={`flex-1 rounded-lg border px-3 py-2 text-sm focus:outline-none focus:ring-2 focus:ring-blue-300 ${isDarkMode ? 'bg-slate-800 border-slate-600 text-white placeholder-slate-500 focus:border-blue-400' : 'bg-white border-gray-300 focus:border-blue-400'}`} placeholder="Search maps…" />
+              <input value={profileSearch} onChange={(e) => setProfileSearch(e.target.value)} onKeyDown={(e) => { if (e.key === 'Enter') loadProfile(route.username, null, profileSearch, profileSort); }} className={`flex-1 rounded-lg border px-3 py-2 text-sm focus:outline-none focus:ring-2 focus:ring-blue-300 ${isDarkMode ? 'bg-slate-800 border-slate-600 text-white placeholder-slate-500 focus:border-blue-400' : 'bg-white border-gray-300 focus:border-blue-400'}`} placeholder="Search maps…" />
               <select
                 value={profileSort}
-                onChange={(e) => { const next = e.target.value; setProfileSort(next); setProfilePage(1); loadProfile(route.username, 1, profileSearch, next); }}
+                onChange={(e) => { const next = e.target.value; setProfileSort(next); loadProfile(route.username, null, profileSearch, next); }}
                 className={`rounded-lg border px-2 py-2 text-sm ${isDarkMode ? 'bg-slate-800 border-slate-600 text-white' : 'bg-white border-gray-300 text-gray-700'}`}
                 title="Sort maps"
               >
                 {MAP_SORT_OPTIONS.map((opt) => <option key={opt.value} value={opt.value}>{opt.label}</option>)}
               </select>
-              <button className="px-4 py-2 bg-blue-600 text-white rounded-lg text-sm hover:bg-blue-700 transition-colors" onClick={() => { setProfilePage(1); loadProfile(route.username, 1, profileSearch, profileSort); }}>Search</button>
+              <button className="px-4 py-2 bg-blue-600 text-white rounded-lg text-sm hover:bg-blue-700 transition-colors" onClick={() => loadProfile(route.username, null, profileSearch, profileSort)}>Search</button>
             </div>
             {maps.length === 0 && !profileLoading && !isOwn && (
               <div className={`text-sm text-center py-12 ${isDarkMode ? 'text-slate-500' : 'text-gray-400'}`}>No maps yet.</div>
@@ -4807,7 +4885,7 @@ window.addEventListener('message', function(e) {
                     </button>
                   )}
                   <a href={m.slug} className="block">
-                    <img src={m.thumbnail || '/vite.svg'} alt="" className={`w-full h-28 object-cover ${isDarkMode ? 'bg-slate-700' : 'bg-gray-100'}`} />
+                    <img src={thumbnailSrc(m.thumbnail)} alt="" className={`w-full h-28 object-cover ${isDarkMode ? 'bg-slate-700' : 'bg-gray-100'}`} />
                     <div className="p-3">
                       <div className={`font-mono text-xs font-medium truncate group-hover:text-blue-500 transition-colors ${isDarkMode ? 'text-slate-200' : 'text-slate-800'}`}>{m.name}</div>
                       <div className={`mt-0.5 inline-flex items-center gap-1 text-[10px] ${isDarkMode ? 'text-slate-500' : 'text-gray-500'}`}>
@@ -4836,13 +4914,9 @@ window.addEventListener('message', function(e) {
                 </div>
               ))}
             </div>
-            {totalPages > 1 && (
-              <div className={`flex items-center gap-3 mt-6 ${isDarkMode ? 'text-slate-400' : 'text-gray-500'}`}>
-                <button disabled={profilePage <= 1} className={`px-3 py-1.5 rounded-lg border text-xs disabled:opacity-40 transition-colors ${isDarkMode ? 'border-slate-700 hover:bg-slate-800' : 'border-gray-300 hover:bg-gray-100'}`} onClick={() => { const p = Math.max(1, profilePage - 1); setProfilePage(p); loadProfile(route.username, p, profileSearch, profileSort); }}>← Prev</button>
-                <span className="text-xs">Page {profilePage} / {totalPages}</span>
-                <button disabled={profilePage >= totalPages} className={`px-3 py-1.5 rounded-lg border text-xs disabled:opacity-40 transition-colors ${isDarkMode ? 'border-slate-700 hover:bg-slate-800' : 'border-gray-300 hover:bg-gray-100'}`} onClick={() => { const p = Math.min(totalPages, profilePage + 1); setProfilePage(p); loadProfile(route.username, p, profileSearch, profileSort); }}>Next →</button>
-              </div>
-            )}
+            <div ref={profileSentinelRef} className={`mt-6 text-xs ${isDarkMode ? 'text-slate-400' : 'text-gray-500'}`}>
+              {profileLoading && maps.length > 0 ? 'Loading…' : ''}
+            </div>
           </div>
         </div>
       </div>
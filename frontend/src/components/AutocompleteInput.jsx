@@ -2,6 +2,7 @@ import React, { useState, useEffect, useRef } from 'react';
 import { Code2 } from 'lucide-react';
 import { isPythonValue, toPythonValue, getPythonExpr, toTextValue } from '../utils/pythonValue';
 import { API_BASE } from '../config';
+import { searchEndpoint } from '../utils/staticSearch';
 
 const AutocompleteInput = ({
   value,
@@ -45,8 +46,7 @@ const AutocompleteInput = ({
     }
     setLoading(true);
     try {
-      const res = await fetch(`${endpoint}?q=${encodeURIComponent(query)}`);
-      const data = await res.json();
+      const data = await searchEndpoint(endpoint, query);
       setSuggestions(data);
       setShowSuggestions(true);
       setActiveIndex(data.length > 0 ? 0 : -1);
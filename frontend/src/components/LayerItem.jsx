@@ -441,6 +441,17 @@ const LayerItem = ({
                 className="w-full px-2 py-1.5 border border-gray-200 rounded text-sm focus:border-blue-500 outline-none"
               />
             </div>
+            <div className="col-span-2">
+              <label className="flex items-center gap-2 text-xs text-gray-700 cursor-pointer select-none" title="Load borders as map tiles instead of embedding every polygon">
+                <input
+                  type="checkbox"
+                  checked={element.args?.tiles || false}
+                  onChange={(e) => updateArg(index, 'tiles', e.target.checked)}
+                  className="rounded border-gray-300 text-blue-600 focus:ring-blue-500"
+                />
+                Stream as tiles
+              </label>
+            </div>
           </div>
         );
       case 'admin_rivers':
@@ -1,6 +1,9 @@
 import React, { useState, useEffect, useMemo, useRef } from 'react';
 import { Plus, Trash2, MousePointer2, GripVertical, X } from 'lucide-react';
 import { API_BASE } from '../config';
+import { resolveGadmGids } from '../utils/gadmNames';
+import { fuzzyRank } from '../utils/fuzzyMatch';
+import { searchEndpoint } from '../utils/staticSearch';
 
 const DRAG_PATH_MIME = 'application/x-xatra-territory-path';
 const TERRITORY_TYPES = ['gadm', 'polygon', 'predefined', 'group'];
@@ -151,8 +154,10 @@ const TokenInput = ({
   endpoint,
   localOptions,
   inputPath,
+  resolveNames = false,
 }) => {
   const [text, setText] = useState('');
+  const [tokenNames, setTokenNames] = useState({});
   const [suggestions, setSuggestions] = useState([]);
   const [showSuggestions, setShowSuggestions] = useState(false);
   const [activeIndex, setActiveIndex] = useState(-1);
@@ -171,6 +176,18 @@ const TokenInput = ({
 
   const tokenSet = useMemo(() => new Set(tokens.map((x) => String(x))), [tokens]);
 
+  const tokenKey = tokens.join('\n');
+  useEffect(() => {
+    if (!resolveNames || tokens.length === 0) return undefined;
+    let cancelled = false;
+    resolveGadmGids(tokens).then((records) => {
+      if (cancelled) return;
+      setTokenNames(Object.fromEntries(Object.entries(records).filter(([, r]) => r?.name).map(([gid, r]) => [gid, r.name])));
+    });
+    return () => { cancelled = true; };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [resolveNames, tokenKey]);
+
   const loadSuggestions = async (query) => {
     const q = String(query || '').trim();
     if (!q) {
@@ -179,10 +196,7 @@ const TokenInput = ({
       return;
     }
     if (mode === 'local') {
-      const filtered = (localOptions || [])
-        .filter((item) => item.toLowerCase().includes(q.toLowerCase()))
-        .filter((item) => !tokenSet.has(item))
-        .slice(0, 20)
+      const filtered = fuzzyRank((localOptions || []).filter((item) => !tokenSet.has(item)), q, 20)
         .map((name) => ({ value: name, label: name }));
       setSuggestions(filtered);
       setShowSuggestions(filtered.length > 0);
@@ -196,8 +210,7 @@ const TokenInput = ({
       return;
     }
     try {
-      const res = await fetch(`${endpoint}?q=${encodeURIComponent(q)}`);
-      const data = await res.json();
+      const data = await searchEndpoint(endpoint, q);
       const filtered = (Array.isArray(data) ? data : [])
         .map((item) => ({
           value: item.gid || item.country_code || item.country || '',
@@ -263,8 +276,9 @@ const TokenInput = ({
     <div className="relative" ref={wrapperRef}>
       <div className="w-full text-xs p-1 border rounded bg-white min-h-[30px] flex flex-wrap gap-1 items-center">
         {tokens.map((token) => (
-          <span key={token} className="inline-flex items-center gap-1 px-1.5 py-0.5 rounded bg-blue-50 border border-blue-200 text-blue-700 font-mono">
+          <span key={token} title={tokenNames[token] || undefined} className="inline-flex items-center gap-1 px-1.5 py-0.5 rounded bg-blue-50 border border-blue-200 text-blue-700 font-mono">
             {token}
+            {tokenNames[token] && <span className="font-sans text-blue-500">{tokenNames[token]}</span>}
             <button
               type="button"
               className="text-blue-700 hover:text-blue-900"
@@ -1100,6 +1114,7 @@ const TerritoryBuilder = ({
                         mode="remote"
                         endpoint={`${API_BASE}/search/gadm`}
                         inputPath={rowPathId}
+                        resolveNames
                       />
                     </div>
                     <button
@@ -4,3 +4,8 @@ const runtimeProto = (typeof window !== 'undefined' && window.location?.protocol
 const runtimePort = import.meta.env.VITE_API_PORT || '8088';
 
 export const API_BASE = configured || `${runtimeProto}//${runtimeHost}:${runtimePort}`;
+
+// Absolute form of API_BASE; sent with renders so the HTML they return fetches tiles from the right place.
+export const PUBLIC_API_BASE = (typeof window !== 'undefined'
+  ? new URL(API_BASE, window.location.href).href
+  : API_BASE).replace(/\/$/, '');
@@ -0,0 +1,34 @@
+// Decoder for render payloads returned with payload_encoding: 'binary'.
+// The JSON manifest keeps the non-coordinate payload; arcs live in one packed
+// little-endian buffer served from manifest.buffer as application/octet-stream.
+import { decodeTopoPayload } from './topoPayload';
+
+export const isBinaryPayload = (value) => (
+  !!value && typeof value === 'object' && value.type === 'xatra-binary'
+);
+
+export const decodeBinaryPayload = (manifest, arrayBuffer) => {
+  if (!isBinaryPayload(manifest)) return manifest;
+  const view = new DataView(arrayBuffer);
+  const readInt32 = ({ offset, length }) => {
+    const out = new Int32Array(length);
+    for (let i = 0; i < length; i += 1) out[i] = view.getInt32(offset + i * 4, true);
+    return out;
+  };
+  const offsets = readInt32(manifest.buffers.arc_offsets);
+  const coords = readInt32(manifest.buffers.arc_coords);
+  const arcs = Array.from(offsets, (start, a) => {
+    const end = a + 1 < offsets.length ? offsets[a + 1] : coords.length / 2;
+    const arc = [];
+    for (let p = start; p < end; p += 1) arc.push([coords[2 * p], coords[2 * p + 1]]);
+    return arc;
+  });
+  return decodeTopoPayload({ type: 'xatra-topology', transform: manifest.transform, arcs, payload: manifest.payload });
+};
+
+export const fetchBinaryPayload = async (manifest, apiBase) => {
+  if (!isBinaryPayload(manifest)) return decodeTopoPayload(manifest);
+  const res = await fetch(`${apiBase}${manifest.buffer}`);
+  if (!res.ok) throw new Error(`Geometry buffer unavailable (${res.status}); re-render the map.`);
+  return decodeBinaryPayload(manifest, await res.arrayBuffer());
+};
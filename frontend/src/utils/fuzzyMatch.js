@@ -0,0 +1,65 @@
+// Diacritic-folding, typo-tolerant ranking for small local option lists
+// (territory library and hub lib names). Mirrors the server's GADM search:
+// exact, prefix and substring matches first, then names within a bounded
+// edit distance (1 edit for 4-7 characters, 2 from 8).
+
+export const foldText = (text) => String(text || '')
+  .normalize('NFKD')
+  .replace(/\p{M}/gu, '')
+  .toLowerCase();
+
+const maxDistance = (word) => (word.length < 4 ? 0 : word.length < 8 ? 1 : 2);
+
+// Optimal string alignment distance, or maxDist + 1 once it is exceeded.
+export const editDistance = (a, b, maxDist) => {
+  if (Math.abs(a.length - b.length) > maxDist) return maxDist + 1;
+  let prev2 = [];
+  let prev = Array.from({ length: b.length + 1 }, (_, j) => j);
+  for (let i = 1; i <= a.length; i += 1) {
+    const cur = [i];
+    for (let j = 1; j <= b.length; j += 1) {
+      let v = Math.min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (a[i - 1] === b[j - 1] ? 0 : 1));
+      if (i > 1 && j > 1 && a[i - 1] === b[j - 2] && a[i - 2] === b[j - 1]) v = Math.min(v, prev2[j - 2] + 1);
+      cur.push(v);
+    }
+    if (Math.min(...cur) > maxDist && Math.min(...prev) > maxDist) return maxDist + 1;
+    prev2 = prev;
+    prev = cur;
+  }
+  return Math.min(prev[b.length], maxDist + 1);
+};
+
+const wordsOf = (text) => text.split(/[^\p{L}\p{N}]+/u).filter(Boolean);
+
+const score = (option, q, qWords) => {
+  const name = foldText(option);
+  if (name === q) return 100;
+  if (name.startsWith(q)) return 70;
+  if (name.includes(q)) return 50;
+  // Dotted hub names (alias.NAME) and snake_case names match word by word.
+  const words = wordsOf(name.replace(/_/g, ' '));
+  let total = 0;
+  for (const qWord of qWords) {
+    const limit = maxDistance(qWord);
+    let best = limit + 1;
+    for (const word of words) {
+      best = Math.min(best, word.startsWith(qWord) ? 0 : editDistance(qWord, word, limit));
+      if (best === 0) break;
+    }
+    if (best > limit) return 0;
+    total += best;
+  }
+  return Math.max(20 - 5 * total, 1);
+};
+
+export const fuzzyRank = (options, query, limit = 20) => {
+  const q = foldText(query).trim();
+  if (!q) return [];
+  const qWords = wordsOf(q);
+  return (options || [])
+    .map((option, i) => ({ option, i, s: score(option, q, qWords) }))
+    .filter((x) => x.s > 0)
+    .sort((a, b) => b.s - a.s || a.option.length - b.option.length || a.i - b.i)
+    .slice(0, limit)
+    .map((x) => x.option);
+};
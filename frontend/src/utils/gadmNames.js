@@ -0,0 +1,48 @@
+// Batched GID -> GADM record lookups against POST /gadm/resolve.
+// Lookups issued in the same tick share one request; results (misses included)
+// are cached for the session so token lists only ask for gids they haven't seen.
+import { API_BASE } from '../config';
+
+const cache = new Map();
+let queued = null;
+
+const flush = async (batch) => {
+  const gids = [...batch.keys()];
+  let records = {};
+  try {
+    const res = await fetch(`${API_BASE}/gadm/resolve`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ gids }),
+    });
+    // 503 while the index builds: leave the gids uncached so a later render retries.
+    if (res.ok) records = await res.json();
+  } catch {
+    records = {};
+  }
+  gids.forEach((gid) => {
+    if (gid in records) cache.set(gid, records[gid]);
+    batch.get(gid).forEach((resolve) => resolve(records[gid] ?? null));
+  });
+};
+
+const lookup = (gid) => new Promise((resolve) => {
+  if (!queued) {
+    queued = new Map();
+    const batch = queued;
+    Promise.resolve().then(() => {
+      queued = null;
+      flush(batch);
+    });
+  }
+  if (!queued.has(gid)) queued.set(gid, []);
+  queued.get(gid).push(resolve);
+});
+
+export const cachedGadmRecord = (gid) => cache.get(gid);
+
+export const resolveGadmGids = async (gids) => {
+  const wanted = [...new Set(gids.map((g) => String(g || '').trim()).filter((g) => g && !g.includes('*')))];
+  const entries = await Promise.all(wanted.map(async (gid) => [gid, cache.has(gid) ? cache.get(gid) : await lookup(gid)]));
+  return Object.fromEntries(entries);
+};
@@ -0,0 +1,30 @@
+// Infinite scroll for the cursor-paginated hub listings (/explore, /users/<name>):
+// asks for the page after `nextCursor` once the sentinel element comes within
+// 400px of the visible area. Each cursor is requested once; the response's
+// next_cursor re-arms the observer, so a tall viewport keeps filling itself.
+import { useEffect, useRef } from 'react';
+
+export const useLoadMoreOnScroll = (sentinelRef, nextCursor, loadMore, active = true) => {
+  const loadMoreRef = useRef(loadMore);
+  loadMoreRef.current = loadMore;
+  useEffect(() => {
+    const el = sentinelRef.current;
+    if (!active || !el || !nextCursor) return undefined;
+    let requested = false;
+    const observer = new IntersectionObserver((entries) => {
+      if (requested || !entries.some((entry) => entry.isIntersecting)) return;
+      requested = true;
+      loadMoreRef.current(nextCursor);
+    }, { rootMargin: '400px' });
+    observer.observe(el);
+    return () => observer.disconnect();
+  }, [sentinelRef, nextCursor, active]);
+};
+
+// Merges a listing response into the state it continues: a first page (no cursor)
+// replaces it, a later page is appended unless a newer search has replaced the list.
+export const mergeListingPage = (prev, data, cursor, key = 'items') => {
+  if (!cursor) return data;
+  if (prev?.next_cursor !== cursor) return prev;
+  return { ...data, [key]: [...(prev[key] || []), ...(data[key] || [])] };
+};
@@ -0,0 +1,20 @@
+// Render payloads requested with progressive_geometry: true ship simplified
+// geometry for features outside the initial viewport, tagged with
+// `_xatra_geom`. The full versions are served from the render's detail URL.
+
+export const restoreFullGeometry = async (payload, detailUrl, apiBase) => {
+  if (!detailUrl || !payload) return payload;
+  const res = await fetch(`${apiBase}${detailUrl}`);
+  if (!res.ok) throw new Error(`Full-detail geometry unavailable (${res.status}); re-render the map.`);
+  const { geometries = {} } = await res.json();
+  const walk = (value) => {
+    if (Array.isArray(value)) return value.map(walk);
+    if (!value || typeof value !== 'object') return value;
+    if (value._xatra_geom != null) {
+      const { _xatra_geom: id, ...rest } = value;
+      return geometries[id] ? { ...rest, coordinates: geometries[id].coordinates } : rest;
+    }
+    return Object.fromEntries(Object.entries(value).map(([k, v]) => [k, walk(v)]));
+  };
+  return walk(payload);
+};
@@ -0,0 +1,109 @@
+// Autocomplete from the static search shards exported by the backend
+// (/search/static/<version>/...). A shard holds every GADM entry whose folded
+// gid or name starts with its two-character prefix, so the exact and prefix
+// tiers of /search/gadm can be answered from cacheable files; queries those
+// tiers can't fill fall back to the live endpoint for substring/fuzzy matches.
+import { API_BASE } from '../config';
+import { foldText } from './fuzzyMatch';
+
+const GADM_ENDPOINT = `${API_BASE}/search/gadm`;
+const COUNTRIES_ENDPOINT = `${API_BASE}/search/countries`;
+
+let manifestPromise = null;
+const shardPromises = new Map();
+
+const fetchJson = async (url) => {
+  const res = await fetch(url);
+  if (!res.ok) throw new Error(`${url}: ${res.status}`);
+  return res.json();
+};
+
+const loadManifest = () => {
+  if (!manifestPromise) {
+    manifestPromise = fetchJson(`${API_BASE}/search/static/manifest.json`).catch(() => {
+      // Not exported yet (index still building): try again on a later keystroke.
+      manifestPromise = null;
+      return null;
+    });
+  }
+  return manifestPromise;
+};
+
+const shardName = (prefix) => `${[...prefix].map((ch) => ch.codePointAt(0).toString(16)).join('-')}.json`;
+
+const loadShard = (manifest, name) => {
+  const url = `${API_BASE}/search/static/${manifest.version}/${name}`;
+  if (!shardPromises.has(url)) {
+    shardPromises.set(url, fetchJson(url).catch((err) => {
+      shardPromises.delete(url);
+      throw err;
+    }));
+  }
+  return shardPromises.get(url);
+};
+
+// Same rule order as the server: gid ==, gid prefix, name ==, name prefix.
+const prefixScore = (gid, name, q) => {
+  if (gid === q) return 100;
+  if (gid.startsWith(q)) return 80;
+  if (name === q) return 90;
+  if (name.startsWith(q)) return 70;
+  return 0;
+};
+
+const staticGadmSearch = async (q) => {
+  const manifest = await loadManifest();
+  if (!manifest) return null;
+  const prefix = [...q].slice(0, manifest.prefix_chars).join('');
+  if ([...prefix].length < manifest.prefix_chars) return null;
+  const name = shardName(prefix);
+  // Every entry matching a prefix tier lives in the shard, so a missing shard means no such entries.
+  const rows = manifest.shards.includes(name) ? await loadShard(manifest, name) : [];
+  const hits = [];
+  rows.forEach(([gid, entryName, record], i) => {
+    const score = prefixScore(gid, entryName, q);
+    if (score) hits.push({ score, len: gid.length, i, record });
+  });
+  // Anything fewer than a full page may be topped up by substring/fuzzy tiers on the server.
+  if (hits.length < manifest.limit) return null;
+  hits.sort((a, b) => b.score - a.score || a.len - b.len || a.i - b.i);
+  return hits.slice(0, manifest.limit).map((hit) => hit.record);
+};
+
+const staticCountrySearch = async (query) => {
+  const manifest = await loadManifest();
+  if (!manifest) return null;
+  const countries = await loadShard(manifest, 'countries.json');
+  const q = String(query || '').toLowerCase().trim();
+  if (!q) return countries.slice(0, 20);
+  const score = (item) => {
+    const code = item.country_code.toLowerCase();
+    const name = item.country.toLowerCase();
+    if (code === q) return 100;
+    if (code.startsWith(q)) return 90;
+    if (name === q) return 80;
+    if (name.startsWith(q)) return 70;
+    if (name.includes(q)) return 60;
+    return 0;
+  };
+  return countries
+    .map((item) => ({ item, s: score(item) }))
+    .filter((x) => x.s > 0)
+    .sort((a, b) => b.s - a.s)
+    .slice(0, 20)
+    .map((x) => x.item);
+};
+
+// Drop-in for fetch(`${endpoint}?q=...`).json() on the search endpoints.
+export const searchEndpoint = async (endpoint, query) => {
+  let results = null;
+  try {
+    if (endpoint === GADM_ENDPOINT) results = await staticGadmSearch(foldText(query));
+    else if (endpoint === COUNTRIES_ENDPOINT) results = await staticCountrySearch(query);
+  } catch {
+    results = null;
+  }
+  if (results) return results;
+  const res = await fetch(`${endpoint}?q=${encodeURIComponent(query)}`);
+  return res.json();
+};
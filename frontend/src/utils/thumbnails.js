@@ -0,0 +1,8 @@
+// Hub thumbnails are stored server-side and referenced as /thumbs/<hash>,
+// served from the API origin; anything else (legacy data URLs) is used as is.
+import { API_BASE } from '../config';
+
+export const thumbnailSrc = (thumbnail) => {
+  if (!thumbnail) return '/vite.svg';
+  return thumbnail.startsWith('/thumbs/') ? `${API_BASE}${thumbnail}` : thumbnail;
+};
@@ -0,0 +1,46 @@
+// Decoder for render payloads returned with payload_encoding: 'topo'.
+// Geometries reference shared, quantised, delta-coded arcs (TopoJSON-style);
+// this rebuilds plain GeoJSON coordinates.
+
+const GEOMETRY_DEPTHS = { LineString: 1, MultiLineString: 2, Polygon: 2, MultiPolygon: 3 };
+
+export const isTopoPayload = (value) => (
+  !!value && typeof value === 'object' && value.type === 'xatra-topology'
+);
+
+export const decodeTopoPayload = (topo) => {
+  if (!isTopoPayload(topo)) return topo;
+  const [sx, sy] = topo.transform.scale;
+  const [tx, ty] = topo.transform.translate;
+  const arcs = (topo.arcs || []).map((arc) => {
+    let x = 0;
+    let y = 0;
+    return arc.map(([dx, dy]) => {
+      x += dx;
+      y += dy;
+      return [x * sx + tx, y * sy + ty];
+    });
+  });
+  const line = (ids) => {
+    const out = [];
+    ids.forEach((id, k) => {
+      const pts = id < 0 ? arcs[~id].slice().reverse() : arcs[id];
+      out.push(...(k === 0 ? pts : pts.slice(1)));
+    });
+    return out;
+  };
+  const nest = (ids, depth) => (depth === 1 ? line(ids) : ids.map((x) => nest(x, depth - 1)));
+  const walk = (value) => {
+    if (Array.isArray(value)) return value.map(walk);
+    if (!value || typeof value !== 'object') return value;
+    const depth = GEOMETRY_DEPTHS[value.type];
+    if (depth && Array.isArray(value.arcs) && !('coordinates' in value)) {
+      const { arcs: refs, ...rest } = value;
+      const geometry = Object.fromEntries(Object.entries(rest).map(([k, v]) => [k, walk(v)]));
+      geometry.coordinates = nest(refs, depth);
+      return geometry;
+    }
+    return Object.fromEntries(Object.entries(value).map(([k, v]) => [k, walk(v)]));
+  };
+  return walk(topo.payload);
+};
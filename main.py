@@ -2,10 +2,16 @@ import sys
 import os
 from pathlib import Path
 import json
+import math
 import traceback
 import threading
 import multiprocessing
 import signal
+import mmap
+import struct
+import contextlib
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import ast
 import re
 import io
@@ -15,24 +21,40 @@ import sqlite3
 import secrets
 import hashlib
 import hmac
+import base64
+import bisect
+import array
+import unicodedata
+import zlib
 import urllib.request
 import urllib.error
 from datetime import datetime, timezone, timedelta
 from types import SimpleNamespace
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: builds are not coordinated across processes
+    fcntl = None
 from collections import OrderedDict, defaultdict
+from collections.abc import Sequence
 
 # Set matplotlib backend to Agg before importing anything else
 import matplotlib
 matplotlib.use('Agg')
+import numpy as np
+from PIL import Image as PILImage
 
 # Add src to path so we can import xatra
 sys.path.append(str(Path(__file__).parent.parent / "src"))
 
-from fastapi import FastAPI, HTTPException, Body, Request, Response
+from fastapi import FastAPI, HTTPException, Body, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from pydantic import BaseModel
-from typing import List, Optional, Any, Dict, Union, Tuple
+from shapely.geometry import shape, box, mapping
+from shapely.strtree import STRtree
+import shapely
+from typing import List, Optional, Any, Callable, Dict, Union, Tuple
 
 import xatra
 from xatra.loaders import gadm, naturalearth, polygon, GADM_DIR
@@ -46,8 +68,30 @@ process_lock = threading.Lock()
 render_cache_lock = threading.Lock()
 RENDER_CACHE_MAX_ENTRIES = 24
 render_cache = OrderedDict()
+# Packed geometry buffers for payload_encoding="binary", keyed by sha256 of the bytes.
+geometry_buffer_lock = threading.Lock()
+GEOMETRY_BUFFER_MAX_ENTRIES = 48
+geometry_buffer_cache = OrderedDict()
+# Full-detail geometries held back by progressive renders, keyed by sha256 of their JSON.
+geometry_detail_cache = OrderedDict()
 _bootstrap_icon_cache_lock = threading.Lock()
 _bootstrap_icon_cache: Dict[str, List[str]] = {}
+# Listing totals (explore, profiles, users) keyed by their COUNT query: (total, counted_at, refreshing).
+listing_total_lock = threading.Lock()
+LISTING_TOTAL_TTL_SECONDS = 30
+LISTING_TOTAL_MAX_ENTRIES = 256
+listing_total_cache = OrderedDict()
+# Resolved sessions keyed by token hash: (user_row, expires_at, cached_until). Bumping the generation
+# on invalidation stops a lookup that raced it from re-inserting the stale row. The cache is
+# per-process, so every lookup also reads hub_session_epoch (bumped by triggers on any session
+# delete or user change, whichever worker made it) and drops the whole cache when it moved.
+session_cache_lock = threading.Lock()
+SESSION_CACHE_TTL_SECONDS = 60
+SESSION_CACHE_MAX_ENTRIES = 1024
+SESSION_SWEEP_INTERVAL_SECONDS = 3600
+session_cache = OrderedDict()
+session_cache_generation = 0
+session_cache_epoch: Optional[int] = None
 
 # Simple in-memory rate limiter (IP-keyed, sliding window)
 _rate_limit_store: Dict[str, List[float]] = defaultdict(list)
@@ -115,7 +159,28 @@ _gadm_lock = threading.Lock()
 
 MAX_ARTIFACT_BYTES = 10 * 1024 * 1024  # 10 MB per-artifact content size limit
 
-GADM_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gadm_index.json")
+GADM_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gadm_index.bin")
+# Pre-columnar cache; converted to GADM_INDEX_PATH on first start if present.
+GADM_INDEX_LEGACY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gadm_index.json")
+# Fingerprints (size, mtime, sha256) of the GADM files the index was built from, so rebuilds
+# only re-read changed files; each file's extracted entries live in their own file under
+# GADM_INDEX_PARTS_DIR and are read only when the index has to be rebuilt.
+GADM_INDEX_PARTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gadm_index.parts.json")
+GADM_INDEX_PARTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gadm_index.parts")
+# Search tables over the installed GADM_INDEX_PATH (sorted keys, trigram/word postings, fuzzy
+# keys, children), written once per index build and mapped by every process.
+GADM_SEARCH_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gadm_search.bin")
+GADM_INDEX_LOCK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gadm_index.lock")
+GADM_INDEX_BUILD_WORKERS = int(os.environ.get("XATRA_GADM_INDEX_WORKERS", "0") or 0) or min(8, os.cpu_count() or 1)
+# Spawned render and index-build workers re-import this module. They inherit this marker from
+# the serving process and skip its startup index work (a build thread left running in a pool
+# worker blocks on the build lock its parent holds, and the pool never shuts down).
+_GADM_INDEX_OWNER_ENV = "XATRA_GADM_INDEX_OWNER"
+_IS_GADM_INDEX_OWNER = os.environ.setdefault(_GADM_INDEX_OWNER_ENV, str(os.getpid())) == str(os.getpid())
+GADM_TILE_CACHE_DIR = Path(__file__).parent / "gadm_tiles"
+GADM_GEOMETRY_CACHE_DIR = Path(__file__).parent / "gadm_geometry"
+PICKER_CACHE_DIR = Path(__file__).parent / "picker_cache"
+GADM_SEARCH_SHARD_DIR = Path(__file__).parent / "gadm_search"
 
 HUB_DB_PATH = Path(__file__).parent / "xatra_hub.db"
 HUB_NAME_PATTERN = re.compile(r"^[a-z0-9_.]+$")
@@ -166,12 +231,20 @@ SESSION_COOKIE = "xatra_session"
 GUEST_COOKIE = "xatra_guest"
 SESSION_TTL_DAYS = 30
 COOKIE_SECURE_ENV = os.environ.get("XATRA_COOKIE_SECURE")
+# Public URL of this API as browsers reach it (e.g. https://indica.org/xatra/api). Rendered HTML
+# fetches tiles and full-detail geometry from it; behind a path-prefix proxy request.base_url lacks the prefix.
+PUBLIC_API_BASE_ENV = os.environ.get("XATRA_PUBLIC_API_BASE")
+_PUBLIC_API_BASE_RE = re.compile(r"^https?://[^\s\"'<>\\`]+$")
 
 
 def _sha256_text(text: str) -> str:
     return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
 
 
+# Stored hash of artifacts that have no alpha content row yet.
+_EMPTY_CONTENT_HASH = _sha256_text("")
+
+
 def _parse_bool_env(value: Optional[str], default: bool = False) -> bool:
     if value is None:
         return default
@@ -182,6 +255,15 @@ def _utc_now_iso() -> str:
     return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
 
 
+def _public_api_base(request: Request, requested: Optional[str] = None) -> str:
+    """Base URL baked into rendered HTML: XATRA_PUBLIC_API_BASE, else the client's own API base, else base_url."""
+    for candidate in (PUBLIC_API_BASE_ENV, requested):
+        candidate = str(candidate or "").strip()
+        if candidate and _PUBLIC_API_BASE_RE.fullmatch(candidate):
+            return candidate.rstrip("/")
+    return str(request.base_url).rstrip("/")
+
+
 def _secure_cookie_flag(request: Optional[Request] = None) -> bool:
     if COOKIE_SECURE_ENV is not None:
         return _parse_bool_env(COOKIE_SECURE_ENV, default=False)
@@ -196,13 +278,128 @@ def _secure_cookie_flag(request: Optional[Request] = None) -> bool:
         return False
 
 
-def _hub_db_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(HUB_DB_PATH)
+# Hub DB connections are pooled per process. The database runs in WAL mode, so readers never
+# wait for the writer: read-only paths take a query_only connection from a small pool, and
+# everything else shares one writer connection, handed to one thread at a time (re-entrantly,
+# so a helper opening its own connection inside a write path gets the same one). Pooled
+# connections keep their prepared-statement caches across requests.
+HUB_DB_READ_POOL_SIZE = 8
+HUB_DB_STATEMENT_CACHE = 256
+HUB_DB_BUSY_TIMEOUT_MS = 5000
+_HUB_DB_PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    f"PRAGMA busy_timeout = {HUB_DB_BUSY_TIMEOUT_MS}",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+)
+
+
+class _HubConnection(sqlite3.Connection):
+    """Pooled hub connection: close() hands it back to the pool."""
+
+    query_only = False
+
+    def close(self) -> None:
+        _hub_db_release(self)
+
+
+_hub_db_pool_cond = threading.Condition()
+_hub_db_pool: Dict[str, Any] = {"pid": None, "readers": [], "writer": None, "owner": None, "depth": 0}
+
+
+def _hub_db_open(query_only: bool) -> "_HubConnection":
+    conn = sqlite3.connect(
+        HUB_DB_PATH,
+        factory=_HubConnection,
+        timeout=HUB_DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        cached_statements=HUB_DB_STATEMENT_CACHE,
+    )
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON")
+    # For schema migrations only; triggers stay plain SQL so any connection can write.
+    conn.create_function("xatra_sha256", 1, _sha256_text, deterministic=True)
+    for pragma in _HUB_DB_PRAGMAS:
+        conn.execute(pragma)
+    if query_only:
+        conn.execute("PRAGMA query_only = ON")
+        conn.query_only = True
     return conn
 
 
+def _hub_db_pool_state() -> Dict[str, Any]:
+    # Caller holds _hub_db_pool_cond. A forked render process must not reuse its parent's handles.
+    if _hub_db_pool["pid"] != os.getpid():
+        _hub_db_pool.update(pid=os.getpid(), readers=[], writer=None, owner=None, depth=0)
+    return _hub_db_pool
+
+
+def _hub_db_conn(readonly: bool = False) -> sqlite3.Connection:
+    """A pooled hub connection; callers close() it when done, which returns it to the pool.
+
+    ``readonly`` connections reject writes (PRAGMA query_only) and may be used concurrently;
+    the writer is held exclusively by the calling thread until its outermost close().
+    """
+    me = threading.get_ident()
+    with _hub_db_pool_cond:
+        pool = _hub_db_pool_state()
+        if readonly:
+            if pool["readers"]:
+                return pool["readers"].pop()
+        else:
+            if not _hub_db_pool_cond.wait_for(lambda: pool["owner"] in (None, me), HUB_DB_BUSY_TIMEOUT_MS / 1000):
+                raise HTTPException(status_code=503, detail="Database is busy, please retry")
+            pool["owner"] = me
+            pool["depth"] += 1
+            if pool["writer"] is not None:
+                return pool["writer"]
+    if readonly:
+        return _hub_db_open(True)
+    try:
+        conn = _hub_db_open(False)
+    except Exception:
+        with _hub_db_pool_cond:
+            pool["depth"] -= 1
+            if pool["depth"] == 0:
+                pool["owner"] = None
+                _hub_db_pool_cond.notify()
+        raise
+    with _hub_db_pool_cond:
+        pool["writer"] = conn
+    return conn
+
+
+def _hub_db_release(conn: "_HubConnection") -> None:
+    with _hub_db_pool_cond:
+        pool = _hub_db_pool_state()
+        if conn is pool["writer"]:
+            pool["depth"] -= 1
+            if pool["depth"] > 0:
+                return
+            # Work a caller didn't commit is dropped, as closing a connection would.
+            if conn.in_transaction:
+                conn.rollback()
+            pool["owner"] = None
+            _hub_db_pool_cond.notify()
+            return
+        if conn.query_only and len(pool["readers"]) < HUB_DB_READ_POOL_SIZE:
+            if conn.in_transaction:
+                conn.rollback()
+            pool["readers"].append(conn)
+            return
+    sqlite3.Connection.close(conn)
+
+
+def _hub_read_db():
+    """FastAPI dependency: one read-only hub connection for the whole request."""
+    conn = _hub_db_conn(readonly=True)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
 def _normalize_hub_name(name: str) -> str:
     cleaned = str(name or "").strip()
     if not HUB_NAME_PATTERN.fullmatch(cleaned):
@@ -264,6 +461,218 @@ def _sanitize_artifact_metadata(kind: str, metadata: Any) -> Dict[str, Any]:
     cleaned = _artifact_metadata_dict(metadata)
     return cleaned
 
+
+# Map thumbnails arrive as data URLs in artifact metadata. They are re-encoded once, stored
+# content-addressed in hub_thumbnails, and the metadata keeps only their /thumbs/{hash} URL,
+# so listings stay small and browsers cache each image forever.
+HUB_THUMBNAIL_SIZE = (480, 270)
+HUB_THUMBNAIL_MAX_UPLOAD_BYTES = 4 * 1024 * 1024
+HUB_THUMBNAIL_PREFIX = "/thumbs/"
+_THUMBNAIL_DATA_URL_RE = re.compile(r"^data:(image/(?:png|jpeg|webp|gif));base64,", re.I)
+_THUMBNAIL_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _encode_thumbnail(raw: bytes) -> Tuple[bytes, str]:
+    """Downscale to fit HUB_THUMBNAIL_SIZE and re-encode as WebP (PNG if WebP is unavailable)."""
+    with PILImage.open(io.BytesIO(raw)) as img:
+        if img.width * img.height > 64 * 1024 * 1024:
+            raise ValueError("image too large")
+        img.thumbnail(HUB_THUMBNAIL_SIZE, PILImage.LANCZOS)
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+        out = io.BytesIO()
+        try:
+            img.save(out, "WEBP", quality=80, method=6)
+            return out.getvalue(), "image/webp"
+        except (KeyError, OSError):
+            out = io.BytesIO()
+            img.save(out, "PNG", optimize=True)
+            return out.getvalue(), "image/png"
+
+
+def _store_thumbnail(conn: sqlite3.Connection, data_url: str) -> str:
+    """Persist a data-URL thumbnail and return its /thumbs/{hash} URL."""
+    match = _THUMBNAIL_DATA_URL_RE.match(data_url)
+    if match is None:
+        raise ValueError("not an image data URL")
+    raw = base64.b64decode(data_url[match.end():], validate=False)
+    if len(raw) > HUB_THUMBNAIL_MAX_UPLOAD_BYTES:
+        raise ValueError("thumbnail too large")
+    data, mime = _encode_thumbnail(raw)
+    digest = hashlib.sha256(data).hexdigest()
+    conn.execute(
+        "INSERT OR IGNORE INTO hub_thumbnails(hash, mime, data, created_at) VALUES(?, ?, ?, ?)",
+        (digest, mime, data, _utc_now_iso()),
+    )
+    return HUB_THUMBNAIL_PREFIX + digest
+
+
+def _externalize_thumbnail(conn: sqlite3.Connection, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    thumbnail = metadata.get("thumbnail")
+    if not isinstance(thumbnail, str) or not thumbnail.startswith("data:"):
+        return metadata
+    try:
+        url = _store_thumbnail(conn, thumbnail)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid thumbnail image")
+    return {**metadata, "thumbnail": url}
+
+
+def _migrate_inline_thumbnails(conn: sqlite3.Connection) -> None:
+    """Move data-URL thumbnails left in stored metadata into hub_thumbnails; drop unreferenced blobs."""
+    for table, column in (("hub_artifacts", "alpha_metadata"), ("hub_artifact_versions", "metadata")):
+        rows = conn.execute(f"SELECT id, {column} AS meta FROM {table} WHERE {column} LIKE '%data:image/%'").fetchall()
+        for row in rows:
+            meta = _artifact_metadata_dict(row["meta"])
+            try:
+                updated = _externalize_thumbnail(conn, meta)
+            except HTTPException:
+                print(f"[xatra] Warning: dropping unreadable thumbnail in {table} row {row['id']}", file=sys.stderr)
+                updated = {k: v for k, v in meta.items() if k != "thumbnail"}
+            if updated is not meta:
+                conn.execute(f"UPDATE {table} SET {column} = ? WHERE id = ?", (_json_text(updated), row["id"]))
+    conn.execute(
+        f"""
+        DELETE FROM hub_thumbnails
+        WHERE '{HUB_THUMBNAIL_PREFIX}' || hash NOT IN (
+            SELECT json_extract(alpha_metadata, '$.thumbnail') FROM hub_artifacts
+            WHERE json_valid(alpha_metadata) AND json_extract(alpha_metadata, '$.thumbnail') IS NOT NULL
+            UNION
+            SELECT json_extract(metadata, '$.thumbnail') FROM hub_artifact_versions
+            WHERE json_valid(metadata) AND json_extract(metadata, '$.thumbnail') IS NOT NULL
+        )
+        """
+    )
+
+
+# Published version content lives in hub_blobs, one row per distinct text keyed by its SHA-256
+# (the versions' content_hash), so re-publishing unchanged content or publishing a fork adds no
+# bytes. Blobs are zlib-compressed (the codec column leaves room for others). A blob may instead
+# be compressed with its artifact's previous version as a preset dictionary, which stores a small
+# edit of a lib in a few bytes (zlib only looks back 32 KB, so larger libs gain less); such bases
+# are never deltas themselves, so any blob decodes with at most one extra row.
+HUB_BLOB_CODEC = "zlib"
+HUB_BLOB_ZLIB_LEVEL = 9
+
+
+def _blob_compress(raw: bytes, base: Optional[bytes] = None) -> bytes:
+    compressor = zlib.compressobj(HUB_BLOB_ZLIB_LEVEL, zdict=base) if base else zlib.compressobj(HUB_BLOB_ZLIB_LEVEL)
+    return compressor.compress(raw) + compressor.flush()
+
+
+def _blob_decompress(codec: str, data: bytes, base: Optional[bytes] = None) -> bytes:
+    if codec != HUB_BLOB_CODEC:
+        raise RuntimeError(f"unsupported hub blob codec {codec!r}")
+    decompressor = zlib.decompressobj(zdict=base) if base else zlib.decompressobj()
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+def _blob_text(codec: str, data: bytes, base_codec: Optional[str] = None, base_data: Optional[bytes] = None) -> str:
+    """Decode a hub_blobs row (joined with its base row, if any)."""
+    base = _blob_decompress(base_codec, base_data) if base_data is not None else None
+    return _blob_decompress(codec, data, base).decode("utf-8")
+
+
+def _hub_blob_text(conn: sqlite3.Connection, content_hash: str) -> str:
+    row = conn.execute(
+        """
+        SELECT b.codec, b.data, base.codec AS base_codec, base.data AS base_data
+        FROM hub_blobs b LEFT JOIN hub_blobs base ON base.hash = b.base_hash
+        WHERE b.hash = ?
+        """,
+        (content_hash,),
+    ).fetchone()
+    if row is None:
+        raise HTTPException(status_code=500, detail="Stored version content is missing")
+    return _blob_text(row["codec"], row["data"], row["base_codec"], row["base_data"])
+
+
+def _store_version_blob(conn: sqlite3.Connection, content: str, base_hash: Optional[str] = None) -> str:
+    """Store version content in hub_blobs unless already present; returns its content hash.
+
+    ``base_hash`` names the blob to try as a delta base (the previous version's content).
+    """
+    content = content or ""
+    content_hash = _sha256_text(content)
+    if conn.execute("SELECT 1 FROM hub_blobs WHERE hash = ?", (content_hash,)).fetchone() is not None:
+        return content_hash
+    raw = content.encode("utf-8")
+    data = _blob_compress(raw)
+    stored_base = None
+    if base_hash:
+        base = conn.execute(
+            "SELECT COALESCE(base_hash, hash) AS hash FROM hub_blobs WHERE hash = ?", (base_hash,)
+        ).fetchone()
+        if base is not None:
+            base_raw = _hub_blob_text(conn, base["hash"]).encode("utf-8")
+            delta = _blob_compress(raw, base_raw) if base_raw else data
+            if len(delta) < len(data):
+                data, stored_base = delta, base["hash"]
+    conn.execute(
+        "INSERT INTO hub_blobs(hash, codec, base_hash, size, data, created_at) VALUES(?, ?, ?, ?, ?, ?)",
+        (content_hash, HUB_BLOB_CODEC, stored_base, len(raw), data, _utc_now_iso()),
+    )
+    return content_hash
+
+
+def _move_version_contents_to_blobs(conn: sqlite3.Connection) -> None:
+    """Move hub_artifact_versions.content into hub_blobs (existing DBs)."""
+    # Older versions of these triggers read hub_artifact_versions.content, which blocks DROP COLUMN.
+    for trigger in ("trg_hub_dependencies_version_insert", "trg_hub_dependencies_version_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    rows = conn.execute(
+        """
+        SELECT v.id, v.artifact_id FROM hub_artifact_versions v
+        WHERE NOT EXISTS (SELECT 1 FROM hub_blobs b WHERE b.hash = v.content_hash)
+        ORDER BY v.artifact_id, v.version
+        """
+    ).fetchall()
+    previous: Dict[int, str] = {}
+    for row in rows:
+        content = conn.execute("SELECT content FROM hub_artifact_versions WHERE id = ?", (row["id"],)).fetchone()["content"]
+        content_hash = _store_version_blob(conn, content, base_hash=previous.get(row["artifact_id"]))
+        conn.execute("UPDATE hub_artifact_versions SET content_hash = ? WHERE id = ?", (content_hash, row["id"]))
+        previous[row["artifact_id"]] = content_hash
+    if sqlite3.sqlite_version_info >= (3, 35, 0):
+        conn.execute("ALTER TABLE hub_artifact_versions DROP COLUMN content")
+    else:
+        # No DROP COLUMN, and new versions no longer supply the NOT NULL content: rebuild the table.
+        conn.executescript(
+            """
+            CREATE TABLE hub_artifact_versions_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                artifact_id INTEGER NOT NULL REFERENCES hub_artifacts(id) ON DELETE CASCADE,
+                version INTEGER NOT NULL,
+                metadata TEXT NOT NULL DEFAULT '{}',
+                created_at TEXT NOT NULL,
+                content_hash TEXT NOT NULL REFERENCES hub_blobs(hash),
+                UNIQUE(artifact_id, version)
+            );
+            INSERT INTO hub_artifact_versions_new(id, artifact_id, version, metadata, created_at, content_hash)
+            SELECT id, artifact_id, version, metadata, created_at, content_hash FROM hub_artifact_versions;
+            DROP TABLE hub_artifact_versions;
+            ALTER TABLE hub_artifact_versions_new RENAME TO hub_artifact_versions;
+            CREATE INDEX IF NOT EXISTS idx_hub_versions_artifact ON hub_artifact_versions(artifact_id, version);
+            """
+        )
+    if rows:
+        print(f"[xatra] Moved {len(rows)} published versions into hub_blobs.")
+
+
+def _gc_version_blobs(conn: sqlite3.Connection) -> None:
+    """Drop blobs no version uses, keeping the delta bases of blobs that are still used."""
+    conn.execute(
+        """
+        DELETE FROM hub_blobs
+        WHERE hash NOT IN (SELECT content_hash FROM hub_artifact_versions)
+          AND hash NOT IN (
+              SELECT b.base_hash FROM hub_blobs b
+              JOIN hub_artifact_versions v ON v.content_hash = b.hash
+              WHERE b.base_hash IS NOT NULL
+          )
+        """
+    )
+
+
 def _is_user_trusted(user_row: Optional[sqlite3.Row]) -> bool:
     if user_row is None:
         return False
@@ -527,26 +936,34 @@ def _seed_xatra_lib_artifacts(
     def _upsert(kind: str, name: str, alpha_content: str, alpha_metadata: Optional[Dict[str, Any]] = None) -> None:
         meta_json = json.dumps(alpha_metadata or {}, ensure_ascii=False)
         existing = conn.execute(
-            "SELECT id, alpha_content, alpha_metadata FROM hub_artifacts WHERE kind = ? AND name = ?", (kind, name)
+            """
+            SELECT a.id, COALESCE(c.alpha_content, '') AS alpha_content, a.alpha_metadata
+            FROM hub_artifacts a
+            LEFT JOIN hub_artifact_contents c ON c.artifact_id = a.id
+            WHERE a.kind = ? AND a.name = ?
+            """,
+            (kind, name),
         ).fetchone()
         if existing is None:
-            conn.execute(
+            cur = conn.execute(
                 """
-                INSERT INTO hub_artifacts(user_id, kind, name, alpha_content, alpha_metadata, created_at, updated_at)
-                VALUES(?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO hub_artifacts(user_id, kind, name, alpha_metadata, created_at, updated_at)
+                VALUES(?, ?, ?, ?, ?, ?)
                 """,
-                (user_id, kind, name, alpha_content, meta_json, now, now),
+                (user_id, kind, name, meta_json, now, now),
             )
+            _hub_set_alpha_content(conn, cur.lastrowid, alpha_content)
             print(f"[xatra] Seeded {kind} artifact '{name}'")
         elif force:
-            update_args = [alpha_content, now]
-            update_sql = "UPDATE hub_artifacts SET alpha_content = ?, updated_at = ?"
+            update_args = [now]
+            update_sql = "UPDATE hub_artifacts SET updated_at = ?"
             if alpha_metadata is not None:
                 update_sql += ", alpha_metadata = ?"
                 update_args.append(meta_json)
             update_sql += " WHERE id = ?"
             update_args.append(existing["id"])
             conn.execute(update_sql, update_args)
+            _hub_set_alpha_content(conn, existing["id"], alpha_content)
             print(f"[xatra] Reseeded {kind} artifact '{name}' (--force)")
         elif kind == "map" and (code_to_builder_fn is not None or parse_theme_fn is not None):
             # Populate project.elements / project.options if currently empty, without overwriting
@@ -645,9 +1062,10 @@ def _seed_xatra_lib_artifacts(
                             meta_changed = True
                 if content_changed or meta_changed:
                     conn.execute(
-                        "UPDATE hub_artifacts SET alpha_content = ?, alpha_metadata = ?, updated_at = ? WHERE id = ?",
-                        (json.dumps(existing_content, ensure_ascii=False), json.dumps(existing_meta, ensure_ascii=False), now, existing["id"]),
+                        "UPDATE hub_artifacts SET alpha_metadata = ?, updated_at = ? WHERE id = ?",
+                        (json.dumps(existing_meta, ensure_ascii=False), now, existing["id"]),
                     )
+                    _hub_set_alpha_content(conn, existing["id"], json.dumps(existing_content, ensure_ascii=False))
             except Exception as e:
                 print(f"[xatra] Warning: failed to populate elements for '{name}': {e}", file=sys.stderr)
 
@@ -746,6 +1164,8 @@ def _verify_password(password: str, password_hash: Optional[str]) -> bool:
 def _init_hub_db():
     conn = _hub_db_conn()
     try:
+        # Persistent: readers keep working while a write is in progress.
+        conn.execute("PRAGMA journal_mode = WAL")
         conn.executescript(
             """
             CREATE TABLE IF NOT EXISTS hub_users (
@@ -765,23 +1185,40 @@ def _init_hub_db():
                 kind TEXT NOT NULL,
                 name TEXT NOT NULL,
                 featured INTEGER NOT NULL DEFAULT 0,
-                alpha_content TEXT NOT NULL DEFAULT '',
                 alpha_metadata TEXT NOT NULL DEFAULT '{}',
                 created_at TEXT NOT NULL,
                 updated_at TEXT NOT NULL,
+                votes_count INTEGER NOT NULL DEFAULT 0,
+                views_count INTEGER NOT NULL DEFAULT 0,
                 UNIQUE(user_id, kind, name)
             );
 
+            -- Alpha content lives apart from hub_artifacts so lookups, listings and counters
+            -- only ever touch small rows; it is read only when a request needs the content.
+            CREATE TABLE IF NOT EXISTS hub_artifact_contents (
+                artifact_id INTEGER PRIMARY KEY REFERENCES hub_artifacts(id) ON DELETE CASCADE,
+                alpha_content TEXT NOT NULL DEFAULT ''
+            );
+
             CREATE TABLE IF NOT EXISTS hub_artifact_versions (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 artifact_id INTEGER NOT NULL REFERENCES hub_artifacts(id) ON DELETE CASCADE,
                 version INTEGER NOT NULL,
-                content TEXT NOT NULL,
                 metadata TEXT NOT NULL DEFAULT '{}',
                 created_at TEXT NOT NULL,
+                content_hash TEXT NOT NULL REFERENCES hub_blobs(hash),
                 UNIQUE(artifact_id, version)
             );
 
+            CREATE TABLE IF NOT EXISTS hub_blobs (
+                hash TEXT PRIMARY KEY,
+                codec TEXT NOT NULL,
+                base_hash TEXT REFERENCES hub_blobs(hash),
+                size INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                created_at TEXT NOT NULL
+            );
+
             CREATE TABLE IF NOT EXISTS hub_sessions (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL REFERENCES hub_users(id) ON DELETE CASCADE,
@@ -806,6 +1243,13 @@ def _init_hub_db():
                 UNIQUE(artifact_id, viewer_key)
             );
 
+            CREATE TABLE IF NOT EXISTS hub_thumbnails (
+                hash TEXT PRIMARY KEY,
+                mime TEXT NOT NULL,
+                data BLOB NOT NULL,
+                created_at TEXT NOT NULL
+            ) WITHOUT ROWID;
+
             CREATE TABLE IF NOT EXISTS hub_drafts (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 owner_key TEXT NOT NULL UNIQUE,
@@ -817,6 +1261,7 @@ def _init_hub_db():
             CREATE INDEX IF NOT EXISTS idx_hub_artifacts_kind_name ON hub_artifacts(kind, name);
             CREATE INDEX IF NOT EXISTS idx_hub_versions_artifact ON hub_artifact_versions(artifact_id, version);
             CREATE INDEX IF NOT EXISTS idx_hub_sessions_user ON hub_sessions(user_id);
+            CREATE INDEX IF NOT EXISTS idx_hub_sessions_expires ON hub_sessions(expires_at);
             CREATE INDEX IF NOT EXISTS idx_hub_votes_artifact ON hub_votes(artifact_id);
             CREATE INDEX IF NOT EXISTS idx_hub_views_artifact ON hub_map_views(artifact_id);
             """
@@ -844,10 +1289,55 @@ def _init_hub_db():
             conn.execute("ALTER TABLE hub_users ADD COLUMN is_trusted INTEGER NOT NULL DEFAULT 0")
         artifact_cols = {
             row["name"]
-            for row in conn.execute("PRAGMA table_info(hub_artifacts)").fetchall()
+            # table_xinfo also lists generated columns.
+            for row in conn.execute("PRAGMA table_xinfo(hub_artifacts)").fetchall()
         }
         if "featured" not in artifact_cols:
             conn.execute("ALTER TABLE hub_artifacts ADD COLUMN featured INTEGER NOT NULL DEFAULT 0")
+        if "forked_from" not in artifact_cols:
+            # Derived from alpha_metadata so every write path keeps it current; indexed below.
+            conn.execute(
+                "ALTER TABLE hub_artifacts ADD COLUMN forked_from TEXT GENERATED ALWAYS AS ("
+                "CASE WHEN json_valid(alpha_metadata) THEN json_extract(alpha_metadata, '$.forked_from') END"
+                ") VIRTUAL"
+            )
+        if "votes_count" not in artifact_cols or "views_count" not in artifact_cols:
+            if "votes_count" not in artifact_cols:
+                conn.execute("ALTER TABLE hub_artifacts ADD COLUMN votes_count INTEGER NOT NULL DEFAULT 0")
+            if "views_count" not in artifact_cols:
+                conn.execute("ALTER TABLE hub_artifacts ADD COLUMN views_count INTEGER NOT NULL DEFAULT 0")
+            _hub_recount_artifact_stats(conn)
+        if "alpha_content_hash" not in artifact_cols:
+            # SHA-256 of the alpha content, kept current by _hub_set_alpha_content.
+            conn.execute(
+                "ALTER TABLE hub_artifacts ADD COLUMN alpha_content_hash TEXT NOT NULL "
+                f"DEFAULT '{_EMPTY_CONTENT_HASH}'"
+            )
+        if "alpha_content" in artifact_cols:
+            _split_artifact_contents(conn)
+        if "alpha_content_hash" not in artifact_cols:
+            conn.execute(
+                """
+                UPDATE hub_artifacts
+                SET alpha_content_hash = (
+                    SELECT xatra_sha256(alpha_content) FROM hub_artifact_contents WHERE artifact_id = hub_artifacts.id
+                )
+                WHERE id IN (SELECT artifact_id FROM hub_artifact_contents)
+                """
+            )
+        version_cols = {
+            row["name"]
+            for row in conn.execute("PRAGMA table_info(hub_artifact_versions)").fetchall()
+        }
+        if "content_hash" not in version_cols:
+            conn.execute("ALTER TABLE hub_artifact_versions ADD COLUMN content_hash TEXT")
+            conn.execute("UPDATE hub_artifact_versions SET content_hash = xatra_sha256(content)")
+        if "content" in version_cols:
+            _move_version_contents_to_blobs(conn)
+        _ensure_artifact_stats_schema(conn)
+        _ensure_artifact_search_schema(conn)
+        _ensure_artifact_dependency_schema(conn)
+        _ensure_session_epoch_schema(conn)
 
         # Ensure default admin account exists.
         now = _utc_now_iso()
@@ -898,6 +1388,8 @@ def _init_hub_db():
                     "UPDATE hub_artifact_versions SET metadata = ? WHERE id = ?",
                     (sanitized, row["id"]),
                 )
+        _migrate_inline_thumbnails(conn)
+        _gc_version_blobs(conn)
         # Ensure the anonymous user exists (for disassociated artifacts).
         conn.execute(
             "INSERT OR IGNORE INTO hub_users(username, created_at) VALUES(?, ?)",
@@ -926,6 +1418,258 @@ def _init_hub_db():
         conn.close()
 
 
+def _ensure_session_epoch_schema(conn: sqlite3.Connection) -> None:
+    """Single-row counter bumped whenever a session is revoked or a user row changes.
+
+    Workers compare it against the epoch their session_cache was filled under, so a logout or
+    trust change made by one worker reaches the others on their next request.
+    """
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS hub_session_epoch (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            epoch INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO hub_session_epoch(id, epoch) VALUES (1, 0);
+        CREATE TRIGGER IF NOT EXISTS trg_hub_sessions_epoch_delete AFTER DELETE ON hub_sessions BEGIN
+            UPDATE hub_session_epoch SET epoch = epoch + 1 WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_hub_users_epoch_update AFTER UPDATE ON hub_users BEGIN
+            UPDATE hub_session_epoch SET epoch = epoch + 1 WHERE id = 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_hub_users_epoch_delete AFTER DELETE ON hub_users BEGIN
+            UPDATE hub_session_epoch SET epoch = epoch + 1 WHERE id = 1;
+        END;
+        """
+    )
+
+
+def _ensure_artifact_stats_schema(conn: sqlite3.Connection) -> None:
+    """Triggers keeping hub_artifacts.votes_count/views_count exact, plus an index per gallery sort.
+
+    INSERT OR IGNORE into hub_votes/hub_map_views fires no trigger for ignored rows, and cascaded
+    deletes fire the delete triggers, so the counters never need recomputing after this.
+    """
+    conn.executescript(
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_hub_votes_count_insert AFTER INSERT ON hub_votes BEGIN
+            UPDATE hub_artifacts SET votes_count = votes_count + 1 WHERE id = NEW.artifact_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_hub_votes_count_delete AFTER DELETE ON hub_votes BEGIN
+            UPDATE hub_artifacts SET votes_count = votes_count - 1 WHERE id = OLD.artifact_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_hub_votes_count_move AFTER UPDATE OF artifact_id ON hub_votes
+        WHEN NEW.artifact_id IS NOT OLD.artifact_id BEGIN
+            UPDATE hub_artifacts SET votes_count = votes_count - 1 WHERE id = OLD.artifact_id;
+            UPDATE hub_artifacts SET votes_count = votes_count + 1 WHERE id = NEW.artifact_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_hub_views_count_insert AFTER INSERT ON hub_map_views BEGIN
+            UPDATE hub_artifacts SET views_count = views_count + 1 WHERE id = NEW.artifact_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_hub_views_count_delete AFTER DELETE ON hub_map_views BEGIN
+            UPDATE hub_artifacts SET views_count = views_count - 1 WHERE id = OLD.artifact_id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_hub_views_count_move AFTER UPDATE OF artifact_id ON hub_map_views
+        WHEN NEW.artifact_id IS NOT OLD.artifact_id BEGIN
+            UPDATE hub_artifacts SET views_count = views_count - 1 WHERE id = OLD.artifact_id;
+            UPDATE hub_artifacts SET views_count = views_count + 1 WHERE id = NEW.artifact_id;
+        END;
+
+        -- One index per _map_sort_order_sql ordering (kind = 'map' is always filtered on).
+        CREATE INDEX IF NOT EXISTS idx_hub_artifacts_sort_default
+            ON hub_artifacts(kind, featured DESC, votes_count DESC, views_count DESC, updated_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_hub_artifacts_sort_votes
+            ON hub_artifacts(kind, votes_count DESC, views_count DESC, updated_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_hub_artifacts_sort_views
+            ON hub_artifacts(kind, views_count DESC, votes_count DESC, updated_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_hub_artifacts_sort_recency
+            ON hub_artifacts(kind, updated_at DESC, votes_count DESC, views_count DESC);
+        """
+    )
+
+
+_TERRITORY_ASSIGN_RE = re.compile(r"^([A-Za-z][A-Za-z0-9_]*)\s*=", re.M)
+_FTS_WORD_RE = re.compile(r"[^\W_]+")
+# bm25 column weights: name, username, description, territories.
+_HUB_FTS_RANK_SQL = "bm25(hub_artifacts_fts, 10.0, 5.0, 2.0, 1.0)"
+
+
+def _artifact_territory_names(content: Optional[str]) -> str:
+    """Space-separated territory names an artifact defines (predefined_code assignments, flag labels)."""
+    parsed = _json_parse(content, None)
+    if not isinstance(parsed, dict):
+        return ""
+    names = _TERRITORY_ASSIGN_RE.findall(str(parsed.get("predefined_code") or ""))
+    project = parsed.get("project")
+    if isinstance(project, dict):
+        for element in [*(project.get("elements") or []), *(project.get("runtimeElements") or [])]:
+            if isinstance(element, dict) and element.get("type") == "flag" and isinstance(element.get("label"), str):
+                names.append(element["label"])
+    return " ".join(dict.fromkeys(names))
+
+
+def _ensure_artifact_search_schema(conn: sqlite3.Connection) -> None:
+    """FTS5 index over artifact name, owner, description and territory names.
+
+    Triggers keep name, owner and description in sync; territory names need Python, so
+    _hub_set_alpha_content writes them. unicode61 with remove_diacritics folds case and
+    accents; the prefix indexes keep the type-ahead ("term"*) queries the gallery issues cheap.
+    """
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'hub_artifacts_fts'").fetchone()
+    description_sql = "CASE WHEN json_valid({0}.alpha_metadata) THEN COALESCE(json_extract({0}.alpha_metadata, '$.description'), '') ELSE '' END"
+    conn.executescript(
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS hub_artifacts_fts USING fts5(
+            name, username, description, territories,
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        );
+        -- Earlier versions called Python functions; drop them so they are recreated as plain SQL.
+        DROP TRIGGER IF EXISTS trg_hub_artifact_contents_fts_insert;
+        DROP TRIGGER IF EXISTS trg_hub_artifact_contents_fts_update;
+        DROP TRIGGER IF EXISTS trg_hub_artifacts_fts_insert;
+        CREATE TRIGGER trg_hub_artifacts_fts_insert AFTER INSERT ON hub_artifacts BEGIN
+            INSERT INTO hub_artifacts_fts(rowid, name, username, description, territories)
+            VALUES (
+                NEW.id,
+                NEW.name,
+                (SELECT username FROM hub_users WHERE id = NEW.user_id),
+                {description_sql.format("NEW")},
+                ''
+            );
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_hub_artifacts_fts_update
+        AFTER UPDATE OF name, user_id, alpha_metadata ON hub_artifacts BEGIN
+            UPDATE hub_artifacts_fts SET
+                name = NEW.name,
+                username = (SELECT username FROM hub_users WHERE id = NEW.user_id),
+                description = {description_sql.format("NEW")}
+            WHERE rowid = NEW.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_hub_artifacts_fts_delete AFTER DELETE ON hub_artifacts BEGIN
+            DELETE FROM hub_artifacts_fts WHERE rowid = OLD.id;
+        END;
+        CREATE TRIGGER IF NOT EXISTS trg_hub_users_fts_rename AFTER UPDATE OF username ON hub_users BEGIN
+            UPDATE hub_artifacts_fts SET username = NEW.username
+            WHERE rowid IN (SELECT id FROM hub_artifacts WHERE user_id = NEW.id);
+        END;
+        """
+    )
+    if exists is None:
+        conn.execute(
+            f"""
+            INSERT INTO hub_artifacts_fts(rowid, name, username, description, territories)
+            SELECT a.id, a.name, u.username, {description_sql.format("a")}, ''
+            FROM hub_artifacts a
+            JOIN hub_users u ON u.id = a.user_id
+            """
+        )
+        conn.executemany(
+            "UPDATE hub_artifacts_fts SET territories = ? WHERE rowid = ?",
+            (
+                (_artifact_territory_names(row["alpha_content"]), row["artifact_id"])
+                for row in conn.execute("SELECT artifact_id, alpha_content FROM hub_artifact_contents").fetchall()
+            ),
+        )
+
+
+def _hub_fts_match(terms: List[str]) -> Optional[str]:
+    """FTS5 MATCH expression requiring every word of ``terms`` as a prefix; None for no terms.
+
+    Words are split like the unicode61 tokenizer splits them and quoted, so user input can't
+    inject FTS syntax. Terms with no words at all yield '""', which matches nothing.
+    """
+    if not terms:
+        return None
+    words = [word for term in terms for word in _FTS_WORD_RE.findall(term)]
+    return " ".join(f'"{word}"*' for word in words) or '""'
+
+
+def _ensure_artifact_dependency_schema(conn: sqlite3.Connection) -> None:
+    """hub_dependencies edges (artifact version -> imported kind/name/version).
+
+    version is 0 for an artifact's alpha and the published version number otherwise. Importer
+    lookups, rename propagation and render-cache dependencies all go through the target index.
+    Edges are written by _hub_set_alpha_content and _hub_publish_version (parsing imports
+    needs Python); a trigger only clears a deleted version's edges.
+    """
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'hub_dependencies'").fetchone()
+    conn.executescript(
+        """
+        CREATE TABLE IF NOT EXISTS hub_dependencies (
+            artifact_id INTEGER NOT NULL REFERENCES hub_artifacts(id) ON DELETE CASCADE,
+            version INTEGER NOT NULL,
+            dep_kind TEXT NOT NULL,
+            dep_name TEXT NOT NULL,
+            dep_version TEXT NOT NULL,
+            PRIMARY KEY(artifact_id, version, dep_kind, dep_name, dep_version)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_hub_dependencies_target ON hub_dependencies(dep_kind, dep_name, dep_version);
+        CREATE INDEX IF NOT EXISTS idx_hub_artifacts_forked_from
+            ON hub_artifacts(forked_from, updated_at DESC) WHERE forked_from IS NOT NULL;
+
+        -- Earlier versions computed edges in triggers through Python functions.
+        DROP TRIGGER IF EXISTS trg_hub_dependencies_alpha_insert;
+        DROP TRIGGER IF EXISTS trg_hub_dependencies_alpha_update;
+        DROP TRIGGER IF EXISTS trg_hub_dependencies_version_insert;
+        DROP TRIGGER IF EXISTS trg_hub_dependencies_version_update;
+        CREATE TRIGGER IF NOT EXISTS trg_hub_dependencies_version_delete AFTER DELETE ON hub_artifact_versions BEGIN
+            DELETE FROM hub_dependencies WHERE artifact_id = OLD.artifact_id AND version = OLD.version;
+        END;
+        """
+    )
+    if exists is None:
+        # Index everything already stored; from here on the write helpers keep edges current.
+        for row in conn.execute("SELECT artifact_id, alpha_content FROM hub_artifact_contents").fetchall():
+            _hub_set_dependencies(conn, row["artifact_id"], 0, row["alpha_content"])
+        for row in conn.execute("SELECT artifact_id, version, content_hash FROM hub_artifact_versions").fetchall():
+            _hub_set_dependencies(conn, row["artifact_id"], row["version"], _hub_blob_text(conn, row["content_hash"]))
+
+
+def _hub_set_dependencies(conn: sqlite3.Connection, artifact_id: int, version: int, content: Optional[str]) -> None:
+    """Replace the hub_dependencies edges of one artifact version with those in ``content``."""
+    conn.execute("DELETE FROM hub_dependencies WHERE artifact_id = ? AND version = ?", (int(artifact_id), int(version)))
+    conn.executemany(
+        "INSERT OR IGNORE INTO hub_dependencies(artifact_id, version, dep_kind, dep_name, dep_version) VALUES(?, ?, ?, ?, ?)",
+        [(int(artifact_id), int(version), *dep) for dep in _artifact_dependency_paths(content)],
+    )
+
+
+def _split_artifact_contents(conn: sqlite3.Connection) -> None:
+    """Move alpha_content from hub_artifacts rows into hub_artifact_contents (existing DBs)."""
+    # Older versions of these read hub_artifacts.alpha_content, which blocks DROP COLUMN; the
+    # _ensure_*_schema helpers recreate the ones still needed. The FTS and dependency rows stay valid.
+    for trigger in (
+        "trg_hub_artifacts_fts_insert",
+        "trg_hub_artifacts_fts_update",
+        "trg_hub_dependencies_alpha_insert",
+        "trg_hub_dependencies_alpha_update",
+    ):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO hub_artifact_contents(artifact_id, alpha_content)
+        SELECT id, alpha_content FROM hub_artifacts WHERE alpha_content != ''
+        """
+    )
+    if sqlite3.sqlite_version_info >= (3, 35, 0):
+        conn.execute("ALTER TABLE hub_artifacts DROP COLUMN alpha_content")
+    else:
+        # No DROP COLUMN: leave the column empty (and unread) so rows still shrink.
+        conn.execute("UPDATE hub_artifacts SET alpha_content = '' WHERE alpha_content != ''")
+
+
+def _hub_recount_artifact_stats(conn: sqlite3.Connection) -> None:
+    """Recompute the denormalised counters from scratch (after adding them to an existing DB)."""
+    conn.execute(
+        """
+        UPDATE hub_artifacts SET
+            votes_count = (SELECT COUNT(*) FROM hub_votes WHERE artifact_id = hub_artifacts.id),
+            views_count = (SELECT COUNT(*) FROM hub_map_views WHERE artifact_id = hub_artifacts.id)
+        """
+    )
+
+
 def _hub_ensure_user(conn: sqlite3.Connection, username: str) -> sqlite3.Row:
     cleaned = str(username or "").strip().lower()
     username = _normalize_hub_user(username, allow_reserved=(cleaned in (GUEST_USERNAME, ANONYMOUS_USERNAME)))
@@ -950,8 +1694,8 @@ def _hub_get_artifact(conn: sqlite3.Connection, username: str, kind: str, name:
     return conn.execute(
         """
         SELECT
-            a.id, a.user_id, a.kind, a.name, a.featured, a.alpha_content, a.alpha_metadata, a.created_at, a.updated_at,
-            u.username
+            a.id, a.user_id, a.kind, a.name, a.featured, a.alpha_metadata, a.alpha_content_hash,
+            a.created_at, a.updated_at, u.username
         FROM hub_artifacts a
         JOIN hub_users u ON u.id = a.user_id
         WHERE u.username = ? AND a.kind = ? AND a.name = ?
@@ -967,8 +1711,8 @@ def _hub_get_artifact_by_name(conn: sqlite3.Connection, kind: str, name: str) ->
     return conn.execute(
         """
         SELECT
-            a.id, a.user_id, a.kind, a.name, a.featured, a.alpha_content, a.alpha_metadata, a.created_at, a.updated_at,
-            u.username
+            a.id, a.user_id, a.kind, a.name, a.featured, a.alpha_metadata, a.alpha_content_hash,
+            a.created_at, a.updated_at, u.username
         FROM hub_artifacts a
         JOIN hub_users u ON u.id = a.user_id
         WHERE a.kind = ? AND a.name = ?
@@ -977,17 +1721,200 @@ def _hub_get_artifact_by_name(conn: sqlite3.Connection, kind: str, name: str) ->
     ).fetchone()
 
 
+def _hub_alpha_content(conn: sqlite3.Connection, artifact_id: int) -> str:
+    """Alpha content for an artifact row from the lean lookups above."""
+    row = conn.execute(
+        "SELECT alpha_content FROM hub_artifact_contents WHERE artifact_id = ?",
+        (int(artifact_id),),
+    ).fetchone()
+    return (row["alpha_content"] if row is not None else "") or ""
+
+
+def _hub_set_alpha_content(conn: sqlite3.Connection, artifact_id: int, content: str) -> None:
+    # The stored hash doubles as the change check: unchanged content is not rewritten, and its
+    # FTS territories and dependency edges are not recomputed either.
+    content = content or ""
+    content_hash = _sha256_text(content)
+    changed = conn.execute(
+        "UPDATE hub_artifacts SET alpha_content_hash = ? WHERE id = ? AND alpha_content_hash != ?",
+        (content_hash, int(artifact_id), content_hash),
+    ).rowcount
+    if changed:
+        conn.execute(
+            """
+            INSERT INTO hub_artifact_contents(artifact_id, alpha_content) VALUES(?, ?)
+            ON CONFLICT(artifact_id) DO UPDATE SET alpha_content = excluded.alpha_content
+            """,
+            (int(artifact_id), content),
+        )
+        conn.execute(
+            "UPDATE hub_artifacts_fts SET territories = ? WHERE rowid = ?",
+            (_artifact_territory_names(content), int(artifact_id)),
+        )
+        _hub_set_dependencies(conn, artifact_id, 0, content)
+
+
+def _parse_xatrahub_path(path: str) -> Dict[str, Any]:
+    raw = str(path or "").strip()
+    if not raw:
+        raise ValueError("xatrahub path is empty")
+    if raw.startswith("xatrahub("):
+        raise ValueError("xatrahub path must be a path string, not xatrahub(...)")
+    cleaned = raw.strip().strip('"').strip("'")
+    parts = [p for p in cleaned.split("/") if p]
+    # New format: /kind/name[/version]  (2-3 parts, kind is first)
+    if len(parts) >= 2 and parts[0].lower() in HUB_KINDS:
+        kind = _normalize_hub_kind(parts[0])
+        name = _normalize_hub_name(parts[1])
+        version = "alpha"
+        if len(parts) >= 3 and parts[2]:
+            version = parts[2].strip()
+        return {"username": None, "kind": kind, "name": name, "version": version}
+    # Old format: /username/kind/name[/version]  (3-4 parts)
+    if len(parts) < 3:
+        raise ValueError("xatrahub path must be /{kind}/name[/version] or /username/{kind}/name[/version]")
+    username = _normalize_hub_user(parts[0])
+    kind = _normalize_hub_kind(parts[1])
+    name = _normalize_hub_name(parts[2])
+    version = "alpha"
+    if len(parts) >= 4 and parts[3]:
+        version = parts[3].strip()
+    return {"username": username, "kind": kind, "name": name, "version": version}
+
+
+def _python_value(node: ast.AST):
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.List):
+        return [_python_value(el) for el in node.elts]
+    if isinstance(node, ast.Tuple):
+        return [_python_value(el) for el in node.elts]
+    if isinstance(node, ast.Dict):
+        return {_python_value(k): _python_value(v) for k, v in zip(node.keys, node.values)}
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant):
+        return -node.operand.value
+    if isinstance(node, ast.Name):
+        if node.id == "None":
+            return None
+        if node.id == "True":
+            return True
+        if node.id == "False":
+            return False
+    return None
+
+
+def _call_name(node: ast.AST) -> Optional[str]:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = _call_name(node.value)
+        return f"{base}.{node.attr}" if base else node.attr
+    return None
+
+
+def _parse_imports_code_calls(imports_code: str) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    if not isinstance(imports_code, str) or not imports_code.strip():
+        return out
+    try:
+        tree = ast.parse(imports_code)
+    except Exception:
+        return out
+    for stmt in tree.body:
+        alias: Optional[str] = None
+        call: Optional[ast.Call] = None
+        if isinstance(stmt, ast.Assign):
+            if len(stmt.targets) != 1 or not isinstance(stmt.targets[0], ast.Name):
+                continue
+            alias = stmt.targets[0].id
+            if isinstance(stmt.value, ast.Call):
+                call = stmt.value
+        elif isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call):
+            call = stmt.value
+        if call is None:
+            continue
+        if _call_name(call.func) != "xatrahub":
+            continue
+        if not call.args:
+            continue
+        path_val = _python_value(call.args[0])
+        if not isinstance(path_val, str) or not path_val.strip():
+            continue
+        kwargs = {kw.arg: kw.value for kw in call.keywords if kw.arg}
+        filter_only_val = _python_value(kwargs.get("filter_only")) if "filter_only" in kwargs else None
+        filter_not_val = _python_value(kwargs.get("filter_not")) if "filter_not" in kwargs else None
+        filter_only = [str(x) for x in filter_only_val] if isinstance(filter_only_val, list) else None
+        filter_not = [str(x) for x in filter_not_val] if isinstance(filter_not_val, list) else None
+        out.append({
+            "alias": alias if isinstance(alias, str) and alias.strip() else None,
+            "path": path_val.strip(),
+            "filter_only": filter_only,
+            "filter_not": filter_not,
+        })
+    return out
+
+
+# Content fields that may hold xatrahub(...) imports; project.* mirrors them for the builder.
+_XATRAHUB_CODE_KEYS = ("imports_code", "runtime_imports_code", "map_code", "predefined_code", "runtime_code", "theme_code", "code")
+_XATRAHUB_PROJECT_CODE_KEYS = ("importsCode", "runtimeImportsCode", "predefinedCode", "themeCode", "runtimeCode")
+
+
+def _xatrahub_dependency_key(path: Any) -> Optional[Tuple[str, str, str]]:
+    """(kind, name, version) an xatrahub path points at, or None if it can never resolve."""
+    try:
+        parsed = _parse_xatrahub_path(str(path))
+    except (ValueError, HTTPException):
+        return None
+    version = str(parsed["version"]).strip().lower()
+    if version != "alpha":
+        if not version.isdigit():
+            return None
+        version = str(int(version))
+    return (parsed["kind"], parsed["name"], version)
+
+
+def _artifact_dependency_paths(content: Optional[str]) -> List[Tuple[str, str, str]]:
+    """(kind, name, version) for each xatrahub import in artifact content.
+
+    Malformed content has no edges rather than failing the write that stores it.
+    """
+    try:
+        parsed = _json_parse(content, None)
+        if isinstance(parsed, dict):
+            sources = [parsed.get(key) for key in _XATRAHUB_CODE_KEYS]
+            project = parsed.get("project")
+            if isinstance(project, dict):
+                sources.extend(project.get(key) for key in _XATRAHUB_PROJECT_CODE_KEYS)
+        else:
+            sources = [content]
+        deps: Dict[Tuple[str, str, str], None] = {}
+        for source in sources:
+            for call in _parse_imports_code_calls(source):
+                key = _xatrahub_dependency_key(call["path"])
+                if key is not None:
+                    deps[key] = None
+        return list(deps)
+    except Exception:
+        return []
+
+
 def _update_xatrahub_paths_in_code(text: str, rename_map: Dict[tuple, str]) -> str:
-    """Replace old /username/kind/name[/version] xatrahub paths with new /kind/name[/version] format."""
+    """Rewrite renamed xatrahub paths to the /kind/name[/version] format.
+
+    rename_map keys are (username, kind, old_name) for /username/kind/name paths and
+    (None, kind, old_name) for paths already in the new format.
+    """
     if not text:
         return text or ""
     pattern = re.compile(r'(xatrahub\s*\(\s*["\'])(/[^"\']+)(["\'])')
     def sub(m):
         path = m.group(2).strip()
         parts = [p for p in path.split('/') if p]
+        if parts and parts[0].lower() in HUB_KINDS:
+            parts = [None, *parts]
         if len(parts) < 3:
             return m.group(0)
-        username = parts[0].lower()
+        username = parts[0].lower() if parts[0] else None
         kind = parts[1].lower()
         old_name = parts[2]
         version = parts[3] if len(parts) > 3 else None
@@ -1063,6 +1990,8 @@ def _migrate_to_global_names(conn: sqlite3.Connection) -> None:
             alpha_metadata TEXT NOT NULL DEFAULT '{}',
             created_at TEXT NOT NULL,
             updated_at TEXT NOT NULL,
+            votes_count INTEGER NOT NULL DEFAULT 0,
+            views_count INTEGER NOT NULL DEFAULT 0,
             UNIQUE(kind, name)
         )
     """)
@@ -1086,12 +2015,14 @@ def _migrate_to_global_names(conn: sqlite3.Connection) -> None:
                 art['updated_at'],
             )
         )
-    # Update version content
-    for ver in conn.execute("SELECT id, content FROM hub_artifact_versions").fetchall():
-        if ver['content']:
-            new_content = _update_content_paths(ver['content'], rename_map)
-            if new_content != ver['content']:
-                conn.execute("UPDATE hub_artifact_versions SET content = ? WHERE id = ?", (new_content, ver['id']))
+    # Update version content (databases this old still keep it inline; fresh ones have no versions yet)
+    version_cols = {row["name"] for row in conn.execute("PRAGMA table_info(hub_artifact_versions)").fetchall()}
+    if "content" in version_cols:
+        for ver in conn.execute("SELECT id, content FROM hub_artifact_versions").fetchall():
+            if ver['content']:
+                new_content = _update_content_paths(ver['content'], rename_map)
+                if new_content != ver['content']:
+                    conn.execute("UPDATE hub_artifact_versions SET content = ? WHERE id = ?", (new_content, ver['id']))
     # Update drafts
     for draft in conn.execute("SELECT id, project_json FROM hub_drafts").fetchall():
         if draft['project_json']:
@@ -1111,12 +2042,14 @@ def _migrate_to_global_names(conn: sqlite3.Connection) -> None:
             if modified:
                 conn.execute("UPDATE hub_drafts SET project_json = ? WHERE id = ?",
                              (json.dumps(parsed, ensure_ascii=False), draft['id']))
-    # Swap tables
+    # Swap tables (the search index is rebuilt from the new table by _ensure_artifact_search_schema)
+    conn.execute("DROP TABLE IF EXISTS hub_artifacts_fts")
     conn.execute("DROP TABLE hub_artifacts")
     conn.execute("ALTER TABLE hub_artifacts_new RENAME TO hub_artifacts")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_hub_artifacts_lookup ON hub_artifacts(user_id, kind, name)")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_hub_artifacts_kind_name ON hub_artifacts(kind, name)")
     conn.execute("PRAGMA foreign_keys = ON")
+    _hub_recount_artifact_stats(conn)
     print(f"[xatra] Migrated hub_artifacts to globally-unique names (UNIQUE(kind, name)); renamed {len(id_to_new)} artifacts.")
 
 
@@ -1159,7 +2092,7 @@ def _hub_upsert_alpha(
         raise HTTPException(status_code=400, detail=f"Map name '{name}' is reserved")
     user = _hub_ensure_user(conn, username)
     now = _utc_now_iso()
-    metadata_json = _json_text(_sanitize_artifact_metadata(kind, metadata))
+    metadata_json = _json_text(_externalize_thumbnail(conn, _sanitize_artifact_metadata(kind, metadata)))
     # Check for global name conflict (names are globally unique per kind after migration)
     existing_global = conn.execute(
         "SELECT id, user_id FROM hub_artifacts WHERE kind = ? AND name = ?", (kind, name)
@@ -1169,25 +2102,27 @@ def _hub_upsert_alpha(
     conn.execute(
         """
         INSERT OR IGNORE INTO hub_artifacts(
-            user_id, kind, name, alpha_content, alpha_metadata, created_at, updated_at
-        ) VALUES(?, ?, ?, ?, ?, ?, ?)
+            user_id, kind, name, alpha_metadata, created_at, updated_at
+        ) VALUES(?, ?, ?, ?, ?, ?)
         """,
-        (user["id"], kind, name, content or "", metadata_json, now, now),
+        (user["id"], kind, name, metadata_json, now, now),
     )
     conn.execute(
         """
         UPDATE hub_artifacts
-        SET alpha_content = ?, alpha_metadata = ?, updated_at = ?
+        SET alpha_metadata = ?, updated_at = ?
         WHERE kind = ? AND name = ?
         """,
-        (content or "", metadata_json, now, kind, name),
+        (metadata_json, now, kind, name),
     )
     row = _hub_get_artifact(conn, username, kind, name)
     if row is None:
         raise HTTPException(status_code=500, detail="Failed to persist artifact")
+    _hub_set_alpha_content(conn, row["id"], content or "")
     if kind == "map":
         _ensure_owner_vote(conn, row["id"], row["user_id"])
-    return row
+    # Re-read so the returned row carries the new alpha_content_hash.
+    return _hub_get_artifact(conn, username, kind, name)
 
 
 def _hub_publish_version(
@@ -1198,36 +2133,75 @@ def _hub_publish_version(
     content: str,
     metadata: Any,
 ) -> Dict[str, Any]:
+    metadata = _externalize_thumbnail(conn, _sanitize_artifact_metadata(kind, metadata))
     artifact = _hub_upsert_alpha(conn, username, kind, name, content, metadata)
-    next_version = conn.execute(
-        "SELECT COALESCE(MAX(version), 0) + 1 AS v FROM hub_artifact_versions WHERE artifact_id = ?",
+    previous = conn.execute(
+        "SELECT version, content_hash FROM hub_artifact_versions WHERE artifact_id = ? ORDER BY version DESC LIMIT 1",
         (artifact["id"],),
-    ).fetchone()["v"]
+    ).fetchone()
+    next_version = int(previous["version"]) + 1 if previous is not None else 1
+    content_hash = _store_version_blob(conn, content, base_hash=previous["content_hash"] if previous is not None else None)
     now = _utc_now_iso()
-    metadata_json = _json_text(_sanitize_artifact_metadata(kind, metadata))
+    metadata_json = _json_text(metadata)
     conn.execute(
         """
-        INSERT INTO hub_artifact_versions(artifact_id, version, content, metadata, created_at)
+        INSERT INTO hub_artifact_versions(artifact_id, version, content_hash, metadata, created_at)
         VALUES(?, ?, ?, ?, ?)
         """,
-        (artifact["id"], int(next_version), content or "", metadata_json, now),
+        (artifact["id"], next_version, content_hash, metadata_json, now),
     )
+    _hub_set_dependencies(conn, artifact["id"], next_version, content)
     conn.commit()
     return {"version": int(next_version), "created_at": now}
 
+
+def _hub_propagate_rename(conn: sqlite3.Connection, username: str, kind: str, old_name: str, new_name: str) -> None:
+    """Point importers' alpha xatrahub paths (and forks' forked_from) at a renamed artifact."""
+    rename_map = {
+        (None, kind, old_name): new_name,
+        (str(username).lower(), kind, old_name): new_name,
+    }
+    importer_rows = conn.execute(
+        """
+        SELECT c.artifact_id, c.alpha_content
+        FROM hub_artifact_contents c
+        WHERE c.artifact_id IN (
+            SELECT artifact_id FROM hub_dependencies
+            WHERE dep_kind = ? AND dep_name = ? AND version = 0
+        )
+        """,
+        (kind, old_name),
+    ).fetchall()
+    for row in importer_rows:
+        _hub_set_alpha_content(conn, row["artifact_id"], _update_content_paths(row["alpha_content"], rename_map))
+    if kind != "map":
+        return
+    for row in conn.execute(
+        "SELECT id, alpha_metadata FROM hub_artifacts WHERE forked_from = ?", (f"/{old_name}",)
+    ).fetchall():
+        meta = _artifact_metadata_dict(row["alpha_metadata"])
+        meta["forked_from"] = f"/{new_name}"
+        conn.execute("UPDATE hub_artifacts SET alpha_metadata = ? WHERE id = ?", (_json_text(meta), row["id"]))
+
 # GADM Indexing
 GADM_INDEX = []
 INDEX_BUILDING = False
 COUNTRY_LEVELS_INDEX = {}
 COUNTRY_SEARCH_INDEX = []
-
-def rebuild_country_indexes():
-    global COUNTRY_LEVELS_INDEX, COUNTRY_SEARCH_INDEX
-    # Called only from build_gadm_index which already holds _gadm_lock
+# Bumped whenever GADM_INDEX is replaced; GADM_SEARCH_INDEX is mapped per generation.
+GADM_INDEX_GENERATION = 0
+# Reported by /health; updated by build_gadm_index.
+GADM_INDEX_PROGRESS: Dict[str, Any] = {"state": "idle"}
+_gadm_installed_index_mtime: Optional[int] = None
+GADM_SEARCH_INDEX: Optional[Dict[str, Any]] = None
+GADM_SEARCH_LIMIT = 20
+
+def _country_indexes(entries: Sequence) -> Tuple[Dict[str, List[int]], List[Dict[str, Any]]]:
+    """(levels per country code, country search list) for an index's entries."""
     levels_map = {}
     names_map = {}
 
-    for item in GADM_INDEX:
+    for item in entries:
         gid = item.get("gid")
         if not gid:
             continue
@@ -1240,99 +2214,1227 @@ def rebuild_country_indexes():
         if country_name and country_code not in names_map:
             names_map[country_code] = country_name
 
-    COUNTRY_LEVELS_INDEX = {
+    country_levels = {
         code: sorted(list(levels))
         for code, levels in levels_map.items()
     }
-    COUNTRY_SEARCH_INDEX = sorted(
+    country_search = sorted(
         [
             {
                 "country_code": code,
                 "country": names_map.get(code, code),
                 "max_level": max(levels) if levels else 0,
             }
-            for code, levels in COUNTRY_LEVELS_INDEX.items()
+            for code, levels in country_levels.items()
         ],
         key=lambda x: x["country_code"],
     )
+    return country_levels, country_search
+
+
+def rebuild_country_indexes(
+    precomputed: Optional[Tuple[Dict[str, List[int]], List[Dict[str, Any]]]] = None,
+    search_index: Optional[Dict[str, Any]] = None,
+):
+    global COUNTRY_LEVELS_INDEX, COUNTRY_SEARCH_INDEX, GADM_INDEX_GENERATION, GADM_SEARCH_INDEX
+    # Called with _gadm_lock held, whenever GADM_INDEX is replaced.
+    GADM_INDEX_GENERATION += 1
+    GADM_SEARCH_INDEX = search_index
+    COUNTRY_LEVELS_INDEX, COUNTRY_SEARCH_INDEX = precomputed if precomputed is not None else _country_indexes(GADM_INDEX)
+    if _IS_GADM_INDEX_OWNER and isinstance(GADM_INDEX, _GadmIndexColumns):
+        _start_gadm_search_index_build(GADM_INDEX, GADM_INDEX_GENERATION, search_index)
+
+def _trigrams(text: str) -> set:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _fold_text(text: str) -> str:
+    """Casefold and strip diacritics, so "Sävasa" and "savasa" compare equal."""
+    if text.isascii():
+        return text.casefold()
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+# Fuzzy word lookup (SymSpell-style symmetric deletes). Two words within d edits share a string
+# reachable by at most d deletes from each, so every vocabulary word is keyed by itself and its
+# deletes up to the largest distance any matching query may use, and a query word looks up its
+# own deletes up to its allowed distance. Words sharing a key are verified with a bounded edit
+# distance. Keys are stored as sorted CRC-32s rather than strings; unlike hash() these are the
+# same in every process, so the table can be written once and mapped by all of them.
+_FUZZY_WORD_RE = re.compile(r"[^\W_]+")
+
+
+def _fuzzy_max_distance(word: str) -> int:
+    if len(word) < 4:
+        return 0
+    return 1 if len(word) < 8 else 2
+
+
+def _fuzzy_index_depth(word: str) -> int:
+    """Deletes to index for a vocabulary word: the most edits allowed to any query it can match.
+
+    Queries of 4+ characters allow one edit and so reach words of 3+; queries of 8+ allow two and
+    reach words of 6+.
+    """
+    if len(word) < 3:
+        return 0
+    return 1 if len(word) < 6 else 2
+
+
+def _fuzzy_keys(word: str, depth: int = 1) -> set:
+    keys = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        keys |= frontier
+    return keys
+
+
+def _edit_distance(a: str, b: str, max_dist: int) -> int:
+    """Optimal string alignment distance, or ``max_dist + 1`` once it is exceeded."""
+    if abs(len(a) - len(b)) > max_dist:
+        return max_dist + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            v = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                v = min(v, prev2[j - 2] + 1)
+            cur[j] = v
+        # A transposition can reach back two rows, so both must be out of range.
+        if min(cur) > max_dist and min(prev) > max_dist:
+            return max_dist + 1
+        prev2, prev = prev, cur
+    return min(prev[-1], max_dist + 1)
+
+
+def _fuzzy_key_hash(key: str) -> int:
+    return zlib.crc32(key.encode("utf-8"))
+
+
+def _build_fuzzy_index(words: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """(sorted key hashes, word id per key) over a vocabulary."""
+    keys = array.array("I")
+    key_words = array.array("i")
+    for wid, word in enumerate(words):
+        depth = _fuzzy_index_depth(word)
+        if depth == 0:
+            continue
+        for key in _fuzzy_keys(word, depth):
+            keys.append(_fuzzy_key_hash(key))
+            key_words.append(wid)
+    keys_np = np.frombuffer(keys, dtype=np.uint32) if keys else np.zeros(0, dtype=np.uint32)
+    key_words_np = np.frombuffer(key_words, dtype=np.int32) if key_words else _EMPTY_IDS
+    order = np.argsort(keys_np, kind="stable")
+    return keys_np[order], key_words_np[order]
+
+
+def _fuzzy_lookup(index: Dict[str, Any], word: str) -> List[Tuple[int, int]]:
+    """(word id, distance) for vocabulary words within the word's allowed distance."""
+    out: Dict[int, int] = {}
+    keys, key_words, words = index["keys"], index["key_words"], index["words"]
+    # The vocabulary is sorted, so a word's id is its position.
+    exact = bisect.bisect_left(words, word)
+    if exact < len(words) and words[exact] == word:
+        out[exact] = 0
+    max_dist = _fuzzy_max_distance(word)
+    if max_dist:
+        checked = set(out)
+        for key in _fuzzy_keys(word, max_dist):
+            h = _fuzzy_key_hash(key)
+            lo = int(np.searchsorted(keys, h, side="left"))
+            hi = int(np.searchsorted(keys, h, side="right"))
+            for wid in key_words[lo:hi].tolist():
+                if wid in checked:
+                    continue
+                checked.add(wid)
+                dist = _edit_distance(word, words[wid], max_dist)
+                if dist <= max_dist:
+                    out[wid] = dist
+    return list(out.items())
+
+
+def _gadm_parent_gid(gid: str) -> str:
+    return gid.rsplit(".", 1)[0] if "." in gid else ""
+
+
+def _gadm_gid_sort_key(gid: str) -> Tuple[Any, ...]:
+    # IND.2 before IND.10
+    return tuple((0, int(seg), "") if seg.isdigit() else (1, 0, seg) for seg in gid.split("."))
+
+
+def _gadm_search_sections(entries: Sequence) -> List[Tuple[str, bytes]]:
+    """Sections of the search file for one installed GADM index (see _open_gadm_search_file).
+
+    Sorted folded keys (see _fold_text) answer exact/prefix tiers by bisection; trigram
+    postings (sorted int32 arrays) narrow substring tiers to candidates before the final
+    ``in`` check, and a fuzzy word index serves misspelt queries. The children postings
+    back the /gadm hierarchy endpoints.
+    """
+    n = len(entries)
+    raw_gids: List[str] = []
+    names: List[str] = []
+    varnames: List[str] = []
+    countries: List[str] = []
+    for item in entries:
+        raw_gids.append(str(item.get("gid") or ""))
+        names.append(_fold_text(str(item.get("name") or "")))
+        varnames.append(_fold_text(str(item.get("varname") or "")))
+        countries.append(_fold_text(str(item.get("country") or "")))
+    gids = [g.casefold() for g in raw_gids]
+
+    name_trigrams: Dict[str, List[int]] = defaultdict(list)
+    varname_trigrams: Dict[str, List[int]] = defaultdict(list)
+    by_country: Dict[str, List[int]] = defaultdict(list)
+    seen_gids = set()
+    children: Dict[str, List[int]] = defaultdict(list)
+    word_postings: Dict[str, List[int]] = defaultdict(list)
+    for i in range(n):
+        for tg in _trigrams(names[i]):
+            name_trigrams[tg].append(i)
+        for tg in _trigrams(varnames[i]):
+            varname_trigrams[tg].append(i)
+        if countries[i]:
+            by_country[countries[i]].append(i)
+        for word in set(_FUZZY_WORD_RE.findall(names[i])) | set(_FUZZY_WORD_RE.findall(varnames[i])):
+            word_postings[word].append(i)
+        if raw_gids[i] and raw_gids[i] not in seen_gids:
+            seen_gids.add(raw_gids[i])
+            children[_gadm_parent_gid(raw_gids[i])].append(i)
+    del seen_gids
+
+    vocabulary = sorted(word_postings)
+    word_offsets = np.zeros(len(vocabulary) + 1, dtype="<i8")
+    word_offsets[1:] = np.cumsum([len(word_postings[w]) for w in vocabulary])
+    word_entries = np.fromiter(
+        (i for w in vocabulary for i in word_postings[w]), dtype="<i4", count=int(word_offsets[-1])
+    )
+    del word_postings
+    fuzzy_keys, fuzzy_words = _build_fuzzy_index(vocabulary)
+
+    # Stable sorts, so equal keys keep index order (the exact tiers' tie-break).
+    gid_order = sorted(range(n), key=gids.__getitem__)
+    name_order = sorted(range(n), key=names.__getitem__)
+    return [
+        *_string_sections("gid", gids),
+        *_string_sections("name", names),
+        *_string_sections("varname", varnames),
+        ("gid_len", np.fromiter((len(g) for g in gids), dtype="<i4", count=n).tobytes()),
+        *_string_sections("gid_sorted", [gids[i] for i in gid_order]),
+        ("gid_order", np.asarray(gid_order, dtype="<i4").tobytes()),
+        *_string_sections("name_sorted", [names[i] for i in name_order]),
+        ("name_order", np.asarray(name_order, dtype="<i4").tobytes()),
+        *_postings_sections("name_trigrams", name_trigrams),
+        *_postings_sections("varname_trigrams", varname_trigrams),
+        *_postings_sections("country_groups", by_country),
+        # Name/varname words: fuzzy lookup plus CSR postings (word id -> entry ids).
+        *_string_sections("words", vocabulary),
+        ("word_offsets", word_offsets.tobytes()),
+        ("word_entries", word_entries.tobytes()),
+        ("fuzzy_keys", fuzzy_keys.astype("<u4").tobytes()),
+        ("fuzzy_words", fuzzy_words.astype("<i4").tobytes()),
+        # Hierarchy: parent gid ("" for countries) -> child ids in gid order.
+        *_postings_sections("children", {
+            parent: sorted(ids, key=lambda i: _gadm_gid_sort_key(raw_gids[i])) for parent, ids in children.items()
+        }),
+    ]
+
+
+def _start_gadm_search_index_build(
+    columns: "_GadmIndexColumns", generation: int, search_index: Optional[Dict[str, Any]] = None
+) -> None:
+    """Map (writing it first if missing or stale) the search file for an installed index, then
+    export its static shards."""
+    def _run():
+        global GADM_SEARCH_INDEX
+        index = search_index
+        if index is None:
+            try:
+                with _gadm_index_build_lock(report=False):
+                    with _gadm_lock:
+                        if GADM_INDEX_GENERATION != generation:
+                            return
+                    index = _open_gadm_search_file(GADM_SEARCH_INDEX_PATH, columns)
+                    if index is None:
+                        _write_gadm_search_file(GADM_SEARCH_INDEX_PATH, columns)
+                        index = _open_gadm_search_file(GADM_SEARCH_INDEX_PATH, columns)
+            except Exception as e:
+                print(f"[xatra] Warning: failed to build GADM search index: {e}", file=sys.stderr)
+                return
+            if index is None:
+                return
+        with _gadm_lock:
+            if GADM_INDEX_GENERATION != generation:
+                return
+            GADM_SEARCH_INDEX = index
+            countries = list(COUNTRY_SEARCH_INDEX)
+        try:
+            _export_gadm_search_shards(index, countries, columns.build)
+        except Exception as e:
+            print(f"[xatra] Warning: failed to export GADM search shards: {e}", file=sys.stderr)
+
+    threading.Thread(target=_run, daemon=True).start()
+
+
+# Static search shards: the prefix tiers of /search/gadm (gid ==, gid prefix, name ==, name
+# prefix) split by the first GADM_SEARCH_SHARD_CHARS folded characters of gid and name, plus
+# the country list, written once per installed index as immutable JSON files. Autocomplete can
+# then be answered from nginx or the browser cache; a query whose prefix tiers can't fill a
+# result page falls back to /search/gadm for the substring and fuzzy tiers.
+GADM_SEARCH_SHARD_CHARS = 2
+GADM_SEARCH_SHARD_KEEP = 2
+_SEARCH_SHARD_VERSION_RE = re.compile(r"^[0-9a-f]+$")
+_SEARCH_SHARD_NAME_RE = re.compile(r"^(?:[0-9a-f]+(?:-[0-9a-f]+)*|countries)\.json$")
+
+
+def _search_shard_name(prefix: str) -> str:
+    return "-".join(f"{ord(ch):x}" for ch in prefix) + ".json"
+
+
+def _export_gadm_search_shards(search_index: Dict[str, Any], countries: List[Dict[str, Any]], version: str) -> None:
+    root = GADM_SEARCH_SHARD_DIR
+    target = root / version
+    if not target.exists():
+        shard_ids: Dict[str, List[int]] = defaultdict(list)
+        gids, names = search_index["gids"], search_index["names"]
+        for i in range(len(gids)):
+            for key in {gids[i][:GADM_SEARCH_SHARD_CHARS], names[i][:GADM_SEARCH_SHARD_CHARS]}:
+                if len(key) == GADM_SEARCH_SHARD_CHARS:
+                    shard_ids[key].append(i)
+        tmp = root / f".{version}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        entries = search_index["entries"]
+        for key, ids in shard_ids.items():
+            # [folded gid, folded name, record] in index order, the server's final tie-break.
+            rows = [[gids[i], names[i], entries[i]] for i in ids]
+            (tmp / _search_shard_name(key)).write_text(json.dumps(rows, separators=(",", ":")), encoding="utf-8")
+        (tmp / "countries.json").write_text(json.dumps(countries, separators=(",", ":")), encoding="utf-8")
+        (tmp / "shards.json").write_text(json.dumps(sorted(_search_shard_name(k) for k in shard_ids)), encoding="utf-8")
+        try:
+            os.replace(tmp, target)
+        except OSError:
+            # Another process exported this version first.
+            shutil.rmtree(tmp, ignore_errors=True)
+    shards = json.loads((target / "shards.json").read_text(encoding="utf-8"))
+    manifest = {"version": version, "prefix_chars": GADM_SEARCH_SHARD_CHARS, "limit": GADM_SEARCH_LIMIT, "shards": shards}
+    tmp_manifest = root / f"manifest.json.{os.getpid()}.tmp"
+    tmp_manifest.write_text(json.dumps(manifest, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp_manifest, root / "manifest.json")
+    stale = sorted(
+        (d for d in root.iterdir() if d.is_dir() and _SEARCH_SHARD_VERSION_RE.match(d.name) and d.name != version),
+        key=lambda d: d.stat().st_mtime,
+    )
+    # Clients holding the previous manifest may still ask for its shards for a while.
+    for d in stale[:max(0, len(stale) - (GADM_SEARCH_SHARD_KEEP - 1))]:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+_EMPTY_IDS = np.zeros(0, dtype=np.int32)
+
+
+def _exact_ids(sorted_keys: Sequence[str], order: np.ndarray, q: str) -> np.ndarray:
+    lo = bisect.bisect_left(sorted_keys, q)
+    hi = bisect.bisect_right(sorted_keys, q, lo)
+    return order[lo:hi]
+
+
+def _prefix_ids(sorted_keys: Sequence[str], order: np.ndarray, q: str) -> np.ndarray:
+    lo = bisect.bisect_left(sorted_keys, q)
+    hi = bisect.bisect_left(sorted_keys, q + "\U0010ffff", lo)
+    return order[lo:hi]
+
+
+def _substring_ids(values: "_MappedStrings", trigrams: "_MappedPostings", q: str) -> np.ndarray:
+    if len(q) < 3:
+        # Too short for trigrams; one vectorised pass over the packed keys instead.
+        return values.containing(q)
+    postings = []
+    for tg in _trigrams(q):
+        ids = trigrams.get(tg)
+        if ids is None:
+            return _EMPTY_IDS
+        postings.append(ids)
+    postings.sort(key=len)
+    candidates = postings[0]
+    for ids in postings[1:]:
+        candidates = np.intersect1d(candidates, ids, assume_unique=True)
+        if not candidates.size:
+            return _EMPTY_IDS
+    return np.asarray([i for i in candidates.tolist() if q in values[i]], dtype=np.int32)
+
+
+GADM_FUZZY_SCORE = 20
+
+
+def _fuzzy_entry_ids(search_index: Dict[str, Any], q: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Entries whose name/varname words match every query word within its edit distance.
+
+    Scores start at GADM_FUZZY_SCORE and drop by 5 per edit summed over the query words.
+    """
+    q_words = _FUZZY_WORD_RE.findall(q)
+    if not q_words:
+        return _EMPTY_IDS, _EMPTY_IDS
+    offsets, postings = search_index["word_offsets"], search_index["word_entries"]
+    ids: Optional[np.ndarray] = None
+    dists = _EMPTY_IDS
+    for word in q_words:
+        matches = _fuzzy_lookup(search_index["words"], word)
+        if not matches:
+            return _EMPTY_IDS, _EMPTY_IDS
+        w_ids = np.concatenate([postings[offsets[wid]:offsets[wid + 1]] for wid, _ in matches])
+        w_dists = np.concatenate([
+            np.full(int(offsets[wid + 1] - offsets[wid]), d, dtype=np.int32) for wid, d in matches
+        ])
+        # Keep each entry's closest word.
+        order = np.lexsort((w_dists, w_ids))
+        w_ids, w_dists = w_ids[order], w_dists[order]
+        first = np.ones(w_ids.size, dtype=bool)
+        first[1:] = w_ids[1:] != w_ids[:-1]
+        w_ids, w_dists = w_ids[first], w_dists[first]
+        if ids is None:
+            ids, dists = w_ids, w_dists
+        else:
+            ids, a, b = np.intersect1d(ids, w_ids, assume_unique=True, return_indices=True)
+            dists = dists[a] + w_dists[b]
+        if not ids.size:
+            return _EMPTY_IDS, _EMPTY_IDS
+    return ids, np.maximum(GADM_FUZZY_SCORE - 5 * dists, 1).astype(np.int32)
+
+
+def _search_gadm_indexed(search_index: Dict[str, Any], q: str, limit: int) -> List[Dict[str, Any]]:
+    """Top-k over the same tiers as the linear scan in search_gadm.
+
+    An entry scores by the first rule it meets (gid ==, gid prefix, name ==, name prefix,
+    name substring, varname substring, country substring, fuzzy word match). Tiers are visited from the highest
+    score down and stop once ``limit`` entries are out of reach of every remaining tier.
+    """
+    gids = search_index["gids"]
+    seen = np.zeros(len(gids), dtype=bool)
+    found_ids: List[np.ndarray] = []
+    found_scores: List[np.ndarray] = []
+
+    def _take(ids: np.ndarray, scores: Any) -> None:
+        fresh = ~seen[ids]
+        ids = ids[fresh]
+        if not ids.size:
+            return
+        seen[ids] = True
+        found_ids.append(ids)
+        found_scores.append(scores[fresh] if isinstance(scores, np.ndarray) else np.full(ids.size, scores, dtype=np.int32))
+
+    name_exact_ids = _exact_ids(search_index["name_sorted"], search_index["name_order"], q)
+    tiers = [
+        (100, lambda: (_exact_ids(search_index["gid_sorted"], search_index["gid_order"], q), 100)),
+        # A gid prefix outranks an exact name in the rule order.
+        (90, lambda: (name_exact_ids, np.asarray([80 if gids[i].startswith(q) else 90 for i in name_exact_ids.tolist()], dtype=np.int32))),
+        (80, lambda: (_prefix_ids(search_index["gid_sorted"], search_index["gid_order"], q), 80)),
+        (70, lambda: (_prefix_ids(search_index["name_sorted"], search_index["name_order"], q), 70)),
+        (50, lambda: (_substring_ids(search_index["names"], search_index["name_trigrams"], q), 50)),
+        (40, lambda: (_substring_ids(search_index["varnames"], search_index["varname_trigrams"], q), 40)),
+        (30, lambda: (
+            np.concatenate([ids for country, ids in search_index["country_groups"].items() if q in country] or [_EMPTY_IDS]),
+            30,
+        )),
+        (GADM_FUZZY_SCORE, lambda: _fuzzy_entry_ids(search_index, q)),
+    ]
+    for pos, (_, fetch) in enumerate(tiers):
+        ids, scores = fetch()
+        _take(ids, scores)
+        next_score = tiers[pos + 1][0] if pos + 1 < len(tiers) else 0
+        if found_scores and int((np.concatenate(found_scores) > next_score).sum()) >= limit:
+            break
+    if not found_ids:
+        return []
+    ids = np.concatenate(found_ids)
+    scores = np.concatenate(found_scores)
+    # Higher score, then shorter gid, then index order (the linear scan's stable sort).
+    order = np.lexsort((ids, search_index["gid_len"][ids], -scores))[:limit]
+    entries = search_index["entries"]
+    return [entries[i] for i in ids[order].tolist()]
+
+# Columnar GADM index file, memory-mapped so every worker and forked render process shares
+# the same pages. Layout: magic, uint32 header length, JSON header (counts, country table,
+# precomputed country indexes, section offsets), then 8-byte aligned little-endian sections:
+# uint32 offsets (n + 1) + UTF-8 blob for gid/name/varname, uint16 country ids, int8 levels,
+# float64 geo rows (bbox, centroid, area; NaN when unknown) and a uint32 gid-sorted order.
+GADM_INDEX_MAGIC = b"XGADMIX1"
+_GADM_INDEX_STRING_COLUMNS = ("gid", "name", "varname")
+
+
+def _align8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def _string_sections(name: str, strings: Sequence[str]) -> List[Tuple[str, bytes]]:
+    """uint32 offsets (n + 1) and the UTF-8 blob for one string column."""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype="<u4")
+    if encoded:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+    return [(f"{name}.offsets", offsets.tobytes()), (f"{name}.data", b"".join(encoded))]
+
+
+def _postings_sections(name: str, table: Dict[str, List[int]]) -> List[Tuple[str, bytes]]:
+    """Sorted keys plus CSR postings (int64 offsets, int32 ids) for a key -> ids table."""
+    keys = sorted(table)
+    offsets = np.zeros(len(keys) + 1, dtype="<i8")
+    offsets[1:] = np.cumsum([len(table[k]) for k in keys])
+    ids = np.fromiter((i for k in keys for i in table[k]), dtype="<i4", count=int(offsets[-1]))
+    return [*_string_sections(f"{name}.keys", keys), (f"{name}.offsets", offsets.tobytes()), (f"{name}.ids", ids.tobytes())]
+
+
+def _write_section_file(path: str, magic: bytes, header: Dict[str, Any], blobs: List[Tuple[str, bytes]]) -> None:
+    """Magic, uint32 header length, JSON header (with section offsets), 8-byte aligned sections."""
+    body = bytearray()
+    sections: Dict[str, List[int]] = {}
+    for name, blob in blobs:
+        body.extend(b"\0" * (_align8(len(body)) - len(body)))
+        sections[name] = [len(body), len(blob)]
+        body.extend(blob)
+    header_bytes = json.dumps({**header, "sections": sections}, separators=(",", ":")).encode("utf-8")
+    prefix = magic + struct.pack("<I", len(header_bytes)) + header_bytes
+    prefix += b"\0" * (_align8(len(prefix)) - len(prefix))
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as fh:
+        fh.write(prefix)
+        fh.write(body)
+    os.replace(tmp_path, path)
+
+
+class _MappedStrings(Sequence):
+    """One string column of a mapped section file; strings are decoded on access."""
+
+    def __init__(self, buf: Any, offsets: np.ndarray, blob_start: int):
+        self._buf = buf
+        self._offsets = offsets
+        self._blob_start = blob_start
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._buf[self._blob_start + start:self._blob_start + end].decode("utf-8")
+
+    def containing(self, q: str) -> np.ndarray:
+        """Ids of the strings containing ``q``, by one vectorised pass over the blob."""
+        needle = np.frombuffer(q.encode("utf-8"), dtype=np.uint8)
+        blob = np.frombuffer(self._buf, dtype=np.uint8, count=int(self._offsets[-1]), offset=self._blob_start)
+        span = blob.size - needle.size + 1
+        if not needle.size or span <= 0:
+            return _EMPTY_IDS
+        hits = blob[:span] == needle[0]
+        for k in range(1, needle.size):
+            hits &= blob[k:k + span] == needle[k]
+        starts = np.flatnonzero(hits)
+        ids = np.searchsorted(self._offsets, starts, side="right") - 1
+        # Drop matches that run on into the next string.
+        ids = ids[starts + needle.size <= self._offsets[ids + 1]]
+        return np.unique(ids).astype(np.int32)
+
+
+class _MappedPostings:
+    """Sorted string keys -> int32 id arrays from a mapped section file, found by bisection."""
+
+    def __init__(self, keys: _MappedStrings, offsets: np.ndarray, ids: np.ndarray):
+        self._keys = keys
+        self._offsets = offsets
+        self._ids = ids
+
+    def _slot(self, key: str) -> Optional[int]:
+        i = bisect.bisect_left(self._keys, key)
+        return i if i < len(self._keys) and self._keys[i] == key else None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        i = self._slot(key)
+        return default if i is None else self._ids[self._offsets[i]:self._offsets[i + 1]]
+
+    def __contains__(self, key: str) -> bool:
+        return self._slot(key) is not None
+
+    def items(self):
+        for i in range(len(self._keys)):
+            yield self._keys[i], self._ids[self._offsets[i]:self._offsets[i + 1]]
+
+
+class _SectionFile:
+    """A memory-mapped file written by _write_section_file."""
+
+    def __init__(self, path: str, magic: bytes):
+        with open(path, "rb") as fh:
+            self.buf = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            self.mtime_ns = os.fstat(fh.fileno()).st_mtime_ns
+        if self.buf[:len(magic)] != magic:
+            raise ValueError(f"not a {magic.decode('ascii')} file")
+        (header_len,) = struct.unpack_from("<I", self.buf, len(magic))
+        header_start = len(magic) + 4
+        self.header = json.loads(self.buf[header_start:header_start + header_len].decode("utf-8"))
+        self._sections = self.header["sections"]
+        self._data_start = _align8(header_start + header_len)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._sections
+
+    def array(self, name: str, dtype: str) -> np.ndarray:
+        offset, nbytes = self._sections[name]
+        return np.frombuffer(self.buf, dtype=dtype, count=nbytes // np.dtype(dtype).itemsize, offset=self._data_start + offset)
+
+    def strings(self, name: str) -> _MappedStrings:
+        return _MappedStrings(self.buf, self.array(f"{name}.offsets", "<u4"), self._data_start + self._sections[f"{name}.data"][0])
+
+    def postings(self, name: str) -> _MappedPostings:
+        return _MappedPostings(self.strings(f"{name}.keys"), self.array(f"{name}.offsets", "<i8"), self.array(f"{name}.ids", "<i4"))
+
+
+GADM_GEO_FIELDS = 7  # min_lng, min_lat, max_lng, max_lat, centroid_lng, centroid_lat, area_km2
+
+
+def _gadm_entry_geo(item: Dict[str, Any]) -> Optional[List[float]]:
+    bbox, centroid = item.get("bbox"), item.get("centroid")
+    if not bbox or not centroid:
+        return None
+    return [*bbox, *centroid, float(item.get("area_km2") or 0.0)]
+
+
+class _GadmIndexColumns(Sequence):
+    """Read-only GADM_INDEX backed by a mapped index file; items are built on access."""
+
+    def __init__(self, sections: _SectionFile):
+        header = sections.header
+        self._count = int(header["count"])
+        self._countries = list(header["countries"])
+        # Identifies this build, e.g. for the search file written alongside; files from before
+        # build ids fall back to their mtime.
+        self.build = str(header.get("build") or f"{sections.mtime_ns:x}")
+        self._strings = {col: sections.strings(col) for col in _GADM_INDEX_STRING_COLUMNS}
+        self._country_ids = sections.array("country", "<u2")
+        self._levels = sections.array("level", "<i1")
+        # Absent from version 1 files.
+        self.geo = sections.array("geo", "<f8").reshape(-1, GADM_GEO_FIELDS) if "geo" in sections else None
+        self._gid_order = sections.array("gid_order", "<u4") if "gid_order" in sections else None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _string(self, col: str, i: int) -> Optional[str]:
+        return self._strings[col][i] or None
+
+    def gid(self, i: int) -> str:
+        return self._string("gid", i) or ""
+
+    def level_ids(self, level: int) -> np.ndarray:
+        return np.flatnonzero(self._levels == level)
+
+    def find(self, gid: str) -> Optional[int]:
+        """Entry index for an exact gid, by bisection over the gid-sorted order."""
+        order = self._gid_order
+        if order is None:
+            return next((i for i in range(self._count) if self._string("gid", i) == gid), None)
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if (self._string("gid", int(order[mid])) or "") < gid:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._string("gid", int(order[lo])) == gid:
+            return int(order[lo])
+        return None
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        entry = {
+            "gid": self._string("gid", i),
+            "name": self._string("name", i),
+            "country": self._countries[int(self._country_ids[i])] or None,
+            "level": int(self._levels[i]),
+        }
+        varname = self._string("varname", i)
+        if varname:
+            entry["varname"] = varname
+        return entry
+
+
+def _write_gadm_index_file(path: str, entries: Sequence, country_levels: Dict[str, List[int]], country_search: List[Dict[str, Any]]) -> None:
+    n = len(entries)
+    countries = sorted({str(item.get("country") or "") for item in entries})
+    country_ids = {name: i for i, name in enumerate(countries)}
+    blobs: List[Tuple[str, bytes]] = []
+    for col in _GADM_INDEX_STRING_COLUMNS:
+        blobs.extend(_string_sections(col, [str(item.get(col) or "") for item in entries]))
+    blobs.append(("country", np.asarray([country_ids[str(item.get("country") or "")] for item in entries], dtype="<u2").tobytes()))
+    blobs.append(("level", np.asarray([int(item.get("level") or 0) for item in entries], dtype="<i1").tobytes()))
+    geo = np.full((n, GADM_GEO_FIELDS), np.nan, dtype="<f8")
+    for i, item in enumerate(entries):
+        stats = _gadm_entry_geo(item)
+        if stats is not None:
+            geo[i] = stats
+    blobs.append(("geo", geo.tobytes()))
+    gids = [str(item.get("gid") or "") for item in entries]
+    blobs.append(("gid_order", np.asarray(sorted(range(n), key=gids.__getitem__), dtype="<u4").tobytes()))
+    header = {
+        "version": 2,
+        "build": secrets.token_hex(8),
+        "count": n,
+        "countries": countries,
+        "country_levels": country_levels,
+        "country_search": country_search,
+    }
+    _write_section_file(path, GADM_INDEX_MAGIC, header, blobs)
+
+
+def _open_gadm_index_file(path: str) -> Tuple[_GadmIndexColumns, Dict[str, List[int]], List[Dict[str, Any]]]:
+    sections = _SectionFile(path, GADM_INDEX_MAGIC)
+    return _GadmIndexColumns(sections), sections.header["country_levels"], sections.header["country_search"]
+
+
+GADM_SEARCH_MAGIC = b"XGADMSX1"
+
+
+def _write_gadm_search_file(path: str, columns: _GadmIndexColumns) -> None:
+    _write_section_file(path, GADM_SEARCH_MAGIC, {"version": 1, "build": columns.build, "count": len(columns)}, _gadm_search_sections(columns))
+
+
+def _open_gadm_search_file(path: str, columns: _GadmIndexColumns) -> Optional[Dict[str, Any]]:
+    """Search tables for ``columns`` mapped from ``path``; None if absent or built for another index."""
+    try:
+        sections = _SectionFile(path, GADM_SEARCH_MAGIC)
+    except (OSError, ValueError):
+        return None
+    if sections.header.get("build") != columns.build or sections.header.get("count") != len(columns):
+        return None
+    return {
+        "entries": columns,
+        "gids": sections.strings("gid"),
+        "names": sections.strings("name"),
+        "varnames": sections.strings("varname"),
+        "gid_len": sections.array("gid_len", "<i4"),
+        "gid_sorted": sections.strings("gid_sorted"),
+        "gid_order": sections.array("gid_order", "<i4"),
+        "name_sorted": sections.strings("name_sorted"),
+        "name_order": sections.array("name_order", "<i4"),
+        "name_trigrams": sections.postings("name_trigrams"),
+        "varname_trigrams": sections.postings("varname_trigrams"),
+        "country_groups": sections.postings("country_groups"),
+        "words": {
+            "words": sections.strings("words"),
+            "keys": sections.array("fuzzy_keys", "<u4"),
+            "key_words": sections.array("fuzzy_words", "<i4"),
+        },
+        "word_offsets": sections.array("word_offsets", "<i8"),
+        "word_entries": sections.array("word_entries", "<i4"),
+        "children": sections.postings("children"),
+    }
+
+
+def _install_gadm_index_file(path: str) -> None:
+    global GADM_INDEX, _gadm_installed_index_mtime
+    mtime = os.stat(path).st_mtime_ns
+    columns, country_levels, country_search = _open_gadm_index_file(path)
+    search_index = _open_gadm_search_file(GADM_SEARCH_INDEX_PATH, columns)
+    with _gadm_lock:
+        GADM_INDEX = columns
+        _gadm_installed_index_mtime = mtime
+        rebuild_country_indexes((country_levels, country_search), search_index)
+
+
+def _gadm_file_level(filename: str) -> Optional[int]:
+    if not filename.endswith(".json") or not filename.startswith("gadm41_"):
+        return None
+    parts = filename.replace(".json", "").split("_")
+    if len(parts) < 3:
+        return None
+    try:
+        return int(parts[2])
+    except ValueError:
+        return None
+
+
+_GEOJSON_PROPERTIES_RE = re.compile(r'"properties"\s*:\s*')
+GEOJSON_SCAN_CHUNK_CHARS = 1 << 20
+GEOJSON_SCAN_MAX_PENDING_CHARS = 64 << 20
+
+
+def _iter_geojson_properties(path: str, chunk_chars: int = GEOJSON_SCAN_CHUNK_CHARS):
+    """Yield each feature's "properties" object from a GeoJSON file, in file order.
+
+    Reads fixed-size chunks and decodes only the properties objects; geometry text is scanned
+    past and dropped, never parsed, so peak memory stays near one chunk. A "properties" key
+    can't occur inside a JSON string (its quotes would be escaped), so a regex hit is a key.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    with open(path, "r", encoding="utf-8", errors="ignore") as fh:
+        while True:
+            match = _GEOJSON_PROPERTIES_RE.search(buf, pos)
+            if match is not None:
+                try:
+                    obj, end = decoder.raw_decode(buf, match.end())
+                except json.JSONDecodeError:
+                    if eof:
+                        return
+                    if len(buf) - match.start() > GEOJSON_SCAN_MAX_PENDING_CHARS:
+                        raise ValueError(f"unterminated properties object in {os.path.basename(path)}")
+                    # Object runs past the chunk: keep it and read on.
+                    more = fh.read(chunk_chars)
+                    if not more:
+                        eof = True
+                    buf = buf[match.start():] + more
+                    pos = 0
+                    continue
+                if isinstance(obj, dict):
+                    yield obj
+                pos = end
+                continue
+            if eof:
+                return
+            more = fh.read(chunk_chars)
+            if not more:
+                eof = True
+            # Keep a short tail so a key split across chunks is still found.
+            buf = buf[max(pos, len(buf) - 32):] + more
+            pos = 0
+
+
+# Bump when _gadm_file_entries starts extracting something new, so cached parts are re-read.
+GADM_INDEX_PART_VERSION = 2
+_GEOJSON_GEOMETRY_RE = re.compile(r'"geometry"\s*:\s*(null\b)?')
+_GEOJSON_COORDINATES_RE = re.compile(r'"coordinates"\s*:\s*((?:\[\s*)+)')
+_GEOJSON_RING_END_RE = re.compile(r'\]\s*\]')
+_GEOJSON_CLOSE_RE = re.compile(r'\s*\]')
+_GEOJSON_NUMBER_JUNK = str.maketrans("[],", "   ")
+# Equirectangular km per degree, scaled by cos(latitude) for x.
+_KM_PER_DEG_LNG = 111.320
+_KM_PER_DEG_LAT = 110.574
+
+
+def _ring_add(ring: Dict[str, Any], flat: np.ndarray) -> None:
+    """Fold a run of x,y numbers into a ring's running bbox and shoelace sums."""
+    if flat.size < 2:
+        return
+    pts = flat[: flat.size - flat.size % 2].reshape(-1, 2)
+    if "origin" not in ring:
+        # Sums are taken relative to the first vertex, to keep the products small.
+        ring.update(origin=pts[0].copy(), last=np.zeros(2), lo=pts.min(axis=0), hi=pts.max(axis=0), a=0.0, mx=0.0, my=0.0, n=0)
+    else:
+        ring["lo"] = np.minimum(ring["lo"], pts.min(axis=0))
+        ring["hi"] = np.maximum(ring["hi"], pts.max(axis=0))
+    rel = np.vstack([ring["last"], pts - ring["origin"]])
+    x0, y0, x1, y1 = rel[:-1, 0], rel[:-1, 1], rel[1:, 0], rel[1:, 1]
+    cross = x0 * y1 - x1 * y0
+    ring["a"] += float(cross.sum())
+    ring["mx"] += float(((x0 + x1) * cross).sum())
+    ring["my"] += float(((y0 + y1) * cross).sum())
+    ring["last"] = rel[-1]
+    ring["n"] += len(pts)
+
+
+def _ring_finish(ring: Dict[str, Any]) -> Optional[Tuple[np.ndarray, float, float, float]]:
+    """(bbox, |area| in deg², centroid x, centroid y) of an accumulated ring."""
+    if ring.get("n", 0) < 3:
+        return None
+    # The closing edge ends at the origin, (0, 0) in relative terms, so adds nothing.
+    area = ring["a"] / 2.0
+    bbox = np.concatenate([ring["lo"], ring["hi"]])
+    if area == 0.0:
+        return bbox, 0.0, float((bbox[0] + bbox[2]) / 2), float((bbox[1] + bbox[3]) / 2)
+    cx = ring["mx"] / (6.0 * area) + float(ring["origin"][0])
+    cy = ring["my"] / (6.0 * area) + float(ring["origin"][1])
+    return bbox, abs(area), cx, cy
+
+
+def _iter_geojson_geometry_stats(path: str, chunk_chars: int = GEOJSON_SCAN_CHUNK_CHARS):
+    """Yield (min_x, min_y, max_x, max_y, centroid_x, centroid_y, area_km2) per feature.
+
+    Companion to _iter_geojson_properties, in the same feature order. Polygon and MultiPolygon
+    coordinates are read as flat runs of numbers, one ring at a time, with brackets only marking
+    ring and polygon ends, so no geometry is built as nested lists. The first ring of a polygon
+    is its exterior and the rest are holes. Areas use an equirectangular approximation at each
+    ring's centroid latitude. Null and non-polygonal geometries yield None.
+    """
+    buf = ""
+    pos = 0
+    eof = False
+    fh = open(path, "r", encoding="utf-8", errors="ignore")
+
+    def _refill(keep_from: int) -> None:
+        nonlocal buf, pos, eof
+        more = fh.read(chunk_chars)
+        if not more:
+            eof = True
+        buf = buf[keep_from:] + more
+        pos = 0
+
+    def _lookahead(n: int) -> None:
+        while len(buf) - pos < n and not eof:
+            _refill(pos)
+
+    def _numbers(text: str) -> np.ndarray:
+        return np.fromstring(text.translate(_GEOJSON_NUMBER_JUNK), sep=" ")
+
+    try:
+        while True:
+            match = _GEOJSON_GEOMETRY_RE.search(buf, pos)
+            if match is None or (match.end() + 8 > len(buf) and not eof):
+                if eof:
+                    return
+                # Keep a short tail so a key split across chunks is still found.
+                _refill(max(pos, len(buf) - 32) if match is None else match.start())
+                continue
+            if match.group(1):
+                pos = match.end()
+                yield None
+                continue
+            coords = _GEOJSON_COORDINATES_RE.search(buf, match.end())
+            while (coords is None or len(buf) - coords.end() < 64) and not eof:
+                _refill(match.start())
+                match = _GEOJSON_GEOMETRY_RE.match(buf, 0)
+                coords = _GEOJSON_COORDINATES_RE.search(buf, match.end())
+            if coords is None:
+                return
+            depth = coords.group(1).count("[")
+            pos = coords.end()
+            if depth not in (3, 4):
+                yield None
+                continue
+
+            bbox = np.array([np.inf, np.inf, -np.inf, -np.inf])
+            area_deg = area_km2 = mx = my = 0.0
+            ring: Dict[str, Any] = {}
+            polygon: List[Tuple[np.ndarray, float, float, float]] = []
+            done = False
+            while not done:
+                ring_end = _GEOJSON_RING_END_RE.search(buf, pos)
+                if ring_end is None:
+                    if eof:
+                        return
+                    # Parse complete positions; a trailing "]" may pair with the next chunk.
+                    cut = buf.rfind("]", pos)
+                    if cut > pos:
+                        _ring_add(ring, _numbers(buf[pos:cut]))
+                        pos = cut
+                    _refill(pos)
+                    continue
+                _ring_add(ring, _numbers(buf[pos:ring_end.start()]))
+                finished = _ring_finish(ring)
+                ring = {}
+                if finished is not None:
+                    polygon.append(finished)
+                pos = ring_end.end()
+                _lookahead(64)
+                closed = _GEOJSON_CLOSE_RE.match(buf, pos)
+                if closed is None:
+                    continue
+                pos = closed.end()
+                for k, (ring_bbox, ring_area, cx, cy) in enumerate(polygon):
+                    sign = 1.0 if k == 0 else -1.0
+                    if k == 0:
+                        bbox[:2] = np.minimum(bbox[:2], ring_bbox[:2])
+                        bbox[2:] = np.maximum(bbox[2:], ring_bbox[2:])
+                    area_deg += sign * ring_area
+                    mx += sign * ring_area * cx
+                    my += sign * ring_area * cy
+                    area_km2 += sign * ring_area * _KM_PER_DEG_LNG * _KM_PER_DEG_LAT * math.cos(math.radians(cy))
+                polygon = []
+                if depth == 3:
+                    done = True
+                else:
+                    _lookahead(64)
+                    closed = _GEOJSON_CLOSE_RE.match(buf, pos)
+                    if closed is not None:
+                        pos = closed.end()
+                        done = True
+            if not np.isfinite(bbox).all():
+                yield None
+            elif area_deg > 0:
+                yield (*bbox.tolist(), mx / area_deg, my / area_deg, max(area_km2, 0.0))
+            else:
+                yield (*bbox.tolist(), float(bbox[0] + bbox[2]) / 2, float(bbox[1] + bbox[3]) / 2, 0.0)
+    finally:
+        fh.close()
+
+
+def _gadm_file_entries(path: str, level: int) -> List[Dict[str, Any]]:
+    """Index entries for one GADM file, in feature order (runs in build worker processes)."""
+    entries = []
+    geo_stats = list(_iter_geojson_geometry_stats(path))
+    # Feature properties only (a top-level "crs" member has a properties object too); the two
+    # passes then line up feature by feature.
+    properties = [p for p in _iter_geojson_properties(path) if any(k.startswith("GID_") for k in p)]
+    if len(geo_stats) != len(properties):
+        print(f"[xatra] Warning: {os.path.basename(path)}: {len(properties)} features but {len(geo_stats)} geometries; bounds not indexed", file=sys.stderr)
+        geo_stats = [None] * len(properties)
+    for p, geo in zip(properties, geo_stats):
+        gid = p.get(f"GID_{level}")
+        if not gid:
+            continue
+        if gid.endswith("_1"):
+            gid = gid[:-2]
+        entry = {
+            "gid": gid,
+            "name": p.get(f"NAME_{level}"),
+            "country": p.get("COUNTRY"),
+            "level": level
+        }
+        varname = p.get(f"VARNAME_{level}")
+        if varname and varname != "NA":
+            entry["varname"] = varname
+        if geo is not None:
+            entry["bbox"] = [round(v, 6) + 0.0 for v in geo[:4]]
+            entry["centroid"] = [round(v, 6) + 0.0 for v in geo[4:6]]
+            entry["area_km2"] = round(geo[6], 3)
+        entries.append(entry)
+    return entries
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _gadm_file_part(path: str, level: int) -> Dict[str, Any]:
+    return {"version": GADM_INDEX_PART_VERSION, "sha256": _file_sha256(path), "entries": _gadm_file_entries(path, level)}
+
+
+def _fill_country_geo(entries: List[Dict[str, Any]]) -> None:
+    """Add bbox/centroid/area to level-0 entries that lack them (legacy caches predate bounds),
+    read from each country's level-0 file, so point lookups can rule those countries out."""
+    missing = {
+        item["gid"]: item for item in entries
+        if item.get("level") == 0 and item.get("gid") and _gadm_entry_geo(item) is None
+    }
+    paths = {gid: os.path.join(GADM_DIR, f"gadm41_{gid}_0.json") for gid in missing}
+    paths = {gid: path for gid, path in paths.items() if os.path.exists(path)}
+
+    def _apply(gid: str, file_entries: List[Dict[str, Any]]) -> None:
+        for entry in file_entries:
+            if entry.get("gid") == gid and "bbox" in entry:
+                missing[gid].update(bbox=entry["bbox"], centroid=entry["centroid"], area_km2=entry["area_km2"])
+                return
+
+    workers = min(GADM_INDEX_BUILD_WORKERS, len(paths))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_gadm_file_entries, path, 0): gid for gid, path in paths.items()}
+            for future in as_completed(futures):
+                try:
+                    _apply(futures[future], future.result())
+                except Exception as e:
+                    print(f"[xatra] Warning: failed to read bounds for {futures[future]}: {e}", file=sys.stderr)
+    else:
+        for gid, path in paths.items():
+            try:
+                _apply(gid, _gadm_file_entries(path, 0))
+            except Exception as e:
+                print(f"[xatra] Warning: failed to read bounds for {gid}: {e}", file=sys.stderr)
+
+
+def _gadm_part_path(filename: str) -> str:
+    return os.path.join(GADM_INDEX_PARTS_DIR, filename)
+
+
+def _write_gadm_part_entries(filename: str, entries: List[Dict[str, Any]]) -> None:
+    os.makedirs(GADM_INDEX_PARTS_DIR, exist_ok=True)
+    path = _gadm_part_path(filename)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump(entries, fh, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _write_gadm_parts_manifest(parts: Dict[str, Dict[str, Any]]) -> None:
+    tmp_parts = f"{GADM_INDEX_PARTS_PATH}.{os.getpid()}.tmp"
+    with open(tmp_parts, "w") as fh:
+        json.dump(parts, fh, separators=(",", ":"))
+    os.replace(tmp_parts, GADM_INDEX_PARTS_PATH)
+
+
+@contextlib.contextmanager
+def _gadm_index_build_lock(report: bool = True):
+    """Exclusive cross-process lock: one process builds, the others block until it's done."""
+    if fcntl is None:
+        yield
+        return
+    with open(GADM_INDEX_LOCK_PATH, "a+") as fh:
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            if report:
+                _set_gadm_index_progress(state="waiting")
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+def _set_gadm_index_progress(**fields: Any) -> None:
+    global GADM_INDEX_PROGRESS
+    with _gadm_lock:
+        GADM_INDEX_PROGRESS = {**GADM_INDEX_PROGRESS, **fields}
+
+
+def _build_gadm_index_locked() -> None:
+    files = []
+    if os.path.exists(GADM_DIR):
+        for f in sorted(os.listdir(GADM_DIR)):
+            level = _gadm_file_level(f)
+            if level is not None:
+                files.append((f, level))
+    try:
+        with open(GADM_INDEX_PARTS_PATH, "r") as fh:
+            parts = json.load(fh)
+    except Exception:
+        parts = {}
+
+    # Fingerprints only; a file's entries are read back from its part file if a rebuild needs them.
+    fresh_parts: Dict[str, Dict[str, Any]] = {}
+    todo: List[Tuple[str, int, os.stat_result]] = []
+    refreshed = False
+    for f, part in parts.items():
+        if isinstance(part, dict) and "entries" in part:
+            # Written before part files existed: move the entries out once.
+            _write_gadm_part_entries(f, part.pop("entries"))
+            refreshed = True
+    for f, level in files:
+        path = os.path.join(GADM_DIR, f)
+        st = os.stat(path)
+        part = parts.get(f)
+        if (
+            part and part.get("version") == GADM_INDEX_PART_VERSION and part.get("size") == st.st_size
+            and os.path.exists(_gadm_part_path(f))
+        ):
+            if part.get("mtime_ns") == st.st_mtime_ns:
+                fresh_parts[f] = part
+                continue
+            if part.get("sha256") == _file_sha256(path):
+                # Touched but unchanged: keep the entries, remember the new mtime.
+                fresh_parts[f] = {**part, "mtime_ns": st.st_mtime_ns}
+                refreshed = True
+                continue
+        todo.append((f, level, st))
+
+    if not todo and set(fresh_parts) == set(parts) and os.path.exists(GADM_INDEX_PATH):
+        # Up to date (possibly built by another process while we waited on the lock).
+        if refreshed:
+            _write_gadm_parts_manifest(fresh_parts)
+        if os.stat(GADM_INDEX_PATH).st_mtime_ns != _gadm_installed_index_mtime:
+            _install_gadm_index_file(GADM_INDEX_PATH)
+        _set_gadm_index_progress(state="ready", files_total=len(files), files_done=len(files), files_reparsed=0, entries=len(GADM_INDEX), finished_at=time.time())
+        return
+
+    print(f"Building GADM index ({len(todo)} of {len(files)} files changed)...")
+    _set_gadm_index_progress(files_total=len(files), files_done=len(files) - len(todo), files_reparsed=len(todo))
+
+    def _record(f: str, st: os.stat_result, part: Dict[str, Any]) -> None:
+        _write_gadm_part_entries(f, part.pop("entries"))
+        fresh_parts[f] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, **part}
+        with _gadm_lock:
+            GADM_INDEX_PROGRESS["files_done"] = GADM_INDEX_PROGRESS.get("files_done", 0) + 1
+
+    workers = min(GADM_INDEX_BUILD_WORKERS, len(todo))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_gadm_file_part, os.path.join(GADM_DIR, f), level): (f, st) for f, level, st in todo}
+            for future in as_completed(futures):
+                f, st = futures[future]
+                try:
+                    _record(f, st, future.result())
+                except Exception as e:
+                    print(f"[xatra] Warning: failed to read GADM file {f}: {e}", file=sys.stderr)
+    else:
+        for f, level, st in todo:
+            try:
+                _record(f, st, _gadm_file_part(os.path.join(GADM_DIR, f), level))
+            except Exception as e:
+                print(f"[xatra] Warning: failed to read GADM file {f}: {e}", file=sys.stderr)
+
+    index = []
+    seen_gids = set()
+    for f, _ in files:
+        if f not in fresh_parts:
+            continue
+        with open(_gadm_part_path(f), "r") as fh:
+            part_entries = json.load(fh)
+        for entry in part_entries:
+            if entry["gid"] in seen_gids:
+                continue
+            seen_gids.add(entry["gid"])
+            index.append(entry)
+
+    entry_count = len(index)
+    _write_gadm_index_file(GADM_INDEX_PATH, index, *_country_indexes(index))
+    del index
+    _write_gadm_parts_manifest(fresh_parts)
+    # Part files of GADM files that have since been removed.
+    for name in os.listdir(GADM_INDEX_PARTS_DIR) if os.path.isdir(GADM_INDEX_PARTS_DIR) else []:
+        if name not in fresh_parts and name.endswith(".json"):
+            with contextlib.suppress(OSError):
+                os.remove(_gadm_part_path(name))
+    # Search tables come from the file just written (not the list it was written from), and go
+    # to disk before the index is installed so every process maps the same copy.
+    _write_gadm_search_file(GADM_SEARCH_INDEX_PATH, _open_gadm_index_file(GADM_INDEX_PATH)[0])
+    _install_gadm_index_file(GADM_INDEX_PATH)
+    _set_gadm_index_progress(state="ready", entries=entry_count, finished_at=time.time())
+    print(f"GADM index built: {entry_count} entries")
+
 
 def build_gadm_index():
-    global INDEX_BUILDING, GADM_INDEX
+    global INDEX_BUILDING
     with _gadm_lock:
         if INDEX_BUILDING:
             return
         INDEX_BUILDING = True
-    print("Building GADM index...")
-    
+    _set_gadm_index_progress(state="building", started_at=time.time(), finished_at=None, error=None)
     try:
-        index = []
-        seen_gids = set()
-        if os.path.exists(GADM_DIR):
-            files = sorted(os.listdir(GADM_DIR))
-            for f in files:
-                if not f.endswith(".json") or not f.startswith("gadm41_"): continue
-                
-                parts = f.replace(".json", "").split("_")
-                if len(parts) < 3: continue
-                try:
-                    level = int(parts[2])
-                except:
-                    continue
-                
-                path = os.path.join(GADM_DIR, f)
-                try:
-                    with open(path, 'r', encoding='utf-8', errors='ignore') as fh:
-                        data = json.load(fh)
-                        for feat in data.get("features", []):
-                            p = feat.get("properties", {})
-                            gid = p.get(f"GID_{level}")
-                            name = p.get(f"NAME_{level}")
-                            country = p.get("COUNTRY")
-                            varname = p.get(f"VARNAME_{level}")
-                            
-                            if gid:
-                                if gid.endswith("_1"):
-                                    gid = gid[:-2]
-                                
-                                if gid in seen_gids:
-                                    continue
-                                seen_gids.add(gid)
-                                    
-                                entry = {
-                                    "gid": gid,
-                                    "name": name,
-                                    "country": country,
-                                    "level": level
-                                }
-                                if varname and varname != "NA":
-                                    entry["varname"] = varname
-                                    
-                                index.append(entry)
-                except Exception as e:
-                    print(f"[xatra] Warning: failed to read GADM file {f}: {e}", file=sys.stderr)
-        
-        with _gadm_lock:
-            GADM_INDEX = index
-            rebuild_country_indexes()
-        with open(GADM_INDEX_PATH, "w") as f:
-            json.dump(index, f)
-        print(f"GADM index built: {len(index)} entries")
-
+        with _gadm_index_build_lock():
+            _set_gadm_index_progress(state="building")
+            _build_gadm_index_locked()
     except Exception as e:
         print(f"Error building index: {e}")
+        _set_gadm_index_progress(state="error", error=str(e), finished_at=time.time())
     finally:
         with _gadm_lock:
             INDEX_BUILDING = False
 
-if os.path.exists(GADM_INDEX_PATH):
+if not _IS_GADM_INDEX_OWNER:
+    if os.path.exists(GADM_INDEX_PATH):
+        try:
+            _install_gadm_index_file(GADM_INDEX_PATH)
+        except Exception as e:
+            print(f"[xatra] Warning: failed to load cached GADM index: {e}", file=sys.stderr)
+elif os.path.exists(GADM_INDEX_PATH):
     try:
-        with open(GADM_INDEX_PATH, "r") as f:
-            _loaded_index = json.load(f)
-        with _gadm_lock:
-            GADM_INDEX = _loaded_index
-            rebuild_country_indexes()
+        _install_gadm_index_file(GADM_INDEX_PATH)
     except Exception as e:
         print(f"[xatra] Warning: failed to load cached GADM index: {e}", file=sys.stderr)
+    # Serve the cached index right away; the build only re-reads GADM files that changed.
+    threading.Thread(target=build_gadm_index).start()
+elif os.path.exists(GADM_INDEX_LEGACY_PATH):
+    try:
+        with open(GADM_INDEX_LEGACY_PATH, "r") as f:
+            _loaded_index = json.load(f)
+        # The legacy cache has no bounds; country boxes at least keep /gadm/at from scanning every country.
+        _fill_country_geo(_loaded_index)
+        _write_gadm_index_file(GADM_INDEX_PATH, _loaded_index, *_country_indexes(_loaded_index))
+        del _loaded_index
+        _install_gadm_index_file(GADM_INDEX_PATH)
+    except Exception as e:
+        print(f"[xatra] Warning: failed to convert cached GADM index: {e}", file=sys.stderr)
         threading.Thread(target=build_gadm_index).start()
 else:
     threading.Thread(target=build_gadm_index).start()
@@ -1361,24 +3463,29 @@ app.add_middleware(
 @app.get("/search/gadm")
 def search_gadm(q: str):
     if not q: return []
-    q = q.lower()
+    q = _fold_text(q)
     results = []
-    limit = 20
+    limit = GADM_SEARCH_LIMIT
 
+    # Both are replaced wholesale, never mutated, so holding references is enough.
     with _gadm_lock:
-        index_snapshot = list(GADM_INDEX)
+        search_index = GADM_SEARCH_INDEX
+        index_snapshot = GADM_INDEX
+    if search_index is not None:
+        return _search_gadm_indexed(search_index, q, limit)
+    # Search index for this generation is still building: fall back to a linear scan.
     for item in index_snapshot:
         score = 0
-        gid = item["gid"].lower()
-        name = item["name"].lower() if item["name"] else ""
+        gid = item["gid"].casefold()
+        name = _fold_text(item["name"]) if item["name"] else ""
         
         if gid == q: score = 100
         elif gid.startswith(q): score = 80
         elif name == q: score = 90
         elif name.startswith(q): score = 70
         elif q in name: score = 50
-        elif item.get("varname") and q in item.get("varname").lower(): score = 40
-        elif item["country"] and q in item["country"].lower(): score = 30
+        elif item.get("varname") and q in _fold_text(item.get("varname")): score = 40
+        elif item["country"] and q in _fold_text(item["country"]): score = 30
         
         if score > 0:
             tie_breaker = -len(gid)
@@ -1416,6 +3523,24 @@ def search_countries(q: str):
     results.sort(key=lambda x: x[0], reverse=True)
     return [r[1] for r in results[:20]]
 
+@app.get("/search/static/manifest.json")
+def search_static_manifest():
+    path = GADM_SEARCH_SHARD_DIR / "manifest.json"
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Search shards not exported yet")
+    return FileResponse(path, media_type="application/json", headers={"Cache-Control": "no-cache", "Access-Control-Allow-Origin": "*"})
+
+
+@app.get("/search/static/{version}/{name}")
+def search_static_shard(version: str, name: str):
+    if not _SEARCH_SHARD_VERSION_RE.match(version) or not _SEARCH_SHARD_NAME_RE.match(name):
+        raise HTTPException(status_code=400, detail="Invalid shard path")
+    path = GADM_SEARCH_SHARD_DIR / version / name
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Shard not found")
+    return FileResponse(path, media_type="application/json", headers={"Cache-Control": "public, max-age=31536000, immutable", "Access-Control-Allow-Origin": "*"})
+
+
 @app.get("/gadm/levels")
 def gadm_levels(country: str):
     if not country:
@@ -1425,6 +3550,603 @@ def gadm_levels(country: str):
         levels = COUNTRY_LEVELS_INDEX.get(country_code, [0, 1, 2, 3, 4])
     return list(levels)
 
+# GADM hierarchy: children / ancestors / batch resolution / wildcard expansion, answered from
+# the index's gid lookup and the children postings of the current search index snapshot.
+GADM_RESOLVE_MAX_GIDS = 1000
+GADM_EXPAND_MAX_RESULTS = 5000
+
+
+class GadmGidsRequest(BaseModel):
+    gids: List[str]
+
+
+def _normalize_gadm_gid(gid: str) -> str:
+    gid = str(gid or "").strip().upper()
+    return gid[:-2] if gid.endswith("_1") else gid
+
+
+def _gadm_hierarchy_snapshot() -> Dict[str, Any]:
+    with _gadm_lock:
+        search_index = GADM_SEARCH_INDEX
+    if search_index is None:
+        raise HTTPException(status_code=503, detail="GADM index is still building")
+    return search_index
+
+
+def _gadm_hierarchy_record(search_index: Dict[str, Any], i: int) -> Dict[str, Any]:
+    record = dict(search_index["entries"][i])
+    child_ids = search_index["children"].get(record["gid"])
+    record["child_count"] = 0 if child_ids is None else int(child_ids.size)
+    return record
+
+
+def _gadm_pattern_matches(search_index: Dict[str, Any], pattern: str, limit: int) -> List[int]:
+    """Entry ids for a gid pattern where ``*`` stands for any one segment (``IND.31.*``)."""
+    segments = _normalize_gadm_gid(pattern).split(".")
+    children = search_index["children"]
+    entries = search_index["entries"]
+    if segments[0] == "*":
+        frontier = [entries[i]["gid"] for i in children.get("", _EMPTY_IDS).tolist()]
+    else:
+        frontier = [segments[0]]
+    for seg in segments[1:]:
+        nxt: List[str] = []
+        for gid in frontier:
+            if seg == "*":
+                nxt.extend(entries[i]["gid"] for i in children.get(gid, _EMPTY_IDS).tolist())
+            else:
+                child = f"{gid}.{seg}"
+                if child in children or entries.find(child) is not None:
+                    nxt.append(child)
+        frontier = nxt
+        if len(frontier) > limit:
+            break
+    if len(frontier) > limit:
+        raise HTTPException(status_code=400, detail=f"Pattern matches more than {limit} admin units")
+    found = (entries.find(g) for g in frontier)
+    return [i for i in found if i is not None]
+
+
+def _expand_gadm_values(values: List[Any]) -> List[Any]:
+    """Replace wildcard gids in builder gadm values with the units they match.
+
+    Patterns are left as-is while the index is building; unmatched patterns are dropped.
+    """
+    if not any(isinstance(v, str) and "*" in v for v in values):
+        return values
+    with _gadm_lock:
+        search_index = GADM_SEARCH_INDEX
+    if search_index is None:
+        return values
+    out: List[Any] = []
+    for v in values:
+        if not (isinstance(v, str) and "*" in v):
+            out.append(v)
+            continue
+        entries = search_index["entries"]
+        out.extend(entries[i]["gid"] for i in _gadm_pattern_matches(search_index, v, GADM_EXPAND_MAX_RESULTS))
+    return out
+
+
+def _expand_gadm_wildcard_parts(parts: Any) -> Any:
+    if not isinstance(parts, list):
+        return parts
+    out = []
+    for part in parts:
+        if isinstance(part, dict):
+            ptype = part.get("type", "gadm")
+            val = part.get("value")
+            if ptype == "gadm":
+                vals = val if isinstance(val, list) else [val]
+                expanded = _expand_gadm_values(vals)
+                if expanded is not vals:
+                    part = {**part, "value": expanded}
+            elif ptype == "group":
+                part = {**part, "value": _expand_gadm_wildcard_parts(val)}
+        out.append(part)
+    return out
+
+
+def _expand_gadm_flag_value(value: Any) -> Any:
+    """Flag values accept a gid, a list of gids, or a list of territory parts."""
+    if isinstance(value, str):
+        return _expand_gadm_values([value]) if "*" in value else value
+    if isinstance(value, list):
+        return _expand_gadm_values(_expand_gadm_wildcard_parts(value))
+    return value
+
+
+@app.get("/gadm/children")
+def gadm_children(gid: str = ""):
+    """Direct children of ``gid`` in gid order; countries when ``gid`` is empty."""
+    search_index = _gadm_hierarchy_snapshot()
+    gid = _normalize_gadm_gid(gid)
+    child_ids = search_index["children"].get(gid)
+    if child_ids is None:
+        if gid and search_index["entries"].find(gid) is None:
+            raise HTTPException(status_code=404, detail="Unknown GID")
+        return []
+    return [_gadm_hierarchy_record(search_index, i) for i in child_ids.tolist()]
+
+
+@app.get("/gadm/ancestors")
+def gadm_ancestors(gid: str):
+    """Ancestors of ``gid`` from the country down, followed by ``gid`` itself."""
+    search_index = _gadm_hierarchy_snapshot()
+    gid = _normalize_gadm_gid(gid)
+    entries = search_index["entries"]
+    if entries.find(gid) is None:
+        raise HTTPException(status_code=404, detail="Unknown GID")
+    segments = gid.split(".")
+    found = (entries.find(".".join(segments[:k])) for k in range(1, len(segments) + 1))
+    return [_gadm_hierarchy_record(search_index, i) for i in found if i is not None]
+
+
+@app.post("/gadm/resolve")
+def gadm_resolve(request: GadmGidsRequest):
+    """Records for a batch of gids, keyed by the gid as sent; unknown gids map to null."""
+    if len(request.gids) > GADM_RESOLVE_MAX_GIDS:
+        raise HTTPException(status_code=400, detail=f"At most {GADM_RESOLVE_MAX_GIDS} gids per request")
+    search_index = _gadm_hierarchy_snapshot()
+    entries = search_index["entries"]
+    out: Dict[str, Optional[Dict[str, Any]]] = {}
+    for raw in request.gids:
+        i = entries.find(_normalize_gadm_gid(raw))
+        out[raw] = None if i is None else _gadm_hierarchy_record(search_index, i)
+    return out
+
+
+@app.get("/gadm/expand")
+def gadm_expand(pattern: str):
+    """Units matching a gid pattern where ``*`` is one segment, e.g. ``IND.31.*``."""
+    if not pattern.strip():
+        return []
+    search_index = _gadm_hierarchy_snapshot()
+    ids = _gadm_pattern_matches(search_index, pattern, GADM_EXPAND_MAX_RESULTS)
+    return [_gadm_hierarchy_record(search_index, i) for i in ids]
+
+
+def _gadm_unit_geo(gid: str) -> Optional[Dict[str, Any]]:
+    """Precomputed bbox/centroid/area for one gid, or None when unknown or not yet indexed."""
+    gid = _normalize_gadm_gid(gid)
+    with _gadm_lock:
+        entries = GADM_INDEX
+    if isinstance(entries, _GadmIndexColumns):
+        i = entries.find(gid)
+        row = entries.geo[i] if i is not None and entries.geo is not None else None
+    else:
+        item = next((e for e in entries if e.get("gid") == gid), None)
+        row = _gadm_entry_geo(item) if item is not None else None
+    if row is None:
+        return None
+    row = np.asarray(row, dtype=np.float64)
+    if not np.isfinite(row).all():
+        return None
+    return {
+        "gid": gid,
+        "bbox": row[:4].tolist(),
+        "centroid": row[4:6].tolist(),
+        "area_km2": float(row[6]),
+    }
+
+
+@app.get("/gadm/bounds")
+def gadm_bounds(gid: str):
+    """[min_lng, min_lat, max_lng, max_lat] bbox, centroid and approximate area of one unit."""
+    record = _gadm_unit_geo(gid)
+    if record is None:
+        raise HTTPException(status_code=404, detail="No bounds for this GID")
+    return record
+
+
+@app.post("/gadm/bounds")
+def gadm_bounds_batch(request: GadmGidsRequest):
+    """Bounds per gid (null when unknown) plus the bbox enclosing all of them."""
+    if len(request.gids) > GADM_RESOLVE_MAX_GIDS:
+        raise HTTPException(status_code=400, detail=f"At most {GADM_RESOLVE_MAX_GIDS} gids per request")
+    units = {raw: _gadm_unit_geo(raw) for raw in request.gids}
+    boxes = [u["bbox"] for u in units.values() if u is not None]
+    bbox = None
+    if boxes:
+        bbox = [
+            min(b[0] for b in boxes),
+            min(b[1] for b in boxes),
+            max(b[2] for b in boxes),
+            max(b[3] for b in boxes),
+        ]
+    return {"units": units, "bbox": bbox}
+
+# GADM tiles: GeoJSON-per-tile views of one admin level (slippy-map z/x/y), generated on
+# demand from the GADM files and cached on disk. Features are simplified for the tile's zoom
+# and clipped to the tile plus a few pixels, so the cut edges (and the stroke along them)
+# fall outside the canvas the viewer draws each tile into.
+GADM_TILE_MAX_ZOOM = 12
+GADM_TILE_SIZE = 256
+GADM_TILE_CLIP_BUFFER_PX = 8
+# Cached tiles live under this subdirectory; bump it when the tile contents change shape.
+GADM_TILE_CACHE_FORMAT = "clipped"
+GADM_TILE_MAX_LEVEL = 5
+_GADM_TILE_GID_RE = re.compile(r"^[A-Z0-9]{3}(\.\d+)*$")
+_GADM_TILE_SOURCES_MAX = 6
+_gadm_tile_sources: "OrderedDict[Tuple[str, int], Dict[str, Any]]" = OrderedDict()
+_gadm_tile_lock = threading.Lock()
+
+
+def _gadm_source_mtime(country: str, level: int) -> Optional[int]:
+    """st_mtime_ns of gadm41_{country}_{level}.json (None if absent); caches built from it are stale when older."""
+    try:
+        return os.stat(os.path.join(GADM_DIR, f"gadm41_{country}_{level}.json")).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _cache_file_fresh(path: Path, source_mtime: int) -> bool:
+    try:
+        return path.stat().st_mtime_ns >= source_mtime
+    except FileNotFoundError:
+        return False
+
+
+def _load_gadm_features(country: str, level: int) -> Optional[Tuple[List[str], List[Optional[str]], List[Any]]]:
+    """(gids, names, shapely geometries) of gadm41_{country}_{level}.json, or None if absent."""
+    path = os.path.join(GADM_DIR, f"gadm41_{country}_{level}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8", errors="ignore") as fh:
+        data = json.load(fh)
+    gids: List[str] = []
+    names: List[Optional[str]] = []
+    geoms: List[Any] = []
+    for feat in data.get("features", []):
+        props = feat.get("properties") or {}
+        gid = props.get(f"GID_{level}")
+        if not gid or not feat.get("geometry"):
+            continue
+        if gid.endswith("_1"):
+            gid = gid[:-2]
+        try:
+            geom = shape(feat["geometry"])
+        except Exception:
+            continue
+        if geom.is_empty:
+            continue
+        gids.append(gid)
+        names.append(props.get(f"NAME_{level}") or props.get("COUNTRY"))
+        geoms.append(geom)
+    return gids, names, geoms
+
+
+def _gadm_tile_source(country: str, level: int) -> Optional[Dict[str, Any]]:
+    """Parsed geometries + STRtree for gadm41_{country}_{level}.json (small LRU, reloaded when the file changes)."""
+    key = (country, level)
+    source_mtime = _gadm_source_mtime(country, level)
+    if source_mtime is None:
+        return None
+    with _gadm_tile_lock:
+        cached = _gadm_tile_sources.get(key)
+        if cached is not None and cached["mtime"] == source_mtime:
+            _gadm_tile_sources.move_to_end(key)
+            return cached
+    features = _load_gadm_features(country, level)
+    if features is None:
+        return None
+    gids, names, geoms = features
+    source = {
+        "gids": gids,
+        "names": names,
+        "geoms": geoms,
+        "tree": STRtree(geoms),
+        "ids": {gid: i for i, gid in reversed(list(enumerate(gids)))},
+        "mtime": source_mtime,
+    }
+    with _gadm_tile_lock:
+        _gadm_tile_sources[key] = source
+        _gadm_tile_sources.move_to_end(key)
+        while len(_gadm_tile_sources) > _GADM_TILE_SOURCES_MAX:
+            _gadm_tile_sources.popitem(last=False)
+    return source
+
+
+def _tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(west, south, east, north) in degrees for a Web Mercator tile."""
+    n = 2 ** z
+
+    def _lat(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, _lat(y + 1), (x + 1) / n * 360.0 - 180.0, _lat(y)
+
+
+def _gadm_tile_features(gid: str, level: int, z: int, x: int, y: int) -> List[Dict[str, Any]]:
+    country = gid.split(".")[0]
+    source = _gadm_tile_source(country, level)
+    if source is None:
+        raise HTTPException(status_code=404, detail=f"No GADM data for {country} level {level}")
+    west, south, east, north = _tile_bounds(z, x, y)
+    tolerance = (east - west) / GADM_TILE_SIZE / 2
+    buf_x = (east - west) / GADM_TILE_SIZE * GADM_TILE_CLIP_BUFFER_PX
+    buf_y = (north - south) / GADM_TILE_SIZE * GADM_TILE_CLIP_BUFFER_PX
+    features = []
+    for i in source["tree"].query(box(west, south, east, north), predicate="intersects"):
+        feature_gid = source["gids"][i]
+        if gid != country and feature_gid != gid and not feature_gid.startswith(gid + "."):
+            continue
+        geom = source["geoms"][i].simplify(tolerance, preserve_topology=True)
+        geom = shapely.clip_by_rect(geom, west - buf_x, south - buf_y, east + buf_x, north + buf_y)
+        geom = shapely.set_precision(geom, tolerance / 4, mode="pointwise")
+        if geom.is_empty:
+            continue
+        features.append({
+            "type": "Feature",
+            "id": feature_gid,
+            "properties": {"gid": feature_gid, "name": source["names"][i], "level": level},
+            "geometry": mapping(geom),
+        })
+    return features
+
+
+@app.get("/tiles/gadm/{gid}/{level}/{z}/{x}/{y}.geojson")
+def gadm_tile(gid: str, level: int, z: int, x: int, y: int):
+    gid = (gid or "").strip().upper()
+    if not _GADM_TILE_GID_RE.match(gid):
+        raise HTTPException(status_code=400, detail="Invalid GADM id")
+    if level < 0 or level > GADM_TILE_MAX_LEVEL:
+        raise HTTPException(status_code=400, detail="Invalid GADM level")
+    if z < 0 or z > GADM_TILE_MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="Invalid tile coordinates")
+    source_mtime = _gadm_source_mtime(gid.split(".")[0], level)
+    if source_mtime is None:
+        raise HTTPException(status_code=404, detail=f"No GADM data for {gid.split('.')[0]} level {level}")
+    path = GADM_TILE_CACHE_DIR / GADM_TILE_CACHE_FORMAT / gid / str(level) / str(z) / str(x) / f"{y}.geojson"
+    # Tiles written before the GADM file last changed are rebuilt, as for geometry previews.
+    if not _cache_file_fresh(path, source_mtime):
+        collection = {"type": "FeatureCollection", "features": _gadm_tile_features(gid, level, z, x, y)}
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(json.dumps(collection, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp_path, path)
+    # Preview iframes are sandboxed (origin "null"); tiles are public, so allow any origin.
+    return FileResponse(
+        path,
+        media_type="application/geo+json",
+        headers={"Cache-Control": "public, max-age=86400", "Access-Control-Allow-Origin": "*"},
+    )
+
+# Per-unit geometry previews: one simplified GeoJSON Feature per (gid, tolerance), built from
+# the tile sources and cached on disk next to the tiles. Cache files are rebuilt when their
+# GADM file is newer; the ETag is derived from the cache file, so clients revalidate cheaply.
+GADM_GEOMETRY_DEFAULT_TOLERANCE = 0.01
+GADM_GEOMETRY_MAX_TOLERANCE = 1.0
+GADM_GEOMETRY_MAX_GIDS = 200
+# Allowed tolerances: the tile simplification at each zoom (half a pixel of a 256px tile), so a
+# gid has at most GADM_TILE_MAX_ZOOM + 2 cache variants (one per zoom, plus 0 for full detail).
+GADM_GEOMETRY_TOLERANCE_LEVELS = [360.0 / 2 ** z / GADM_TILE_SIZE / 2 for z in range(GADM_TILE_MAX_ZOOM + 1)]
+
+
+class GadmGeometryRequest(BaseModel):
+    gids: List[str]
+    tolerance: float = GADM_GEOMETRY_DEFAULT_TOLERANCE
+
+
+def _gadm_geometry_tolerance(tolerance: float) -> str:
+    """Canonical tolerance string: the coarsest allowed level no coarser than requested (0 stays 0).
+
+    Requests finer than the deepest tile zoom get that zoom's tolerance.
+    """
+    if not math.isfinite(tolerance) or tolerance < 0 or tolerance > GADM_GEOMETRY_MAX_TOLERANCE:
+        raise HTTPException(status_code=400, detail=f"tolerance must be between 0 and {GADM_GEOMETRY_MAX_TOLERANCE}")
+    if not tolerance:
+        return "0"
+    level = next((t for t in GADM_GEOMETRY_TOLERANCE_LEVELS if t <= tolerance), GADM_GEOMETRY_TOLERANCE_LEVELS[-1])
+    return f"{level:.6g}"
+
+
+def _gadm_geometry_files(gids: List[str], tolerance: str) -> Dict[str, Path]:
+    """Cached simplified Feature per gid, built on a miss; gids not in GADM are left out.
+
+    Misses are grouped by (country, level), so a batch loads each GADM file once however many
+    files it spans, instead of cycling them through the small tile-source LRU.
+    """
+    found: Dict[str, Path] = {}
+    source_mtimes: Dict[Tuple[str, int], Optional[int]] = {}
+    misses: Dict[Tuple[str, int], List[Tuple[str, Path]]] = defaultdict(list)
+    for gid in gids:
+        key = (gid.split(".")[0], gid.count("."))
+        if key not in source_mtimes:
+            source_mtimes[key] = _gadm_source_mtime(*key)
+        if source_mtimes[key] is None:
+            continue
+        path = GADM_GEOMETRY_CACHE_DIR / key[0] / str(key[1]) / f"{gid}@{tolerance}.geojson"
+        if _cache_file_fresh(path, source_mtimes[key]):
+            found[gid] = path
+        else:
+            misses[key].append((gid, path))
+    tol = float(tolerance)
+    for (country, level), group in misses.items():
+        source = _gadm_tile_source(country, level)
+        if source is None:
+            continue
+        for gid, path in group:
+            i = source["ids"].get(gid)
+            if i is None:
+                continue
+            geom = source["geoms"][i]
+            if tol:
+                geom = shapely.set_precision(geom.simplify(tol, preserve_topology=True), tol / 4, mode="pointwise")
+            feature = {
+                "type": "Feature",
+                "id": gid,
+                "properties": {"gid": gid, "name": source["names"][i], "level": level, "tolerance": tol},
+                "geometry": mapping(geom),
+            }
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp_path.write_text(json.dumps(feature, separators=(",", ":")), encoding="utf-8")
+            os.replace(tmp_path, path)
+            found[gid] = path
+    return found
+
+
+def _file_etag(path: Path) -> str:
+    st = path.stat()
+    return f"{st.st_mtime_ns:x}-{st.st_size:x}"
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match") or ""
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or f'"{etag}"' in tags
+
+
+_GADM_GEOMETRY_HEADERS = {"Cache-Control": "public, max-age=86400", "Access-Control-Allow-Origin": "*"}
+
+
+@app.get("/gadm/geometry/{gid}")
+def gadm_geometry(gid: str, request: Request, tolerance: float = GADM_GEOMETRY_DEFAULT_TOLERANCE):
+    """One unit's outline as a GeoJSON Feature, simplified to ``tolerance`` degrees."""
+    gid = _normalize_gadm_gid(gid)
+    if not _GADM_TILE_GID_RE.match(gid):
+        raise HTTPException(status_code=400, detail="Invalid GADM id")
+    path = _gadm_geometry_files([gid], _gadm_geometry_tolerance(tolerance)).get(gid)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No geometry for this GID")
+    etag = _file_etag(path)
+    headers = {**_GADM_GEOMETRY_HEADERS, "ETag": f'"{etag}"'}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type="application/geo+json", headers=headers)
+
+
+@app.post("/gadm/geometry")
+def gadm_geometry_batch(body: GadmGeometryRequest, request: Request):
+    """FeatureCollection of simplified outlines; gids without geometry are listed in ``missing``."""
+    if len(body.gids) > GADM_GEOMETRY_MAX_GIDS:
+        raise HTTPException(status_code=400, detail=f"At most {GADM_GEOMETRY_MAX_GIDS} gids per request")
+    tolerance = _gadm_geometry_tolerance(body.tolerance)
+    requested = {raw: _normalize_gadm_gid(raw) for raw in dict.fromkeys(body.gids)}
+    files = _gadm_geometry_files([gid for gid in requested.values() if _GADM_TILE_GID_RE.match(gid)], tolerance)
+    paths: List[Path] = []
+    missing: List[str] = []
+    for raw, gid in requested.items():
+        path = files.get(gid)
+        if path is None:
+            missing.append(raw)
+        else:
+            paths.append(path)
+    etag = hashlib.sha256(
+        json.dumps([[p.name, _file_etag(p)] for p in paths] + [missing]).encode("utf-8")
+    ).hexdigest()[:32]
+    headers = {"Cache-Control": "no-cache", "Access-Control-Allow-Origin": "*", "ETag": f'"{etag}"'}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    # Splice the cached Feature files in as-is rather than re-encoding them.
+    features = ",".join(p.read_text(encoding="utf-8") for p in paths)
+    content = f'{{"type":"FeatureCollection","features":[{features}],"missing":{json.dumps(missing)}}}'
+    return Response(content=content, media_type="application/geo+json", headers=headers)
+
+# Point-in-unit lookups: candidate countries come from the level-0 bboxes in the GADM index,
+# then a per (country, level) STRtree over simplified, prepared geometries finds the unit.
+# Trees load lazily and sit in an LRU; they are far smaller than the tile sources.
+GADM_POINT_SIMPLIFY_DEG = 0.001
+_GADM_POINT_SOURCES_MAX = 48
+_gadm_point_sources: "OrderedDict[Tuple[str, int], Optional[Dict[str, Any]]]" = OrderedDict()
+_gadm_point_lock = threading.Lock()
+_gadm_country_boxes_cache: Dict[str, Any] = {}
+
+
+def _gadm_country_boxes() -> Tuple[List[str], np.ndarray]:
+    """(country codes, n x 4 bboxes) of level-0 units with known bounds, cached per installed index."""
+    with _gadm_lock:
+        entries = GADM_INDEX
+    with _gadm_point_lock:
+        if _gadm_country_boxes_cache.get("entries") is entries:
+            return _gadm_country_boxes_cache["codes"], _gadm_country_boxes_cache["boxes"]
+    codes: List[str] = []
+    rows: List[Any] = []
+    if isinstance(entries, _GadmIndexColumns) and entries.geo is not None:
+        for i in entries.level_ids(0).tolist():
+            codes.append(entries.gid(i))
+            rows.append(entries.geo[i, :4])
+    else:
+        for item in entries:
+            geo = _gadm_entry_geo(item) if item.get("level") == 0 else None
+            if geo is not None:
+                codes.append(item["gid"])
+                rows.append(geo[:4])
+    boxes = np.asarray(rows, dtype=np.float64).reshape(-1, 4)
+    # NaN rows: countries whose level-0 file couldn't be read when a legacy cache was converted.
+    finite = np.isfinite(boxes).all(axis=1)
+    if not finite.all():
+        codes = [code for code, ok in zip(codes, finite.tolist()) if ok]
+        boxes = boxes[finite]
+    with _gadm_point_lock:
+        _gadm_country_boxes_cache.update(entries=entries, codes=codes, boxes=boxes)
+    return codes, boxes
+
+
+def _gadm_countries_at(lng: float, lat: float) -> List[str]:
+    codes, boxes = _gadm_country_boxes()
+    hit = (boxes[:, 0] <= lng) & (lng <= boxes[:, 2]) & (boxes[:, 1] <= lat) & (lat <= boxes[:, 3])
+    found = [codes[i] for i in np.flatnonzero(hit).tolist()]
+    # Countries without level-0 bounds (see _gadm_country_boxes) can't be ruled out.
+    with _gadm_lock:
+        indexed = list(COUNTRY_LEVELS_INDEX)
+    known = set(codes)
+    return found + [c for c in indexed if c not in known]
+
+
+def _gadm_point_source(country: str, level: int) -> Optional[Dict[str, Any]]:
+    key = (country, level)
+    with _gadm_point_lock:
+        if key in _gadm_point_sources:
+            _gadm_point_sources.move_to_end(key)
+            return _gadm_point_sources[key]
+    features = _load_gadm_features(country, level)
+    source = None
+    if features is not None:
+        gids, names, geoms = features
+        simplified = shapely.simplify(np.asarray(geoms, dtype=object), GADM_POINT_SIMPLIFY_DEG, preserve_topology=True)
+        shapely.prepare(simplified)
+        source = {"gids": gids, "names": names, "geoms": simplified, "tree": STRtree(simplified)}
+    with _gadm_point_lock:
+        _gadm_point_sources[key] = source
+        _gadm_point_sources.move_to_end(key)
+        while len(_gadm_point_sources) > _GADM_POINT_SOURCES_MAX:
+            _gadm_point_sources.popitem(last=False)
+    return source
+
+
+@app.get("/gadm/at")
+def gadm_at(lat: float, lng: float, level: int = 0):
+    """The admin unit containing a point, at ``level`` or the country's deepest level above it."""
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+        raise HTTPException(status_code=400, detail="Invalid coordinates")
+    if level < 0 or level > GADM_TILE_MAX_LEVEL:
+        raise HTTPException(status_code=400, detail="Invalid GADM level")
+    point = shapely.Point(lng, lat)
+    for country in _gadm_countries_at(lng, lat):
+        with _gadm_lock:
+            levels = COUNTRY_LEVELS_INDEX.get(country, [0])
+        usable = [lv for lv in levels if lv <= level]
+        if not usable:
+            continue
+        unit_level = max(usable)
+        source = _gadm_point_source(country, unit_level)
+        if source is None:
+            continue
+        hits = source["tree"].query(point, predicate="intersects")
+        if not hits.size:
+            continue
+        i = int(hits.min())
+        gid = source["gids"][i]
+        with _gadm_lock:
+            entries = GADM_INDEX
+        idx = entries.find(gid) if isinstance(entries, _GadmIndexColumns) else None
+        if idx is not None:
+            return entries[idx]
+        return {"gid": gid, "name": source["names"][i], "country": None, "level": unit_level}
+    raise HTTPException(status_code=404, detail="No admin unit at this point")
+
 class CodeRequest(BaseModel):
     code: str
     predefined_code: Optional[str] = None
@@ -1434,6 +4156,10 @@ class CodeRequest(BaseModel):
     runtime_code: Optional[str] = None
     runtime_theme_code: Optional[str] = None
     runtime_predefined_code: Optional[str] = None
+    payload_encoding: Optional[str] = None
+    payload_quantization: Optional[int] = None
+    api_base_url: Optional[str] = None
+    progressive_geometry: bool = False
     trusted_user: bool = False
 
 class CodeSyncRequest(BaseModel):
@@ -1458,6 +4184,10 @@ class BuilderRequest(BaseModel):
     runtime_predefined_code: Optional[str] = None
     runtime_elements: Optional[List[MapElement]] = None
     runtime_options: Optional[Dict[str, Any]] = None
+    payload_encoding: Optional[str] = None
+    payload_quantization: Optional[int] = None
+    api_base_url: Optional[str] = None
+    progressive_geometry: bool = False
     trusted_user: bool = False
 
 class PickerEntry(BaseModel):
@@ -1468,6 +4198,8 @@ class PickerRequest(BaseModel):
     entries: List[PickerEntry]
     adminRivers: bool = False
     basemaps: Optional[List[Dict[str, Any]]] = None
+    payload_encoding: Optional[str] = None
+    payload_quantization: Optional[int] = None
 
 class TerritoryLibraryRequest(BaseModel):
     source: str = "builtin"  # "builtin" or "custom"
@@ -1475,6 +4207,8 @@ class TerritoryLibraryRequest(BaseModel):
     selected_names: Optional[List[str]] = None
     basemaps: Optional[List[Dict[str, Any]]] = None
     hub_path: Optional[str] = None
+    payload_encoding: Optional[str] = None
+    payload_quantization: Optional[int] = None
 
 class StopRequest(BaseModel):
     task_types: Optional[List[str]] = None
@@ -1545,7 +4279,13 @@ def _require_admin_user(conn: sqlite3.Connection, request: Request) -> sqlite3.R
     return user
 
 
-def _hub_artifact_response(conn: sqlite3.Connection, artifact: sqlite3.Row, request: Optional[Request] = None) -> Dict[str, Any]:
+def _hub_artifact_response(
+    conn: sqlite3.Connection,
+    artifact: sqlite3.Row,
+    request: Optional[Request] = None,
+    include_content: bool = True,
+) -> Dict[str, Any]:
+    """Artifact summary; include_content=False leaves out the alpha content without reading it."""
     versions_rows = conn.execute(
         """
         SELECT version, created_at
@@ -1562,26 +4302,26 @@ def _hub_artifact_response(conn: sqlite3.Connection, artifact: sqlite3.Row, requ
     latest_version = versions[0]["version"] if versions else None
     latest_content_hash = None
     if latest_version is not None:
-        latest_content = conn.execute(
-            "SELECT content FROM hub_artifact_versions WHERE artifact_id = ? AND version = ?",
+        latest_content_hash = conn.execute(
+            "SELECT content_hash FROM hub_artifact_versions WHERE artifact_id = ? AND version = ?",
             (artifact["id"], latest_version),
-        ).fetchone()
-        if latest_content is not None:
-            latest_content_hash = _sha256_text(latest_content["content"] or "")
+        ).fetchone()["content_hash"]
     alpha_meta = _sanitize_artifact_metadata(artifact["kind"], artifact["alpha_metadata"])
+    alpha: Dict[str, Any] = {
+        "version": "alpha",
+        "metadata": alpha_meta,
+        "updated_at": artifact["updated_at"],
+        "content_hash": artifact["alpha_content_hash"],
+    }
+    if include_content:
+        alpha["content"] = _hub_alpha_content(conn, artifact["id"])
     return {
         "id": int(artifact["id"]),
         "username": artifact["username"],
         "kind": _hub_kind_label(artifact["kind"]),
         "name": artifact["name"],
         "slug": f'/{_hub_kind_label(artifact["kind"])}/{artifact["name"]}',
-        "alpha": {
-            "version": "alpha",
-            "content": artifact["alpha_content"] or "",
-            "metadata": alpha_meta,
-            "content_hash": _sha256_text(artifact["alpha_content"] or ""),
-            "updated_at": artifact["updated_at"],
-        },
+        "alpha": alpha,
         "latest_published_version": latest_version,
         "latest_published_content_hash": latest_content_hash,
         "published_versions": versions,
@@ -1594,6 +4334,42 @@ def _hub_artifact_response(conn: sqlite3.Connection, artifact: sqlite3.Row, requ
     }
 
 
+def _hub_conditional_json(
+    request: Optional[Request],
+    body: Dict[str, Any],
+    add_content: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Response:
+    """JSON response with a strong ETag; ``add_content`` fills in the content once it is needed.
+
+    ``body`` is everything but the content and carries the stored content hashes, so the tag
+    is known, and a matching If-None-Match answered with 304, before any content is read.
+    """
+    etag = _sha256_text(json.dumps([body, add_content is not None], sort_keys=True, separators=(",", ":")))
+    # Votes and viewer_voted are per viewer, so shared caches must not keep the body.
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"}
+    if request is not None and _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    if add_content is not None:
+        add_content(body)
+    return JSONResponse(body, headers=headers)
+
+
+def _hub_artifact_get_response(
+    conn: sqlite3.Connection,
+    artifact: sqlite3.Row,
+    request: Request,
+    include_content: bool = True,
+) -> Response:
+    body = _hub_artifact_response(conn, artifact, request=request, include_content=False)
+    if not include_content:
+        return _hub_conditional_json(request, body)
+
+    def add_content(payload: Dict[str, Any]) -> None:
+        payload["alpha"]["content"] = _hub_alpha_content(conn, artifact["id"])
+
+    return _hub_conditional_json(request, body, add_content)
+
+
 def _session_expiry_iso() -> str:
     expiry = datetime.now(timezone.utc) + timedelta(days=SESSION_TTL_DAYS)
     return expiry.replace(microsecond=0).isoformat()
@@ -1607,23 +4383,15 @@ def _parse_iso(ts: str) -> datetime:
 
 
 def _user_public_profile(conn: sqlite3.Connection, user_row: sqlite3.Row) -> Dict[str, Any]:
-    maps_count = conn.execute(
+    counts = conn.execute(
         """
-        SELECT COUNT(*) AS c
+        SELECT COUNT(*) AS maps_count, COALESCE(SUM(views_count), 0) AS views_count
         FROM hub_artifacts
         WHERE user_id = ? AND kind = 'map'
         """,
         (user_row["id"],),
-    ).fetchone()["c"]
-    views_count = conn.execute(
-        """
-        SELECT COUNT(*) AS c
-        FROM hub_map_views mv
-        JOIN hub_artifacts a ON a.id = mv.artifact_id
-        WHERE a.user_id = ? AND a.kind = 'map'
-        """,
-        (user_row["id"],),
-    ).fetchone()["c"]
+    ).fetchone()
+    maps_count, views_count = counts["maps_count"], counts["views_count"]
     return {
         "username": user_row["username"],
         "full_name": user_row["full_name"] if "full_name" in user_row.keys() else "",
@@ -1639,35 +4407,82 @@ def _user_public_profile(conn: sqlite3.Connection, user_row: sqlite3.Row) -> Dic
 def _session_user_from_token(conn: sqlite3.Connection, token: Optional[str]) -> Optional[sqlite3.Row]:
     if not token:
         return None
+    global session_cache_epoch, session_cache_generation
     token_hash = _sha256_text(token)
-    row = conn.execute(
-        """
-        SELECT u.*
-        FROM hub_sessions s
-        JOIN hub_users u ON u.id = s.user_id
-        WHERE s.token_hash = ?
-        """,
-        (token_hash,),
-    ).fetchone()
-    if row is None:
-        return None
-    expiry_row = conn.execute(
-        "SELECT expires_at FROM hub_sessions WHERE token_hash = ?",
-        (token_hash,),
-    ).fetchone()
-    if expiry_row is None:
+    epoch = conn.execute("SELECT epoch FROM hub_session_epoch WHERE id = 1").fetchone()
+    epoch = int(epoch[0]) if epoch is not None else 0
+    with session_cache_lock:
+        if epoch != session_cache_epoch:
+            session_cache.clear()
+            session_cache_generation += 1
+            session_cache_epoch = epoch
+        entry = session_cache.get(token_hash)
+        if entry is not None and entry[2] > time.monotonic():
+            session_cache.move_to_end(token_hash)
+        else:
+            entry = None
+        generation = session_cache_generation
+    if entry is None:
+        row = conn.execute(
+            """
+            SELECT u.*, s.expires_at AS session_expires_at
+            FROM hub_sessions s
+            JOIN hub_users u ON u.id = s.user_id
+            WHERE s.token_hash = ?
+            """,
+            (token_hash,),
+        ).fetchone()
+        if row is None:
+            return None
+        entry = (row, _parse_iso(row["session_expires_at"]), time.monotonic() + SESSION_CACHE_TTL_SECONDS)
+        with session_cache_lock:
+            if generation == session_cache_generation:
+                session_cache[token_hash] = entry
+                session_cache.move_to_end(token_hash)
+                while len(session_cache) > SESSION_CACHE_MAX_ENTRIES:
+                    session_cache.popitem(last=False)
+    # Expired rows are left for _sweep_expired_sessions so lookups never write.
+    if entry[1] <= datetime.now(timezone.utc):
         return None
-    expires_at = _parse_iso(expiry_row["expires_at"])
-    if expires_at <= datetime.now(timezone.utc):
-        conn.execute("DELETE FROM hub_sessions WHERE token_hash = ?", (token_hash,))
+    return entry[0]
+
+
+def _invalidate_sessions(token_hash: Optional[str] = None, user_id: Optional[int] = None) -> None:
+    """Drop cached sessions for one token and/or every session of a user whose row changed."""
+    global session_cache_generation
+    with session_cache_lock:
+        session_cache_generation += 1
+        if token_hash is not None:
+            session_cache.pop(token_hash, None)
+        if user_id is not None:
+            for key in [k for k, entry in session_cache.items() if int(entry[0]["id"]) == int(user_id)]:
+                del session_cache[key]
+
+
+def _sweep_expired_sessions() -> int:
+    conn = _hub_db_conn()
+    try:
+        cur = conn.execute("DELETE FROM hub_sessions WHERE expires_at <= ?", (_utc_now_iso(),))
         conn.commit()
-        return None
-    return row
+    finally:
+        conn.close()
+    now = datetime.now(timezone.utc)
+    with session_cache_lock:
+        for key in [k for k, entry in session_cache.items() if entry[1] <= now]:
+            del session_cache[key]
+    return cur.rowcount
 
 
 def _request_user(conn: sqlite3.Connection, request: Request) -> Optional[sqlite3.Row]:
-    token = request.cookies.get(SESSION_COOKIE)
-    return _session_user_from_token(conn, token)
+    """The session user for this request, resolved once and remembered on request.state."""
+    if not hasattr(request.state, "hub_user"):
+        request.state.hub_user = _session_user_from_token(conn, request.cookies.get(SESSION_COOKIE))
+    return request.state.hub_user
+
+
+def _request_identity(request: Request, conn: sqlite3.Connection = Depends(_hub_read_db)) -> Optional[sqlite3.Row]:
+    """FastAPI dependency: the session user (or None), sharing the request's read connection."""
+    return _request_user(conn, request)
 
 
 def _ensure_guest_id(request: Request, response: Optional[Response] = None) -> str:
@@ -1707,26 +4522,6 @@ def _next_available_map_name(conn: sqlite3.Connection, username: str = "", base_
         i += 1
     return f"{base}_{i}"
 
-def _python_value(node: ast.AST):
-    if isinstance(node, ast.Constant):
-        return node.value
-    if isinstance(node, ast.List):
-        return [_python_value(el) for el in node.elts]
-    if isinstance(node, ast.Tuple):
-        return [_python_value(el) for el in node.elts]
-    if isinstance(node, ast.Dict):
-        return {_python_value(k): _python_value(v) for k, v in zip(node.keys, node.values)}
-    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and isinstance(node.operand, ast.Constant):
-        return -node.operand.value
-    if isinstance(node, ast.Name):
-        if node.id == "None":
-            return None
-        if node.id == "True":
-            return True
-        if node.id == "False":
-            return False
-    return None
-
 PYTHON_EXPR_KEY = "__xatra_python__"
 
 def _is_python_expr_value(value: Any) -> bool:
@@ -1773,14 +4568,6 @@ def _is_simple_python_value(node: ast.AST) -> bool:
         return True
     return False
 
-def _call_name(node: ast.AST) -> Optional[str]:
-    if isinstance(node, ast.Name):
-        return node.id
-    if isinstance(node, ast.Attribute):
-        base = _call_name(node.value)
-        return f"{base}.{node.attr}" if base else node.attr
-    return None
-
 def _parse_color_literal_node(node: ast.AST) -> Optional[str]:
     if isinstance(node, ast.Call):
         cname = _call_name(node.func)
@@ -2660,7 +5447,7 @@ def _extract_territory_library_struct(content: str) -> Dict[str, Any]:
 
 def _territory_value_expr(part_type: str, value: Any) -> Optional[str]:
     if part_type == "gadm":
-        vals = value if isinstance(value, list) else [value]
+        vals = _expand_gadm_values(value if isinstance(value, list) else [value])
         terms = [f"gadm({json.dumps(str(v))})" for v in vals if isinstance(v, str) and str(v).strip()]
         return " | ".join(terms) if terms else None
     if part_type == "predefined":
@@ -2987,7 +5774,9 @@ def territory_library_catalog(request: TerritoryLibraryRequest):
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    with _gadm_lock:
+        gadm_index = dict(GADM_INDEX_PROGRESS)
+    return {"status": "ok", "gadm_index": gadm_index}
 
 
 @app.get("/favicon.ico", include_in_schema=False)
@@ -2997,13 +5786,13 @@ def favicon():
 
 
 def _map_vote_count(conn: sqlite3.Connection, artifact_id: int) -> int:
-    row = conn.execute("SELECT COUNT(*) AS c FROM hub_votes WHERE artifact_id = ?", (artifact_id,)).fetchone()
-    return int(row["c"] if row else 0)
+    row = conn.execute("SELECT votes_count FROM hub_artifacts WHERE id = ?", (artifact_id,)).fetchone()
+    return int(row["votes_count"] if row else 0)
 
 
 def _map_view_count(conn: sqlite3.Connection, artifact_id: int) -> int:
-    row = conn.execute("SELECT COUNT(*) AS c FROM hub_map_views WHERE artifact_id = ?", (artifact_id,)).fetchone()
-    return int(row["c"] if row else 0)
+    row = conn.execute("SELECT views_count FROM hub_artifacts WHERE id = ?", (artifact_id,)).fetchone()
+    return int(row["views_count"] if row else 0)
 
 
 def _normalize_map_sort(sort: Optional[str]) -> str:
@@ -3011,14 +5800,120 @@ def _normalize_map_sort(sort: Optional[str]) -> str:
     return key if key in {"default", "votes", "views", "recency"} else "default"
 
 
+_MAP_SORT_COLUMNS = {
+    "default": ("featured", "votes_count", "views_count", "updated_at"),
+    "votes": ("votes_count", "views_count", "updated_at"),
+    "views": ("views_count", "votes_count", "updated_at"),
+    "recency": ("updated_at", "votes_count", "views_count"),
+}
+
+
 def _map_sort_order_sql(sort: str) -> str:
-    if sort == "votes":
-        return "COALESCE(vv.votes_count, 0) DESC, COALESCE(mv.views_count, 0) DESC, a.updated_at DESC"
-    if sort == "views":
-        return "COALESCE(mv.views_count, 0) DESC, COALESCE(vv.votes_count, 0) DESC, a.updated_at DESC"
-    if sort == "recency":
-        return "a.updated_at DESC, COALESCE(vv.votes_count, 0) DESC, COALESCE(mv.views_count, 0) DESC"
-    return "a.featured DESC, COALESCE(vv.votes_count, 0) DESC, COALESCE(mv.views_count, 0) DESC, a.updated_at DESC"
+    # Each ordering matches an idx_hub_artifacts_sort_* index column for column; a.id ASC is the
+    # rowid those indexes end in, so the order is total (as keyset cursors need) at no cost.
+    return ", ".join(f"a.{col} DESC" for col in _MAP_SORT_COLUMNS[sort]) + ", a.id ASC"
+
+
+def _encode_cursor(values: List[Any]) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: Optional[str], tag: str, size: int) -> Optional[List[Any]]:
+    """Values after the tag in a listing cursor (None for the first page); 400 if it isn't one of ``tag``'s."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        values = None
+    if (
+        not isinstance(values, list)
+        or len(values) != size + 1
+        or values[0] != tag
+        or any(isinstance(v, (list, dict)) for v in values)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values[1:]
+
+
+def _map_keyset(sort: str, ranked: bool, cursor: Optional[str]) -> Tuple[Optional[str], List[Any]]:
+    """Condition (and parameters) for the map rows after ``cursor`` in a _map_sort_order_sql listing.
+
+    The row-value bound on the sort columns is a range seek on the matching sort index, so every
+    page costs the same; only rows tied on all of them are filtered by id. With ``ranked`` the
+    listing is ordered by FTS rank first and the cursor carries the last row's bm25 score.
+    """
+    cols = _MAP_SORT_COLUMNS[sort]
+    values = _decode_cursor(cursor, _map_cursor_tag(sort, ranked), len(cols) + (2 if ranked else 1))
+    if values is None:
+        return None, []
+    rank, keys, last_id = (values[0] if ranked else None), values[int(ranked):-1], values[-1]
+    row = "(" + ", ".join(f"a.{col}" for col in cols) + ")"
+    marks = "(" + ", ".join("?" for _ in cols) + ")"
+    condition = f"{row} <= {marks} AND ({row} < {marks} OR a.id > ?)"
+    params = [*keys, *keys, last_id]
+    if ranked:
+        condition = f"({_HUB_FTS_RANK_SQL} > ? OR ({_HUB_FTS_RANK_SQL} = ? AND {condition}))"
+        params = [rank, rank, *params]
+    return condition, params
+
+
+def _map_cursor_tag(sort: str, ranked: bool) -> str:
+    return f"{sort}:ranked" if ranked else sort
+
+
+def _map_cursor(sort: str, ranked: bool, row: sqlite3.Row) -> str:
+    """Cursor for the rows after ``row``, which must select id, the sort columns and (if ranked) rank."""
+    ranks = [row["rank"]] if ranked else []
+    return _encode_cursor([_map_cursor_tag(sort, ranked), *ranks, *(row[col] for col in _MAP_SORT_COLUMNS[sort]), row["id"]])
+
+
+def _count_listing(conn: sqlite3.Connection, count_sql: str, params: Tuple[Any, ...]) -> int:
+    return int(conn.execute(count_sql, params).fetchone()[0] or 0)
+
+
+def _listing_total(conn: sqlite3.Connection, count_sql: str, params: Tuple[Any, ...]) -> int:
+    """Total for a listing's filters. Counted once, then served from memory and recounted in a
+    background thread once older than LISTING_TOTAL_TTL_SECONDS, so pages don't repeat the count."""
+    key = (count_sql, params)
+    now = time.monotonic()
+    with listing_total_lock:
+        entry = listing_total_cache.get(key)
+        if entry is not None:
+            listing_total_cache.move_to_end(key)
+            total, counted_at, refreshing = entry
+            if refreshing or now - counted_at < LISTING_TOTAL_TTL_SECONDS:
+                return total
+            listing_total_cache[key] = (total, counted_at, True)
+    if entry is None:
+        total = _count_listing(conn, count_sql, params)
+        _store_listing_total(key, total)
+        return total
+
+    def _refresh():
+        try:
+            refresh_conn = _hub_db_conn(readonly=True)
+            try:
+                _store_listing_total(key, _count_listing(refresh_conn, count_sql, params))
+            finally:
+                refresh_conn.close()
+        except Exception as e:
+            print(f"[xatra] Warning: failed to refresh listing total: {e}", file=sys.stderr)
+            with listing_total_lock:
+                if key in listing_total_cache:
+                    listing_total_cache[key] = (entry[0], entry[1], False)
+
+    threading.Thread(target=_refresh, daemon=True).start()
+    return entry[0]
+
+
+def _store_listing_total(key: Tuple[str, Tuple[Any, ...]], total: int) -> None:
+    with listing_total_lock:
+        listing_total_cache[key] = (total, time.monotonic(), False)
+        listing_total_cache.move_to_end(key)
+        while len(listing_total_cache) > LISTING_TOTAL_MAX_ENTRIES:
+            listing_total_cache.popitem(last=False)
 
 
 def _require_write_identity(conn: sqlite3.Connection, request: Request, username: str) -> Optional[sqlite3.Row]:
@@ -3147,8 +6042,10 @@ def auth_logout(request: Request, response: Response):
     conn = _hub_db_conn()
     try:
         if token:
-            conn.execute("DELETE FROM hub_sessions WHERE token_hash = ?", (_sha256_text(token),))
+            token_hash = _sha256_text(token)
+            conn.execute("DELETE FROM hub_sessions WHERE token_hash = ?", (token_hash,))
             conn.commit()
+            _invalidate_sessions(token_hash=token_hash)
     finally:
         conn.close()
     response.delete_cookie(SESSION_COOKIE)
@@ -3157,7 +6054,7 @@ def auth_logout(request: Request, response: Response):
 
 @app.get("/auth/me")
 def auth_me(request: Request, response: Response):
-    conn = _hub_db_conn()
+    conn = _hub_db_conn(readonly=True)
     try:
         user = _request_user(conn, request)
         guest_id = _ensure_guest_id(request, response=response)
@@ -3206,6 +6103,7 @@ def auth_update_profile(request: Request, payload: UserProfileUpdateRequest):
             (str(payload.full_name or "").strip(), str(payload.bio or "").strip(), user["id"]),
         )
         conn.commit()
+        _invalidate_sessions(user_id=user["id"])
         updated = conn.execute("SELECT * FROM hub_users WHERE id = ?", (user["id"],)).fetchone()
         return {"user": _user_public_profile(conn, updated)}
     finally:
@@ -3232,6 +6130,7 @@ def auth_update_password(request: Request, payload: PasswordUpdateRequest):
             raise HTTPException(status_code=400, detail="New password must be at least 8 characters")
         conn.execute("UPDATE hub_users SET password_hash = ? WHERE id = ?", (_hash_password(payload.new_password), user["id"]))
         conn.commit()
+        _invalidate_sessions(user_id=user["id"])
         return {"ok": True}
     finally:
         conn.close()
@@ -3254,6 +6153,7 @@ def auth_set_user_trusted(username: str, payload: UserTrustUpdateRequest, reques
             (1 if trusted else 0, row["id"]),
         )
         conn.commit()
+        _invalidate_sessions(user_id=row["id"])
         updated = conn.execute("SELECT * FROM hub_users WHERE id = ?", (row["id"],)).fetchone()
         return {"ok": True, "user": _user_public_profile(conn, updated)}
     finally:
@@ -3262,7 +6162,7 @@ def auth_set_user_trusted(username: str, payload: UserTrustUpdateRequest, reques
 
 @app.get("/maps/default-name")
 def maps_default_name(request: Request):
-    conn = _hub_db_conn()
+    conn = _hub_db_conn(readonly=True)
     try:
         user = _request_user(conn, request)
         owner = user["username"] if user else GUEST_USERNAME
@@ -3292,7 +6192,7 @@ def maps_default_name(request: Request):
 
 @app.get("/maps/resolve-name")
 def maps_resolve_name(request: Request, base: str = "new_map"):
-    conn = _hub_db_conn()
+    conn = _hub_db_conn(readonly=True)
     try:
         user = _request_user(conn, request)
         owner = user["username"] if user else GUEST_USERNAME
@@ -3305,7 +6205,7 @@ def maps_resolve_name(request: Request, base: str = "new_map"):
 @app.get("/maps/{name}")
 def maps_get_by_name(name: str, version: str = "alpha", http_request: Request = None):
     """Load a map by name only (no username required; globally unique)."""
-    conn = _hub_db_conn()
+    conn = _hub_db_conn(readonly=True)
     try:
         artifact = _hub_get_artifact_by_name(conn, "map", name)
         if artifact is None:
@@ -3403,7 +6303,7 @@ def maps_set_featured(map_name: str, payload: MapFeaturedUpdateRequest, request:
 @app.get("/explore")
 def maps_explore(
     q: Optional[str] = None,
-    page: int = 1,
+    cursor: Optional[str] = None,
     per_page: int = 12,
     sort: Optional[str] = "default",
 ):
@@ -3415,29 +6315,36 @@ def maps_explore(
             user_filter = token[5:]
         elif token:
             text_terms.append(token)
-    safe_page = max(1, int(page or 1))
     safe_per_page = max(1, min(int(per_page or 12), 30))
     sort_key = _normalize_map_sort(sort)
     order_sql = _map_sort_order_sql(sort_key)
-    offset = (safe_page - 1) * safe_per_page
-    conn = _hub_db_conn()
+    conn = _hub_db_conn(readonly=True)
     try:
         where = ["a.kind = 'map'"]
         params: List[Any] = []
         if user_filter:
             where.append("LOWER(u.username) = ?")
             params.append(user_filter)
-        for term in text_terms:
-            where.append("(LOWER(a.name) LIKE ? ESCAPE '\\' OR LOWER(a.alpha_metadata) LIKE ? ESCAPE '\\' OR LOWER(u.username) LIKE ? ESCAPE '\\')")
-            # Escape LIKE wildcards so user input is treated as literal text
-            escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
-            like = f"%{escaped}%"
-            params.extend([like, like, like])
-        where_sql = "WHERE " + " AND ".join(where)
-        total = conn.execute(
-            f"SELECT COUNT(*) AS c FROM hub_artifacts a JOIN hub_users u ON u.id = a.user_id {where_sql}",
+        fts_join = ""
+        rank_sql = "NULL"
+        match = _hub_fts_match(text_terms)
+        if match is not None:
+            fts_join = "JOIN hub_artifacts_fts ON hub_artifacts_fts.rowid = a.id"
+            where.append("hub_artifacts_fts MATCH ?")
+            params.append(match)
+            if sort_key == "default":
+                rank_sql = _HUB_FTS_RANK_SQL
+                order_sql = f"{_HUB_FTS_RANK_SQL}, {order_sql}"
+        ranked = rank_sql != "NULL"
+        total = _listing_total(
+            conn,
+            f"SELECT COUNT(*) FROM hub_artifacts a JOIN hub_users u ON u.id = a.user_id {fts_join} WHERE {' AND '.join(where)}",
             tuple(params),
-        ).fetchone()["c"]
+        )
+        keyset, keyset_params = _map_keyset(sort_key, ranked, cursor)
+        if keyset is not None:
+            where.append(keyset)
+            params.extend(keyset_params)
         rows = conn.execute(
             f"""
             SELECT
@@ -3448,28 +6355,21 @@ def maps_explore(
                 a.featured,
                 u.username,
                 u.is_admin,
-                COALESCE(vv.votes_count, 0) AS votes_count,
-                COALESCE(mv.views_count, 0) AS views_count
+                a.votes_count,
+                a.views_count,
+                {rank_sql} AS rank
             FROM hub_artifacts a
             JOIN hub_users u ON u.id = a.user_id
-            LEFT JOIN (
-                SELECT artifact_id, COUNT(*) AS votes_count
-                FROM hub_votes
-                GROUP BY artifact_id
-            ) vv ON vv.artifact_id = a.id
-            LEFT JOIN (
-                SELECT artifact_id, COUNT(*) AS views_count
-                FROM hub_map_views
-                GROUP BY artifact_id
-            ) mv ON mv.artifact_id = a.id
-            {where_sql}
+            {fts_join}
+            WHERE {' AND '.join(where)}
             ORDER BY {order_sql}
-            LIMIT ? OFFSET ?
+            LIMIT ?
             """,
-            (*params, safe_per_page, offset),
+            (*params, safe_per_page + 1),
         ).fetchall()
+        next_cursor = _map_cursor(sort_key, ranked, rows[safe_per_page - 1]) if len(rows) > safe_per_page else None
         items = []
-        for row in rows:
+        for row in rows[:safe_per_page]:
             meta = _json_parse(row["alpha_metadata"], {})
             items.append({
                 "username": row["username"],
@@ -3483,7 +6383,7 @@ def maps_explore(
                 "updated_at": row["updated_at"],
                 "thumbnail": meta.get("thumbnail") or "/vite.svg",
             })
-        return {"items": items, "page": safe_page, "per_page": safe_per_page, "total": int(total or 0), "sort": sort_key}
+        return {"items": items, "per_page": safe_per_page, "total": total, "sort": sort_key, "next_cursor": next_cursor}
     finally:
         conn.close()
 
@@ -3491,14 +6391,13 @@ def maps_explore(
 @app.get("/users")
 def users_list(
     q: Optional[str] = None,
-    page: int = 1,
+    cursor: Optional[str] = None,
     per_page: int = 20,
 ):
     query = str(q or "").strip().lower()
-    safe_page = max(1, int(page or 1))
     safe_per_page = max(1, min(int(per_page or 20), 50))
-    offset = (safe_page - 1) * safe_per_page
-    conn = _hub_db_conn()
+    after = _decode_cursor(cursor, "users", 1)
+    conn = _hub_db_conn(readonly=True)
     try:
         where = []
         params: List[Any] = []
@@ -3508,10 +6407,12 @@ def users_list(
             where.append("(LOWER(u.username) LIKE ? ESCAPE '\\' OR LOWER(u.full_name) LIKE ? ESCAPE '\\' OR LOWER(u.bio) LIKE ? ESCAPE '\\')")
             params.extend([like, like, like])
         where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-        total = conn.execute(
-            f"SELECT COUNT(*) AS c FROM hub_users u {where_sql}",
-            tuple(params),
-        ).fetchone()["c"]
+        total = _listing_total(conn, f"SELECT COUNT(*) FROM hub_users u {where_sql}", tuple(params))
+        if after is not None:
+            # Usernames are unique, so they are the whole keyset (a seek on the UNIQUE index).
+            where.append("u.username > ?")
+            params.append(after[0])
+            where_sql = "WHERE " + " AND ".join(where)
         rows = conn.execute(
             f"""
             SELECT
@@ -3522,27 +6423,21 @@ def users_list(
                 u.is_trusted,
                 u.created_at,
                 COALESCE(mc.maps_count, 0) AS maps_count,
-                COALESCE(vc.views_count, 0) AS views_count
+                COALESCE(mc.views_count, 0) AS views_count
             FROM hub_users u
             LEFT JOIN (
-                SELECT user_id, COUNT(*) AS maps_count
+                SELECT user_id, COUNT(*) AS maps_count, SUM(views_count) AS views_count
                 FROM hub_artifacts
                 WHERE kind = 'map'
                 GROUP BY user_id
             ) mc ON mc.user_id = u.id
-            LEFT JOIN (
-                SELECT a.user_id, COUNT(*) AS views_count
-                FROM hub_map_views mv
-                JOIN hub_artifacts a ON a.id = mv.artifact_id
-                WHERE a.kind = 'map'
-                GROUP BY a.user_id
-            ) vc ON vc.user_id = u.id
             {where_sql}
             ORDER BY u.username ASC
-            LIMIT ? OFFSET ?
+            LIMIT ?
             """,
-            (*params, safe_per_page, offset),
+            (*params, safe_per_page + 1),
         ).fetchall()
+        next_cursor = _encode_cursor(["users", rows[safe_per_page - 1]["username"]]) if len(rows) > safe_per_page else None
         users = [{
             "username": row["username"],
             "full_name": row["full_name"] or "",
@@ -3552,35 +6447,45 @@ def users_list(
             "maps_count": int(row["maps_count"] or 0),
             "views_count": int(row["views_count"] or 0),
             "created_at": row["created_at"],
-        } for row in rows]
-        return {"items": users, "page": safe_page, "per_page": safe_per_page, "total": int(total or 0)}
+        } for row in rows[:safe_per_page]]
+        return {"items": users, "per_page": safe_per_page, "total": total, "next_cursor": next_cursor}
     finally:
         conn.close()
 
 
 @app.get("/users/{username}")
-def user_profile(username: str, q: Optional[str] = None, page: int = 1, per_page: int = 10, sort: Optional[str] = "default"):
+def user_profile(username: str, q: Optional[str] = None, cursor: Optional[str] = None, per_page: int = 10, sort: Optional[str] = "default"):
     uname = _normalize_hub_user(username)
-    conn = _hub_db_conn()
+    conn = _hub_db_conn(readonly=True)
     try:
         user = conn.execute("SELECT * FROM hub_users WHERE username = ?", (uname,)).fetchone()
         if user is None:
             raise HTTPException(status_code=404, detail="User not found")
         profile = _user_public_profile(conn, user)
-        safe_page = max(1, int(page or 1))
         safe_per_page = max(1, min(int(per_page or 10), 30))
         sort_key = _normalize_map_sort(sort)
         order_sql = _map_sort_order_sql(sort_key)
-        offset = (safe_page - 1) * safe_per_page
         query = str(q or "").strip().lower()
-        where = "WHERE a.user_id = ? AND a.kind = 'map'"
+        where = ["a.user_id = ?", "a.kind = 'map'"]
         params: List[Any] = [user["id"]]
-        if query:
-            escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
-            like = f"%{escaped}%"
-            where += " AND (LOWER(a.name) LIKE ? ESCAPE '\\' OR LOWER(a.alpha_metadata) LIKE ? ESCAPE '\\')"
-            params.extend([like, like])
-        total = conn.execute(f"SELECT COUNT(*) AS c FROM hub_artifacts a {where}", tuple(params)).fetchone()["c"]
+        fts_join = ""
+        rank_sql = "NULL"
+        match = _hub_fts_match(query.split())
+        if match is not None:
+            fts_join = "JOIN hub_artifacts_fts ON hub_artifacts_fts.rowid = a.id"
+            where.append("hub_artifacts_fts MATCH ?")
+            params.append(match)
+            if sort_key == "default":
+                rank_sql = _HUB_FTS_RANK_SQL
+                order_sql = f"{_HUB_FTS_RANK_SQL}, {order_sql}"
+        ranked = rank_sql != "NULL"
+        total = _listing_total(
+            conn, f"SELECT COUNT(*) FROM hub_artifacts a {fts_join} WHERE {' AND '.join(where)}", tuple(params)
+        )
+        keyset, keyset_params = _map_keyset(sort_key, ranked, cursor)
+        if keyset is not None:
+            where.append(keyset)
+            params.extend(keyset_params)
         rows = conn.execute(
             f"""
             SELECT
@@ -3589,27 +6494,20 @@ def user_profile(username: str, q: Optional[str] = None, page: int = 1, per_page
                 a.updated_at,
                 a.alpha_metadata,
                 a.featured,
-                COALESCE(vv.votes_count, 0) AS votes_count,
-                COALESCE(mv.views_count, 0) AS views_count
+                a.votes_count,
+                a.views_count,
+                {rank_sql} AS rank
             FROM hub_artifacts a
-            LEFT JOIN (
-                SELECT artifact_id, COUNT(*) AS votes_count
-                FROM hub_votes
-                GROUP BY artifact_id
-            ) vv ON vv.artifact_id = a.id
-            LEFT JOIN (
-                SELECT artifact_id, COUNT(*) AS views_count
-                FROM hub_map_views
-                GROUP BY artifact_id
-            ) mv ON mv.artifact_id = a.id
-            {where}
+            {fts_join}
+            WHERE {' AND '.join(where)}
             ORDER BY {order_sql}
-            LIMIT ? OFFSET ?
+            LIMIT ?
             """,
-            (*params, safe_per_page, offset),
+            (*params, safe_per_page + 1),
         ).fetchall()
+        next_cursor = _map_cursor(sort_key, ranked, rows[safe_per_page - 1]) if len(rows) > safe_per_page else None
         maps = []
-        for row in rows:
+        for row in rows[:safe_per_page]:
             meta = _json_parse(row["alpha_metadata"], {})
             maps.append({
                 "name": row["name"],
@@ -3620,15 +6518,15 @@ def user_profile(username: str, q: Optional[str] = None, page: int = 1, per_page
                 "updated_at": row["updated_at"],
                 "thumbnail": meta.get("thumbnail") or "/vite.svg",
             })
-        return {"profile": profile, "maps": maps, "page": safe_page, "per_page": safe_per_page, "total": int(total or 0), "sort": sort_key}
+        return {"profile": profile, "maps": maps, "per_page": safe_per_page, "total": total, "sort": sort_key, "next_cursor": next_cursor}
     finally:
         conn.close()
 
 
 @app.get("/user/{username}")
-def user_profile_by_prefix(username: str, q: Optional[str] = None, page: int = 1, per_page: int = 10, sort: Optional[str] = "default"):
+def user_profile_by_prefix(username: str, q: Optional[str] = None, cursor: Optional[str] = None, per_page: int = 10, sort: Optional[str] = "default"):
     """User profile accessible at /user/{username} (new canonical URL)."""
-    return user_profile(username=username, q=q, page=page, per_page=per_page, sort=sort)
+    return user_profile(username=username, q=q, cursor=cursor, per_page=per_page, sort=sort)
 
 
 @app.put("/draft/current")
@@ -3668,7 +6566,7 @@ def draft_save(request: Request, response: Response, payload: DraftRequest):
 
 @app.get("/draft/current")
 def draft_get(request: Request, response: Response):
-    conn = _hub_db_conn()
+    conn = _hub_db_conn(readonly=True)
     try:
         user = _request_user(conn, request)
         if user is not None:
@@ -3775,8 +6673,8 @@ def hub_create_map(http_request: Request):
         user_row = _hub_ensure_user(conn, user['username'])
         placeholder = f"_new_{secrets.token_hex(8)}"
         conn.execute(
-            "INSERT INTO hub_artifacts(user_id, kind, name, alpha_content, alpha_metadata, created_at, updated_at)"
-            " VALUES(?, 'map', ?, '', '{}', ?, ?)",
+            "INSERT INTO hub_artifacts(user_id, kind, name, alpha_metadata, created_at, updated_at)"
+            " VALUES(?, 'map', ?, '{}', ?, ?)",
             (user_row['id'], placeholder, now, now)
         )
         artifact_id = conn.execute("SELECT last_insert_rowid() AS id").fetchone()['id']
@@ -3838,11 +6736,11 @@ def hub_publish_by_name(kind: str, name: str, request: HubArtifactWriteRequest,
         md["owner"] = artifact['username']
         md["updated_at"] = _utc_now_iso()
         latest_row = conn.execute(
-            "SELECT content FROM hub_artifact_versions WHERE artifact_id = ? ORDER BY version DESC LIMIT 1",
+            "SELECT content_hash FROM hub_artifact_versions WHERE artifact_id = ? ORDER BY version DESC LIMIT 1",
             (artifact["id"],),
         ).fetchone()
-        latest_content = latest_row["content"] if latest_row else ""
-        if latest_content == content:
+        latest_hash = latest_row["content_hash"] if latest_row else _EMPTY_CONTENT_HASH
+        if latest_hash == _sha256_text(content):
             resp = _hub_artifact_response(conn, artifact, request=http_request)
             resp["published"] = None
             resp["no_changes"] = True
@@ -3891,16 +6789,16 @@ def hub_disassociate_by_name(kind: str, name: str, http_request: Request):
 
 
 @app.get("/hub/{kind}/{name}")
-def hub_get_artifact_by_kind_name(kind: str, name: str, http_request: Request):
+def hub_get_artifact_by_kind_name(kind: str, name: str, http_request: Request, include_content: bool = True):
     """Get artifact by kind+name (no username required; globally unique)."""
     if kind not in HUB_KINDS:
         raise HTTPException(status_code=404, detail="Not found")
-    conn = _hub_db_conn()
+    conn = _hub_db_conn(readonly=True)
     try:
         artifact = _hub_get_artifact_by_name(conn, kind, name)
         if artifact is None:
             raise HTTPException(status_code=404, detail="Artifact not found")
-        return _hub_artifact_response(conn, artifact, request=http_request)
+        return _hub_artifact_get_response(conn, artifact, http_request, include_content=include_content)
     finally:
         conn.close()
 
@@ -3910,7 +6808,7 @@ def hub_get_artifact_version_by_name(kind: str, name: str, version: str, http_re
     """Get a specific version of an artifact by kind+name (globally unique)."""
     if kind not in HUB_KINDS:
         raise HTTPException(status_code=404, detail="Not found")
-    conn = _hub_db_conn()
+    conn = _hub_db_conn(readonly=True)
     try:
         artifact = _hub_get_artifact_by_name(conn, kind, name)
         if artifact is None:
@@ -3953,6 +6851,7 @@ def hub_rename_artifact(username: str, kind: str, name: str, request: HubArtifac
             "UPDATE hub_artifacts SET name = ?, updated_at = ? WHERE id = ?",
             (new_name, _utc_now_iso(), artifact["id"]),
         )
+        _hub_propagate_rename(conn, artifact["username"], kind, artifact["name"], new_name)
         conn.commit()
         return {"name": new_name, "renamed": True}
     finally:
@@ -3999,11 +6898,11 @@ def hub_publish(username: str, kind: str, name: str, request: HubArtifactWriteRe
         current = _hub_get_artifact(conn, username, kind, name)
         if current is not None:
             latest_row = conn.execute(
-                "SELECT content FROM hub_artifact_versions WHERE artifact_id = ? ORDER BY version DESC LIMIT 1",
+                "SELECT content_hash FROM hub_artifact_versions WHERE artifact_id = ? ORDER BY version DESC LIMIT 1",
                 (current["id"],),
             ).fetchone()
-            latest_content = latest_row["content"] if latest_row else ""
-            if latest_content == content:
+            latest_hash = latest_row["content_hash"] if latest_row else _EMPTY_CONTENT_HASH
+            if latest_hash == _sha256_text(content):
                 resp = _hub_artifact_response(conn, current, request=http_request)
                 resp["published"] = None
                 resp["no_changes"] = True
@@ -4060,27 +6959,26 @@ def hub_disassociate(username: str, kind: str, name: str, http_request: Request)
 
 
 @app.get("/hub/{username}/{kind}/{name}")
-def hub_get_artifact(username: str, kind: str, name: str, http_request: Request):
-    conn = _hub_db_conn()
+def hub_get_artifact(username: str, kind: str, name: str, http_request: Request, include_content: bool = True):
+    conn = _hub_db_conn(readonly=True)
     try:
         artifact = _hub_get_artifact(conn, username, kind, name)
         if artifact is None:
             raise HTTPException(status_code=404, detail="Artifact not found")
-        return _hub_artifact_response(conn, artifact, request=http_request)
+        return _hub_artifact_get_response(conn, artifact, http_request, include_content=include_content)
     finally:
         conn.close()
 
 
 @app.get("/hub/{username}/{kind}/{name}/info")
 def hub_artifact_info(username: str, kind: str, name: str, forks_limit: int = 5, importers_limit: int = 5):
-    conn = _hub_db_conn()
+    conn = _hub_db_conn(readonly=True)
     try:
         artifact = _hub_get_artifact(conn, username, kind, name)
         if artifact is None:
             raise HTTPException(status_code=404, detail="Artifact not found")
         meta = _artifact_metadata_dict(artifact["alpha_metadata"])
-        kind_label = _hub_kind_label(artifact["kind"])
-        # Forks: maps where forked_from metadata contains this artifact's slug
+        # Forks: maps whose forked_from metadata is this artifact's slug
         slug = f"/{artifact['name']}"
         safe_forks_limit = max(1, min(int(forks_limit), 50))
         fork_rows = conn.execute(
@@ -4088,12 +6986,12 @@ def hub_artifact_info(username: str, kind: str, name: str, forks_limit: int = 5,
             SELECT a.name, u.username, a.alpha_metadata, a.updated_at
             FROM hub_artifacts a
             JOIN hub_users u ON u.id = a.user_id
-            WHERE a.kind = 'map'
-              AND a.alpha_metadata LIKE ?
+            WHERE a.forked_from = ?
+              AND a.kind = 'map'
             ORDER BY a.updated_at DESC
             LIMIT ?
             """,
-            (f'%"forked_from":"{slug}"%', safe_forks_limit + 1),
+            (slug, safe_forks_limit + 1),
         ).fetchall()
         forks_has_more = len(fork_rows) > safe_forks_limit
         forks = []
@@ -4106,20 +7004,22 @@ def hub_artifact_info(username: str, kind: str, name: str, forks_limit: int = 5,
                 "thumbnail": fork_meta.get("thumbnail") or "/vite.svg",
                 "updated_at": row["updated_at"],
             })
-        # Importers: artifacts whose alpha_content references this artifact
+        # Importers: artifacts whose alpha imports any version of this artifact
         safe_imp_limit = max(1, min(int(importers_limit), 50))
-        import_search = f"%/{kind_label}/{artifact['name']}/%"
         imp_rows = conn.execute(
             """
             SELECT a.name, a.kind, u.username, a.updated_at
             FROM hub_artifacts a
             JOIN hub_users u ON u.id = a.user_id
-            WHERE a.id != ?
-              AND a.alpha_content LIKE ?
+            WHERE a.id IN (
+                SELECT artifact_id FROM hub_dependencies
+                WHERE dep_kind = ? AND dep_name = ? AND version = 0
+            )
+              AND a.id != ?
             ORDER BY a.updated_at DESC
             LIMIT ?
             """,
-            (artifact["id"], import_search, safe_imp_limit + 1),
+            (artifact["kind"], artifact["name"], artifact["id"], safe_imp_limit + 1),
         ).fetchall()
         importers_has_more = len(imp_rows) > safe_imp_limit
         importers = []
@@ -4155,8 +7055,8 @@ def hub_artifact_info(username: str, kind: str, name: str, forks_limit: int = 5,
 
 
 @app.put("/hub/{username}/{kind}/{name}/meta")
-async def hub_update_artifact_meta(username: str, kind: str, name: str, http_request: Request):
-    body = await http_request.json()
+def hub_update_artifact_meta(username: str, kind: str, name: str, http_request: Request, body: Dict[str, Any] = Body(...)):
+    # Sync so the pooled writer is awaited in the threadpool, not on the event loop.
     conn = _hub_db_conn()
     try:
         _require_write_identity(conn, http_request, username)
@@ -4183,21 +7083,19 @@ async def hub_update_artifact_meta(username: str, kind: str, name: str, http_req
 
 @app.get("/hub/{username}/{kind}/{name}/{version}")
 def hub_get_artifact_version(username: str, kind: str, name: str, version: str, http_request: Request):
-    conn = _hub_db_conn()
+    # Read-only: owner votes are written with the alpha (and backfilled at startup), not here.
+    conn = _hub_db_conn(readonly=True)
     try:
         artifact = _hub_get_artifact(conn, username, kind, name)
         if artifact is None:
             raise HTTPException(status_code=404, detail="Artifact not found")
         if str(version).strip().lower() == "alpha":
-            if artifact["kind"] == "map":
-                _ensure_owner_vote(conn, artifact["id"], artifact["user_id"])
-                conn.commit()
-            return {
+            body = {
                 "username": artifact["username"],
                 "kind": _hub_kind_label(artifact["kind"]),
                 "name": artifact["name"],
                 "version": "alpha",
-                "content": artifact["alpha_content"] or "",
+                "content_hash": artifact["alpha_content_hash"],
                 "metadata": _sanitize_artifact_metadata(artifact["kind"], artifact["alpha_metadata"]),
                 "updated_at": artifact["updated_at"],
                 "slug": f'/{_hub_kind_label(artifact["kind"])}/{artifact["name"]}/alpha',
@@ -4206,11 +7104,16 @@ def hub_get_artifact_version(username: str, kind: str, name: str, version: str,
                 "viewer_voted": _viewer_has_voted(conn, artifact["id"], http_request) if artifact["kind"] == "map" else False,
                 "featured": bool(int(artifact["featured"] or 0)) if artifact["kind"] == "map" else False,
             }
+
+            def add_alpha_content(payload: Dict[str, Any]) -> None:
+                payload["content"] = _hub_alpha_content(conn, artifact["id"])
+
+            return _hub_conditional_json(http_request, body, add_alpha_content)
         if not str(version).isdigit():
             raise HTTPException(status_code=400, detail="version must be 'alpha' or integer")
         row = conn.execute(
             """
-            SELECT version, content, metadata, created_at
+            SELECT version, content_hash, metadata, created_at
             FROM hub_artifact_versions
             WHERE artifact_id = ? AND version = ?
             """,
@@ -4218,12 +7121,12 @@ def hub_get_artifact_version(username: str, kind: str, name: str, version: str,
         ).fetchone()
         if row is None:
             raise HTTPException(status_code=404, detail="Published version not found")
-        return {
+        body = {
             "username": artifact["username"],
             "kind": _hub_kind_label(artifact["kind"]),
             "name": artifact["name"],
             "version": int(row["version"]),
-            "content": row["content"] or "",
+            "content_hash": row["content_hash"],
             "metadata": _sanitize_artifact_metadata(artifact["kind"], row["metadata"]),
             "created_at": row["created_at"],
             "slug": f'/{_hub_kind_label(artifact["kind"])}/{artifact["name"]}/{int(row["version"])}',
@@ -4232,8 +7135,34 @@ def hub_get_artifact_version(username: str, kind: str, name: str, version: str,
             "viewer_voted": _viewer_has_voted(conn, artifact["id"], http_request) if artifact["kind"] == "map" else False,
             "featured": bool(int(artifact["featured"] or 0)) if artifact["kind"] == "map" else False,
         }
+
+        def add_version_content(payload: Dict[str, Any]) -> None:
+            payload["content"] = _hub_blob_text(conn, row["content_hash"])
+
+        return _hub_conditional_json(http_request, body, add_version_content)
+    finally:
+        conn.close()
+
+
+@app.get("/thumbs/{digest}")
+def hub_thumbnail(digest: str, request: Request):
+    if not _THUMBNAIL_HASH_RE.match(digest):
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    headers = {
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": f'"{digest}"',
+        "Access-Control-Allow-Origin": "*",
+    }
+    if _etag_matches(request, digest):
+        return Response(status_code=304, headers=headers)
+    conn = _hub_db_conn(readonly=True)
+    try:
+        row = conn.execute("SELECT mime, data FROM hub_thumbnails WHERE hash = ?", (digest,)).fetchone()
     finally:
         conn.close()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    return Response(content=row["data"], media_type=row["mime"], headers=headers)
 
 
 @app.get("/hub/registry")
@@ -4241,6 +7170,7 @@ def hub_registry(
     kind: Optional[str] = None,
     q: Optional[str] = None,
     limit: int = 50,
+    cursor: Optional[str] = None,
 ):
     normalized_kind = None
     if kind is not None and str(kind).strip():
@@ -4254,7 +7184,7 @@ def hub_registry(
         elif token:
             terms.append(token)
     safe_limit = max(1, min(int(limit or 50), 200))
-    conn = _hub_db_conn()
+    conn = _hub_db_conn(readonly=True)
     try:
         where = []
         params: List[Any] = []
@@ -4264,34 +7194,43 @@ def hub_registry(
         if user_filter:
             where.append("LOWER(u.username) = ?")
             params.append(user_filter)
-        for term in terms:
-            where.append("(LOWER(a.name) LIKE ? ESCAPE '\\' OR LOWER(u.username) LIKE ? ESCAPE '\\' OR LOWER(a.alpha_metadata) LIKE ? ESCAPE '\\')")
-            escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
-            like = f"%{escaped}%"
-            params.extend([like, like, like])
+        fts_join = ""
+        rank_sql = "NULL"
+        order_sql = _map_sort_order_sql("votes")
+        match = _hub_fts_match(terms)
+        if match is not None:
+            fts_join = "JOIN hub_artifacts_fts ON hub_artifacts_fts.rowid = a.id"
+            where.append("hub_artifacts_fts MATCH ?")
+            params.append(match)
+            rank_sql = _HUB_FTS_RANK_SQL
+            order_sql = f"{_HUB_FTS_RANK_SQL}, {order_sql}"
+        ranked = rank_sql != "NULL"
+        keyset, keyset_params = _map_keyset("votes", ranked, cursor)
+        if keyset is not None:
+            where.append(keyset)
+            params.extend(keyset_params)
         where_sql = ("WHERE " + " AND ".join(where)) if where else ""
         rows = conn.execute(
             f"""
             SELECT
                 a.id, a.kind, a.name, a.updated_at, a.alpha_metadata,
                 u.username, u.is_admin,
-                COALESCE(MAX(v.version), 0) AS latest_version,
-                COUNT(DISTINCT vv.id) AS votes_count,
-                COUNT(DISTINCT mv.id) AS views_count
+                COALESCE((SELECT MAX(v.version) FROM hub_artifact_versions v WHERE v.artifact_id = a.id), 0) AS latest_version,
+                a.votes_count,
+                a.views_count,
+                {rank_sql} AS rank
             FROM hub_artifacts a
             JOIN hub_users u ON u.id = a.user_id
-            LEFT JOIN hub_artifact_versions v ON v.artifact_id = a.id
-            LEFT JOIN hub_votes vv ON vv.artifact_id = a.id
-            LEFT JOIN hub_map_views mv ON mv.artifact_id = a.id
+            {fts_join}
             {where_sql}
-            GROUP BY a.id, a.kind, a.name, a.updated_at, u.username, u.is_admin
-            ORDER BY votes_count DESC, views_count DESC, a.updated_at DESC
+            ORDER BY {order_sql}
             LIMIT ?
             """,
-            (*params, safe_limit),
+            (*params, safe_limit + 1),
         ).fetchall()
+        next_cursor = _map_cursor("votes", ranked, rows[safe_limit - 1]) if len(rows) > safe_limit else None
         items = []
-        for row in rows:
+        for row in rows[:safe_limit]:
             kind_label = _hub_kind_label(row["kind"])
             latest = int(row["latest_version"]) if int(row["latest_version"]) > 0 else None
             meta = _json_parse(row["alpha_metadata"], {})
@@ -4307,7 +7246,7 @@ def hub_registry(
                 "views": int(row["views_count"] or 0),
                 "thumbnail": meta.get("thumbnail") or "/vite.svg",
             })
-        return {"items": items}
+        return {"items": items, "next_cursor": next_cursor}
     finally:
         conn.close()
 
@@ -4317,14 +7256,15 @@ def hub_registry_alias(
     kind: Optional[str] = None,
     q: Optional[str] = None,
     limit: int = 50,
+    cursor: Optional[str] = None,
 ):
-    return hub_registry(kind=kind, q=q, limit=limit)
+    return hub_registry(kind=kind, q=q, limit=limit, cursor=cursor)
 
 @app.post("/stop")
 def stop_generation(http_request: Request, request: Optional[StopRequest] = Body(default=None)):
     # Require either an authenticated session or a guest cookie to prevent unauthenticated
     # external callers from stopping renders.
-    conn = _hub_db_conn()
+    conn = _hub_db_conn(readonly=True)
     try:
         user = _request_user(conn, http_request)
         guest_id = http_request.cookies.get(GUEST_COOKIE)
@@ -4353,36 +7293,8 @@ def stop_generation(http_request: Request, request: Optional[StopRequest] = Body
     return {"status": "stopped" if stopped else "no process running", "stopped_task_types": stopped}
 
 
-def _parse_xatrahub_path(path: str) -> Dict[str, Any]:
-    raw = str(path or "").strip()
-    if not raw:
-        raise ValueError("xatrahub path is empty")
-    if raw.startswith("xatrahub("):
-        raise ValueError("xatrahub path must be a path string, not xatrahub(...)")
-    cleaned = raw.strip().strip('"').strip("'")
-    parts = [p for p in cleaned.split("/") if p]
-    # New format: /kind/name[/version]  (2-3 parts, kind is first)
-    if len(parts) >= 2 and parts[0].lower() in HUB_KINDS:
-        kind = _normalize_hub_kind(parts[0])
-        name = _normalize_hub_name(parts[1])
-        version = "alpha"
-        if len(parts) >= 3 and parts[2]:
-            version = parts[2].strip()
-        return {"username": None, "kind": kind, "name": name, "version": version}
-    # Old format: /username/kind/name[/version]  (3-4 parts)
-    if len(parts) < 3:
-        raise ValueError("xatrahub path must be /{kind}/name[/version] or /username/{kind}/name[/version]")
-    username = _normalize_hub_user(parts[0])
-    kind = _normalize_hub_kind(parts[1])
-    name = _normalize_hub_name(parts[2])
-    version = "alpha"
-    if len(parts) >= 4 and parts[3]:
-        version = parts[3].strip()
-    return {"username": username, "kind": kind, "name": name, "version": version}
-
-
 def _hub_load_content(username: Optional[str], kind: str, name: str, version: str = "alpha") -> Dict[str, Any]:
-    conn = _hub_db_conn()
+    conn = _hub_db_conn(readonly=True)
     try:
         if username is None:
             artifact = _hub_get_artifact_by_name(conn, kind, name)
@@ -4397,14 +7309,14 @@ def _hub_load_content(username: Optional[str], kind: str, name: str, version: st
                 "kind": _hub_kind_label(artifact["kind"]),
                 "name": artifact["name"],
                 "version": "alpha",
-                "content": artifact["alpha_content"] or "",
+                "content": _hub_alpha_content(conn, artifact["id"]),
                 "metadata": _sanitize_artifact_metadata(artifact["kind"], artifact["alpha_metadata"]),
             }
         if not str(version).isdigit():
             raise ValueError("xatrahub version must be integer or alpha")
         row = conn.execute(
             """
-            SELECT version, content, metadata
+            SELECT version, content_hash, metadata
             FROM hub_artifact_versions
             WHERE artifact_id = ? AND version = ?
             """,
@@ -4418,7 +7330,7 @@ def _hub_load_content(username: Optional[str], kind: str, name: str, version: st
             "kind": _hub_kind_label(artifact["kind"]),
             "name": artifact["name"],
             "version": int(row["version"]),
-            "content": row["content"] or "",
+            "content": _hub_blob_text(conn, row["content_hash"]),
             "metadata": _sanitize_artifact_metadata(artifact["kind"], row["metadata"]),
         }
     finally:
@@ -4487,48 +7399,6 @@ def _filter_xatra_code(code: str, filter_only: Optional[List[str]] = None, filte
             kept.append(segment)
     return "\n".join(kept)
 
-def _parse_imports_code_calls(imports_code: str) -> List[Dict[str, Any]]:
-    out: List[Dict[str, Any]] = []
-    if not isinstance(imports_code, str) or not imports_code.strip():
-        return out
-    try:
-        tree = ast.parse(imports_code)
-    except Exception:
-        return out
-    for stmt in tree.body:
-        alias: Optional[str] = None
-        call: Optional[ast.Call] = None
-        if isinstance(stmt, ast.Assign):
-            if len(stmt.targets) != 1 or not isinstance(stmt.targets[0], ast.Name):
-                continue
-            alias = stmt.targets[0].id
-            if isinstance(stmt.value, ast.Call):
-                call = stmt.value
-        elif isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call):
-            call = stmt.value
-        if call is None:
-            continue
-        if _call_name(call.func) != "xatrahub":
-            continue
-        if not call.args:
-            continue
-        path_val = _python_value(call.args[0])
-        if not isinstance(path_val, str) or not path_val.strip():
-            continue
-        kwargs = {kw.arg: kw.value for kw in call.keywords if kw.arg}
-        filter_only_val = _python_value(kwargs.get("filter_only")) if "filter_only" in kwargs else None
-        filter_not_val = _python_value(kwargs.get("filter_not")) if "filter_not" in kwargs else None
-        filter_only = [str(x) for x in filter_only_val] if isinstance(filter_only_val, list) else None
-        filter_not = [str(x) for x in filter_not_val] if isinstance(filter_not_val, list) else None
-        out.append({
-            "alias": alias if isinstance(alias, str) and alias.strip() else None,
-            "path": path_val.strip(),
-            "filter_only": filter_only,
-            "filter_not": filter_not,
-        })
-    return out
-
-
 def _strip_python_wrappers(value: Any) -> Any:
     if isinstance(value, dict):
         if len(value) == 1 and isinstance(value.get(PYTHON_EXPR_KEY), str):
@@ -4581,6 +7451,710 @@ def _sanitize_untrusted_builder_payload(elements: Any, options: Any) -> Tuple[Li
         safe_options = {}
     return safe_elements, safe_options
 
+
+# Payload encodings
+PAYLOAD_ENCODINGS = {"topo", "binary"}
+TOPO_DEFAULT_QUANTIZATION = 100_000
+TOPO_MIN_QUANTIZATION = 1_000
+TOPO_MAX_QUANTIZATION = 10_000_000
+_TOPO_LINE_TYPES = {"LineString": 1, "MultiLineString": 2}
+_TOPO_POLYGON_TYPES = {"Polygon": 2, "MultiPolygon": 3}
+
+# Installed into the rendered HTML ahead of the viewer's own scripts. It rebuilds GeoJSON
+# coordinates from the shared arc table so the viewer sees an ordinary payload.
+_TOPO_DECODER_JS = """<script>
+window.__xatraDecodeTopo = function(topo) {
+  if (!topo || topo.type !== 'xatra-topology') return topo;
+  var sx = topo.transform.scale[0], sy = topo.transform.scale[1];
+  var tx = topo.transform.translate[0], ty = topo.transform.translate[1];
+  var arcs = topo.arcs.map(function(arc) {
+    var x = 0, y = 0;
+    return arc.map(function(p) { x += p[0]; y += p[1]; return [x * sx + tx, y * sy + ty]; });
+  });
+  function line(ids) {
+    var out = [];
+    ids.forEach(function(id, k) {
+      var pts = id < 0 ? arcs[~id].slice().reverse() : arcs[id];
+      out.push.apply(out, k === 0 ? pts : pts.slice(1));
+    });
+    return out;
+  }
+  function nest(ids, depth) { return depth === 1 ? line(ids) : ids.map(function(x) { return nest(x, depth - 1); }); }
+  var depths = { LineString: 1, MultiLineString: 2, Polygon: 2, MultiPolygon: 3 };
+  function walk(v) {
+    if (Array.isArray(v)) return v.map(walk);
+    if (!v || typeof v !== 'object') return v;
+    if (depths[v.type] && Array.isArray(v.arcs) && !('coordinates' in v)) {
+      var g = {};
+      Object.keys(v).forEach(function(k) { if (k !== 'arcs') g[k] = walk(v[k]); });
+      g.coordinates = nest(v.arcs, depths[v.type]);
+      return g;
+    }
+    var o = {};
+    Object.keys(v).forEach(function(k) { o[k] = walk(v[k]); });
+    return o;
+  }
+  return walk(topo.payload);
+};
+</script>
+"""
+
+
+# Companion to _TOPO_DECODER_JS: unpacks the base64 chunk into Int32Array views over one
+# ArrayBuffer (no per-number text parsing) and hands the arcs to the topology decoder.
+# The buffer stays on window so the editor can export without downloading it again.
+_BINARY_DECODER_JS = """<script>
+window.__xatraDecodeBinary = function(m) {
+  if (!m || m.type !== 'xatra-binary') return m;
+  var raw = atob(m.data || ''), bytes = new Uint8Array(raw.length);
+  for (var i = 0; i < raw.length; i++) bytes[i] = raw.charCodeAt(i);
+  window.__xatraGeometryBuffer = bytes.buffer;
+  var ob = m.buffers.arc_offsets, cb = m.buffers.arc_coords;
+  var offsets = new Int32Array(bytes.buffer, ob.offset, ob.length);
+  var coords = new Int32Array(bytes.buffer, cb.offset, cb.length);
+  var arcs = new Array(offsets.length);
+  for (var a = 0; a < offsets.length; a++) {
+    var end = a + 1 < offsets.length ? offsets[a + 1] : coords.length / 2, arc = [];
+    for (var p = offsets[a]; p < end; p++) arc.push([coords[2 * p], coords[2 * p + 1]]);
+    arcs[a] = arc;
+  }
+  return window.__xatraDecodeTopo({ type: 'xatra-topology', transform: m.transform, arcs: arcs, payload: m.payload });
+};
+</script>
+"""
+
+
+def _normalize_payload_encoding(encoding: Optional[str]) -> Optional[str]:
+    key = str(encoding or "").strip().lower()
+    return key if key in PAYLOAD_ENCODINGS else None
+
+
+def _is_topo_geometry(value: Any) -> bool:
+    if not isinstance(value, dict):
+        return False
+    gtype = value.get("type")
+    return (gtype in _TOPO_LINE_TYPES or gtype in _TOPO_POLYGON_TYPES) and isinstance(value.get("coordinates"), list)
+
+
+def _topo_collect_lines(payload: Any) -> List[Tuple[list, bool]]:
+    """Collect every (coordinate list, is_ring) in payload geometries, in walk order."""
+    lines: List[Tuple[list, bool]] = []
+
+    def _nested(coords: Any, depth: int, ring: bool) -> None:
+        if not isinstance(coords, list):
+            return
+        if depth == 1:
+            lines.append((coords, ring))
+            return
+        for item in coords:
+            _nested(item, depth - 1, ring)
+
+    def _walk(value: Any) -> None:
+        if isinstance(value, list):
+            for item in value:
+                _walk(item)
+        elif isinstance(value, dict):
+            if _is_topo_geometry(value):
+                gtype = value["type"]
+                if gtype in _TOPO_LINE_TYPES:
+                    _nested(value["coordinates"], _TOPO_LINE_TYPES[gtype], False)
+                else:
+                    _nested(value["coordinates"], _TOPO_POLYGON_TYPES[gtype], True)
+                return
+            for item in value.values():
+                _walk(item)
+
+    _walk(payload)
+    return lines
+
+
+def _topo_build(payload: Any, quantization: Optional[int] = None) -> Dict[str, Any]:
+    """Split line/polygon geometries in payload into shared, quantised, delta-coded arcs.
+
+    Borders shared by adjacent territories are stored once; geometries keep their other keys
+    and reference arcs by index (``~i`` for a reversed arc) as in TopoJSON. Arcs are returned
+    as int64 arrays so callers can serialise them as JSON or as packed buffers.
+    """
+    q = int(quantization or TOPO_DEFAULT_QUANTIZATION)
+    q = max(TOPO_MIN_QUANTIZATION, min(q, TOPO_MAX_QUANTIZATION))
+    lines = _topo_collect_lines(payload)
+    float_lines: List[np.ndarray] = []
+    for coords, _ring in lines:
+        try:
+            arr = np.asarray([pt[:2] for pt in coords], dtype=np.float64).reshape(-1, 2)
+        except Exception:
+            arr = np.zeros((0, 2), dtype=np.float64)
+        float_lines.append(arr)
+    all_pts = np.concatenate(float_lines) if float_lines else np.zeros((0, 2), dtype=np.float64)
+    if all_pts.size:
+        lo = all_pts.min(axis=0)
+        span = all_pts.max(axis=0) - lo
+    else:
+        lo = np.zeros(2)
+        span = np.zeros(2)
+    scale = np.where(span > 0, span / (q - 1), 1.0)
+
+    # Quantise every line at once, then drop consecutive duplicates the grid produced.
+    lengths = np.array([len(a) for a in float_lines], dtype=np.int64)
+    quant_all = np.rint((all_pts - lo) / scale).astype(np.int64) if all_pts.size else np.zeros((0, 2), dtype=np.int64)
+    keys_all = quant_all[:, 0] * q + quant_all[:, 1]
+    quant_lines: List[np.ndarray] = []
+    key_lines: List[np.ndarray] = []
+    for (coords, ring), start, length in zip(lines, np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(lengths) else [], lengths):
+        keys = keys_all[start:start + length]
+        pts = quant_all[start:start + length]
+        if length:
+            keep = np.ones(length, dtype=bool)
+            keep[1:] = keys[1:] != keys[:-1]
+            keys = keys[keep]
+            pts = pts[keep]
+        if ring and len(keys) > 1 and keys[0] == keys[-1]:
+            keys = keys[:-1]
+            pts = pts[:-1]
+        quant_lines.append(pts)
+        key_lines.append(keys)
+
+    # Junctions: points whose neighbours differ between occurrences, plus open-line endpoints.
+    prev_parts: List[np.ndarray] = []
+    next_parts: List[np.ndarray] = []
+    endpoint_keys: List[np.ndarray] = []
+    for keys, (_coords, ring) in zip(key_lines, lines):
+        if not len(keys):
+            continue
+        if ring:
+            prev_parts.append(np.roll(keys, 1))
+            next_parts.append(np.roll(keys, -1))
+        else:
+            prev = np.empty_like(keys)
+            nxt = np.empty_like(keys)
+            prev[0] = -1
+            prev[1:] = keys[:-1]
+            nxt[-1] = -1
+            nxt[:-1] = keys[1:]
+            prev_parts.append(prev)
+            next_parts.append(nxt)
+            endpoint_keys.append(keys[[0, -1]])
+    junctions: set = set()
+    non_empty = [k for k in key_lines if len(k)]
+    if non_empty:
+        keys_cat = np.concatenate(non_empty)
+        prev_cat = np.concatenate(prev_parts)
+        next_cat = np.concatenate(next_parts)
+        pair = np.stack([keys_cat, np.minimum(prev_cat, next_cat), np.maximum(prev_cat, next_cat)], axis=1)
+        uniq = np.unique(pair, axis=0)
+        point_keys, counts = np.unique(uniq[:, 0], return_counts=True)
+        junction_arr = point_keys[counts > 1]
+        if endpoint_keys:
+            junction_arr = np.union1d(junction_arr, np.concatenate(endpoint_keys))
+        junctions = set(junction_arr.tolist())
+    junction_sorted = np.array(sorted(junctions), dtype=np.int64)
+
+    arcs: List[np.ndarray] = []
+    arc_index: Dict[bytes, int] = {}
+
+    def _arc_ref(pts: np.ndarray, keys: np.ndarray) -> int:
+        fwd = keys.tobytes()
+        if fwd in arc_index:
+            return arc_index[fwd]
+        rev = keys[::-1].tobytes()
+        if rev in arc_index:
+            return ~arc_index[rev]
+        arc_index[fwd] = len(arcs)
+        arcs.append(pts)
+        return arc_index[fwd]
+
+    line_refs: List[List[int]] = []
+    for pts, keys, (_coords, ring) in zip(quant_lines, key_lines, lines):
+        if not len(keys):
+            line_refs.append([])
+            continue
+        cut = np.flatnonzero(np.isin(keys, junction_sorted)) if len(junction_sorted) else np.zeros(0, dtype=np.int64)
+        if ring:
+            if not len(cut):
+                # Isolated ring: rotate to its smallest point so identical rings share one arc.
+                start = int(np.argmin(keys))
+                pts = np.roll(pts, -start, axis=0)
+                keys = np.roll(keys, -start)
+                pts = np.concatenate([pts, pts[:1]])
+                keys = np.concatenate([keys, keys[:1]])
+                line_refs.append([_arc_ref(pts, keys)])
+                continue
+            start = int(cut[0])
+            pts = np.roll(pts, -start, axis=0)
+            keys = np.roll(keys, -start)
+            pts = np.concatenate([pts, pts[:1]])
+            keys = np.concatenate([keys, keys[:1]])
+            cut = np.append(cut - start, len(keys) - 1)
+        else:
+            if len(keys) == 1:
+                line_refs.append([_arc_ref(pts, keys)])
+                continue
+        refs = [
+            _arc_ref(pts[a:b + 1], keys[a:b + 1])
+            for a, b in zip(cut[:-1], cut[1:])
+            if b > a
+        ]
+        line_refs.append(refs)
+
+    arc_deltas = []
+    for arc in arcs:
+        delta = arc.copy()
+        delta[1:] = arc[1:] - arc[:-1]
+        arc_deltas.append(delta)
+
+    ref_iter = iter(line_refs)
+
+    def _nested_refs(coords: Any, depth: int) -> Any:
+        if not isinstance(coords, list):
+            return []
+        if depth == 1:
+            return next(ref_iter)
+        return [_nested_refs(item, depth - 1) for item in coords]
+
+    def _rewrite(value: Any) -> Any:
+        if isinstance(value, list):
+            return [_rewrite(item) for item in value]
+        if isinstance(value, dict):
+            if _is_topo_geometry(value):
+                gtype = value["type"]
+                depth = _TOPO_LINE_TYPES.get(gtype) or _TOPO_POLYGON_TYPES[gtype]
+                out = {k: v for k, v in value.items() if k != "coordinates"}
+                out["arcs"] = _nested_refs(value["coordinates"], depth)
+                return out
+            return {k: _rewrite(v) for k, v in value.items()}
+        return value
+
+    return {
+        "transform": {"scale": scale.tolist(), "translate": lo.tolist()},
+        "quantization": q,
+        "arcs": arc_deltas,
+        "payload": _rewrite(payload),
+    }
+
+
+def _topo_encode_payload(payload: Any, quantization: Optional[int] = None) -> Dict[str, Any]:
+    """Encode payload geometries as a JSON topology (see _topo_build)."""
+    topo = _topo_build(payload, quantization)
+    return {
+        "type": "xatra-topology",
+        "transform": topo["transform"],
+        "quantization": topo["quantization"],
+        "arcs": [arc.tolist() for arc in topo["arcs"]],
+        "payload": topo["payload"],
+    }
+
+
+def _binary_encode_payload(payload: Any, quantization: Optional[int] = None) -> Tuple[Dict[str, Any], bytes]:
+    """Encode payload geometries as a JSON manifest plus one packed little-endian buffer.
+
+    The buffer holds two int32 arrays: ``arc_offsets`` (first point index of each arc) and
+    ``arc_coords`` (interleaved delta-coded x/y for every arc). The manifest keeps the
+    non-coordinate payload and the byte ranges of each array.
+    """
+    topo = _topo_build(payload, quantization)
+    arcs = topo["arcs"]
+    counts = np.fromiter((len(arc) for arc in arcs), dtype=np.int64, count=len(arcs))
+    offsets = np.zeros(len(arcs), dtype="<i4")
+    if len(arcs) > 1:
+        offsets[1:] = np.cumsum(counts[:-1])
+    coords = (np.concatenate(arcs) if arcs else np.zeros((0, 2), dtype=np.int64)).astype("<i4").reshape(-1)
+    buffer = offsets.tobytes() + coords.tobytes()
+    manifest = {
+        "type": "xatra-binary",
+        "endian": "little",
+        "transform": topo["transform"],
+        "quantization": topo["quantization"],
+        "byte_length": len(buffer),
+        "buffers": {
+            "arc_offsets": {"dtype": "int32", "offset": 0, "length": int(offsets.size)},
+            "arc_coords": {"dtype": "int32", "offset": int(offsets.nbytes), "length": int(coords.size)},
+        },
+        "payload": topo["payload"],
+    }
+    return manifest, buffer
+
+
+def _stash_render_artifacts(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Move a render result's packed buffer and held-back geometries into their caches.
+
+    Returns the JSON-safe result, with paths to fetch whatever was stashed.
+    """
+    buffer = result.get("geometry_buffer")
+    detail = result.get("geometry_detail")
+    detail_digest = result.get("geometry_detail_digest")
+    if not isinstance(buffer, (bytes, bytearray)) and not (isinstance(detail, dict) and detail_digest):
+        return result
+    public = {k: v for k, v in result.items() if k not in ("geometry_buffer", "geometry_detail", "geometry_detail_digest")}
+    with geometry_buffer_lock:
+        if isinstance(buffer, (bytes, bytearray)):
+            digest = hashlib.sha256(buffer).hexdigest()
+            geometry_buffer_cache[digest] = bytes(buffer)
+            geometry_buffer_cache.move_to_end(digest)
+            while len(geometry_buffer_cache) > GEOMETRY_BUFFER_MAX_ENTRIES:
+                geometry_buffer_cache.popitem(last=False)
+            if isinstance(public.get("payload"), dict):
+                public["payload"] = {**public["payload"], "buffer": f"/render/geometry/{digest}"}
+        if isinstance(detail, dict) and detail_digest:
+            geometry_detail_cache[detail_digest] = detail
+            geometry_detail_cache.move_to_end(detail_digest)
+            while len(geometry_detail_cache) > GEOMETRY_BUFFER_MAX_ENTRIES:
+                geometry_detail_cache.popitem(last=False)
+            public["geometry_detail_url"] = f"/render/detail/{detail_digest}"
+    return public
+
+
+def _embed_encoded_payload(html: str, payload: Any, encoded: Any, decoder_js: str, decoder_fn: str) -> Optional[str]:
+    """Swap the payload literal inside rendered HTML for a decoder call over the encoded form.
+
+    Returns None when the literal can't be located, so callers can fall back to the plain HTML.
+    """
+    if not isinstance(html, str) or not html:
+        return None
+    literal = None
+    for kwargs in ({}, {"ensure_ascii": False}, {"separators": (",", ":")}, {"ensure_ascii": False, "separators": (",", ":")}):
+        try:
+            candidate = json.dumps(payload, **kwargs)
+        except Exception:
+            continue
+        if candidate in html:
+            literal = candidate
+            break
+    if literal is None:
+        return None
+    encoded_literal = json.dumps(encoded, separators=(",", ":")).replace("</", "<\\/")
+    html = html.replace(literal, f"{decoder_fn}({encoded_literal})", 1)
+    script_at = html.find("<script")
+    if script_at < 0:
+        return decoder_js + html
+    return html[:script_at] + decoder_js + html[script_at:]
+
+
+# Admin layers rendered with tiles=True: the viewer streams them from /tiles/gadm instead of
+# the HTML inlining every polygon. Each tile is painted into its own canvas, which crops the
+# clipped features' buffer; hovering hit-tests the tile under the cursor for the tooltip.
+_GADM_TILE_LAYER_JS = """<script>
+(function(cfg) {
+  function boot() {
+    if (typeof L === 'undefined' || typeof map === 'undefined' || !map || !map.addLayer) return;
+    function rings(g, out) {
+      if (!g) return out;
+      if (g.type === 'Polygon') out.push.apply(out, g.coordinates);
+      else if (g.type === 'MultiPolygon') g.coordinates.forEach(function(p) { out.push.apply(out, p); });
+      else if (g.type === 'GeometryCollection') g.geometries.forEach(function(c) { rings(c, out); });
+      return out;
+    }
+    cfg.layers.forEach(function(spec) {
+      var style = spec.style, shapes = {}, tip = L.tooltip({ sticky: true });
+      function key(c) { return c.z + '/' + c.x + '/' + c.y; }
+      var Grid = L.GridLayer.extend({
+        createTile: function(coords, done) {
+          var size = this.getTileSize(), tile = document.createElement('canvas');
+          tile.width = size.x;
+          tile.height = size.y;
+          var origin = coords.scaleBy(size);
+          var url = spec.url.replace('{z}', coords.z).replace('{x}', coords.x).replace('{y}', coords.y);
+          fetch(url).then(function(r) { return r.ok ? r.json() : null; }).then(function(fc) {
+            var ctx = tile.getContext('2d'), drawn = [];
+            ((fc && fc.features) || []).forEach(function(f) {
+              var path = new Path2D();
+              rings(f.geometry, []).forEach(function(ring) {
+                ring.forEach(function(p, i) {
+                  var pt = map.project([p[1], p[0]], coords.z).subtract(origin);
+                  if (i) path.lineTo(pt.x, pt.y); else path.moveTo(pt.x, pt.y);
+                });
+                path.closePath();
+              });
+              ctx.globalAlpha = style.fillOpacity;
+              ctx.fillStyle = style.fillColor;
+              ctx.fill(path, 'evenodd');
+              ctx.globalAlpha = 1;
+              ctx.strokeStyle = style.color;
+              ctx.lineWidth = style.weight;
+              ctx.stroke(path);
+              drawn.push({ path: path, name: f.properties && f.properties.name });
+            });
+            shapes[key(coords)] = drawn;
+            done(null, tile);
+          }).catch(function(err) { done(err, tile); });
+          return tile;
+        }
+      });
+      var grid = new Grid({ tileSize: cfg.tileSize, maxNativeZoom: cfg.maxZoom });
+      grid.on('tileunload', function(e) { delete shapes[key(e.coords)]; });
+      grid.addTo(map);
+      var probe = document.createElement('canvas').getContext('2d');
+      map.on('mousemove', function(e) {
+        var z = Math.min(Math.round(map.getZoom()), cfg.maxZoom), px = map.project(e.latlng, z);
+        var c = { z: z, x: Math.floor(px.x / cfg.tileSize), y: Math.floor(px.y / cfg.tileSize) };
+        var x = px.x - c.x * cfg.tileSize, y = px.y - c.y * cfg.tileSize, hit = null;
+        (shapes[key(c)] || []).forEach(function(s) { if (s.name && probe.isPointInPath(s.path, x, y, 'evenodd')) hit = s; });
+        if (hit) map.openTooltip(tip.setLatLng(e.latlng).setContent(String(hit.name)));
+        else map.closeTooltip(tip);
+      });
+    });
+  }
+  if (document.readyState === 'complete') boot(); else window.addEventListener('load', boot);
+})(__CONFIG__);
+</script>
+"""
+_GADM_TILE_DEFAULT_STYLE = {"color": "#555555", "weight": 1, "fillColor": "#888888", "fillOpacity": 0.15}
+
+
+def _gadm_tile_layer_spec(gadm_value: Any, args: Dict[str, Any], base_url: str) -> Optional[Dict[str, Any]]:
+    gid = str(gadm_value or "").strip().upper()
+    if not _GADM_TILE_GID_RE.match(gid):
+        return None
+    try:
+        level = int(args.get("level", gid.count(".")))
+    except Exception:
+        level = gid.count(".")
+    style = dict(_GADM_TILE_DEFAULT_STYLE)
+    for key in ("color", "fillColor", "fillOpacity", "weight"):
+        if args.get(key) is not None:
+            style[key] = args[key]
+    return {"url": f"{base_url}/tiles/gadm/{gid}/{level}/{{z}}/{{x}}/{{y}}.geojson", "style": style}
+
+
+def _inject_gadm_tile_layers(html: str, layers: List[Dict[str, Any]]) -> str:
+    config = json.dumps(
+        {"layers": layers, "tileSize": GADM_TILE_SIZE, "maxZoom": GADM_TILE_MAX_ZOOM},
+        separators=(",", ":"),
+    ).replace("</", "<\\/")
+    return _inject_before_body_end(html, _GADM_TILE_LAYER_JS.replace("__CONFIG__", config))
+
+
+def _inject_before_body_end(html: str, script: str) -> str:
+    body_end = html.rfind("</body>")
+    if body_end < 0:
+        return html + script
+    return html[:body_end] + script + html[body_end:]
+
+
+# Progressive geometry: features outside the initial viewport are shipped simplified and
+# tagged with "_xatra_geom"; the viewer swaps in full detail from /render/detail as they
+# come into view.
+PROGRESSIVE_VIEWPORT_PX = (1600, 1000)
+PROGRESSIVE_COARSE_PX = 4.0
+PROGRESSIVE_MIN_SAVING = 0.5
+_PROGRESSIVE_GEOMETRY_JS = """<script>
+(function(cfg) {
+  function boot() {
+    if (typeof L === 'undefined' || typeof map === 'undefined' || !map || !map.eachLayer) return;
+    var requested = {};
+    var depths = { LineString: 0, MultiLineString: 1, Polygon: 1, MultiPolygon: 2 };
+    function refine() {
+      var view = map.getBounds().pad(0.25), wanted = {}, ids = [];
+      map.eachLayer(function(layer) {
+        var g = layer.feature && layer.feature.geometry;
+        if (!g || g._xatra_geom == null || g._xatra_full || !layer.setLatLngs || !layer.getBounds) return;
+        if (!view.intersects(layer.getBounds())) return;
+        var id = String(g._xatra_geom);
+        (wanted[id] = wanted[id] || []).push(layer);
+        if (!requested[id]) { requested[id] = true; ids.push(id); }
+      });
+      for (var i = 0; i < ids.length; i += cfg.batch) {
+        var chunk = ids.slice(i, i + cfg.batch);
+        fetch(cfg.url + '?ids=' + chunk.join(',')).then(function(r) { return r.ok ? r.json() : null; }).then(function(res) {
+          var geoms = (res && res.geometries) || {};
+          Object.keys(geoms).forEach(function(id) {
+            var full = geoms[id];
+            (wanted[id] || []).forEach(function(layer) {
+              layer.setLatLngs(L.GeoJSON.coordsToLatLngs(full.coordinates, depths[full.type] || 0));
+              layer.feature.geometry._xatra_full = true;
+            });
+          });
+        }).catch((function(chunk) { return function() { chunk.forEach(function(id) { delete requested[id]; }); }; })(chunk));
+      }
+    }
+    map.on('moveend', refine);
+    refine();
+  }
+  if (document.readyState === 'complete') boot(); else window.addEventListener('load', boot);
+})(__CONFIG__);
+</script>
+"""
+
+
+def _viewport_bounds(options: Dict[str, Any]) -> Optional[Tuple[float, float, float, float]]:
+    """(west, south, east, north) visible at the focus/zoom in options, or None if unset."""
+    focus = options.get("focus")
+    try:
+        lat, lng = float(focus[0]), float(focus[1])
+        zoom = int(options.get("zoom"))
+    except Exception:
+        return None
+    world = GADM_TILE_SIZE * 2 ** zoom
+    cx = (lng + 180.0) / 360.0 * world
+    lat_rad = math.radians(max(-85.0, min(85.0, lat)))
+    cy = (1 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2 * world
+    half_w, half_h = PROGRESSIVE_VIEWPORT_PX[0] / 2, PROGRESSIVE_VIEWPORT_PX[1] / 2
+
+    def _lat(py: float) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * py / world))))
+
+    return (cx - half_w) / world * 360.0 - 180.0, _lat(cy + half_h), (cx + half_w) / world * 360.0 - 180.0, _lat(cy - half_h)
+
+
+def _progressive_split_payload(payload: Any, options: Dict[str, Any]) -> Tuple[Any, Dict[str, Any]]:
+    """Simplify geometries outside the initial viewport; return (payload, {id: full geometry})."""
+    bounds = _viewport_bounds(options)
+    if bounds is None:
+        return payload, {}
+    view = box(*bounds)
+    tolerance = PROGRESSIVE_COARSE_PX * 360.0 / (GADM_TILE_SIZE * 2 ** int(options.get("zoom")))
+    detail: Dict[str, Any] = {}
+
+    def _walk(value: Any) -> Any:
+        if isinstance(value, list):
+            return [_walk(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        if _is_topo_geometry(value) and "_xatra_geom" not in value:
+            try:
+                geom = shape(value)
+                if geom.is_empty or geom.intersects(view):
+                    return value
+                coarse = geom.simplify(tolerance, preserve_topology=True)
+            except Exception:
+                return value
+            if coarse.is_empty or shapely.get_num_coordinates(coarse) > PROGRESSIVE_MIN_SAVING * shapely.get_num_coordinates(geom):
+                return value
+            coarse_geo = mapping(coarse)
+            if coarse_geo["type"] != value["type"]:
+                return value
+            geom_id = str(len(detail))
+            detail[geom_id] = {"type": value["type"], "coordinates": value["coordinates"]}
+            return {**value, "coordinates": json.loads(json.dumps(coarse_geo["coordinates"])), "_xatra_geom": geom_id}
+        return {k: _walk(v) for k, v in value.items()}
+
+    return _walk(payload), detail
+
+
+def _inject_progressive_geometry(html: str, detail_url: str) -> str:
+    config = json.dumps({"url": detail_url, "batch": 200}, separators=(",", ":")).replace("</", "<\\/")
+    return _inject_before_body_end(html, _PROGRESSIVE_GEOMETRY_JS.replace("__CONFIG__", config))
+
+
+# Picker fragments: what m.Admin(gadm=country, level=level) adds to an exported payload,
+# computed once per (country, level) and stored on disk, plus a bbox index per country.
+# A picker preview exports its basemaps/options and splices the cached fragments in.
+_picker_bounds_lock = threading.Lock()
+_picker_bounds_index: Optional[Dict[str, Optional[List[float]]]] = None
+
+
+def _picker_cache_dir() -> Path:
+    # Fragments are xatra's own payload shape, so they're only valid for one xatra version.
+    return PICKER_CACHE_DIR / re.sub(r"[^A-Za-z0-9_.-]", "_", str(getattr(xatra, "__version__", "unknown")))
+
+
+def _write_json_atomic(path: Path, value: Any) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_text(json.dumps(value, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _payload_fragment(base: Dict[str, Any], full: Dict[str, Any]) -> Optional[Dict[str, list]]:
+    """List items full appends to base, per top-level key; None if full isn't base + appends."""
+    fragment: Dict[str, list] = {}
+    for key, value in full.items():
+        before = base.get(key)
+        if before == value:
+            continue
+        if isinstance(value, list) and (before is None or (isinstance(before, list) and value[:len(before)] == before)):
+            fragment[key] = value[len(before or []):]
+            continue
+        return None
+    return fragment
+
+
+def _picker_admin_fragment(country: str, level: int) -> Optional[Dict[str, list]]:
+    """Cached payload fragment for one picker Admin layer; None if it can't be isolated.
+
+    Must run in the render subprocess: it builds scratch maps via xatra.new_map().
+    """
+    country = country.strip().upper()
+    if not _GADM_TILE_GID_RE.match(country):
+        return None
+    path = _picker_cache_dir() / f"{country}_{level}.json"
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"[xatra] Warning: ignoring unreadable picker fragment {path.name}: {e}", file=sys.stderr)
+    xatra.new_map()
+    scratch = xatra.get_current_map()
+    base = json.loads(json.dumps(scratch._export_json()))
+    scratch.Admin(gadm=country, level=level)
+    fragment = _payload_fragment(base, scratch._export_json())
+    if fragment is not None:
+        _write_json_atomic(path, fragment)
+    return fragment
+
+
+def _picker_country_bounds(country: str) -> Optional[List[float]]:
+    """[min_lng, min_lat, max_lng, max_lat] of a GADM country.
+
+    Read from the GADM index; countries it has no bounds for fall back to loading the geometry
+    once, cached in an on-disk bbox index. Failed loads are not cached, so they are retried.
+    """
+    global _picker_bounds_index
+    country = country.strip().upper()
+    indexed = _gadm_unit_geo(country)
+    if indexed is not None:
+        return indexed["bbox"]
+    index_path = _picker_cache_dir() / "bounds.json"
+    with _picker_bounds_lock:
+        if _picker_bounds_index is None:
+            try:
+                _picker_bounds_index = json.loads(index_path.read_text(encoding="utf-8"))
+            except Exception:
+                _picker_bounds_index = {}
+        # null entries were written by older versions for failed loads; retry those too.
+        if _picker_bounds_index.get(country) is not None:
+            return _picker_bounds_index[country]
+    bounds = None
+    try:
+        territory = gadm(country)
+        geom = territory.to_geometry() if territory is not None else None
+        if geom is not None and not geom.is_empty:
+            bounds = [float(v) for v in geom.bounds]
+    except Exception:
+        bounds = None
+    if bounds is None:
+        return None
+    with _picker_bounds_lock:
+        _picker_bounds_index[country] = bounds
+    try:
+        merged = _merge_picker_bounds(index_path, {country: bounds})
+        with _picker_bounds_lock:
+            _picker_bounds_index.update(merged)
+    except Exception as e:
+        print(f"[xatra] Warning: failed to persist picker bounds index: {e}", file=sys.stderr)
+    return bounds
+
+
+def _merge_picker_bounds(index_path: Path, entries: Dict[str, List[float]]) -> Dict[str, List[float]]:
+    """Add entries to the on-disk bounds index without dropping ones other processes wrote meanwhile."""
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(index_path.with_name(f"{index_path.name}.lock"), "a+") as lock_fh:
+        if fcntl is not None:
+            fcntl.flock(lock_fh.fileno(), fcntl.LOCK_EX)
+        try:
+            try:
+                on_disk = json.loads(index_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                on_disk = {}
+            merged = {k: v for k, v in on_disk.items() if v is not None}
+            merged.update(entries)
+            _write_json_atomic(index_path, merged)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_fh.fileno(), fcntl.LOCK_UN)
+    return merged
+
+
 def run_rendering_task(task_type, data, result_queue):
     music_temp_files: List[str] = []
 
@@ -5123,6 +8697,13 @@ def run_rendering_task(task_type, data, result_queue):
         m = xatra.get_current_map()
         effective_task_type = task_type
         trusted_user = bool(getattr(data, "trusted_user", False))
+        payload_encoding = _normalize_payload_encoding(getattr(data, "payload_encoding", None))
+        payload_quantization = getattr(data, "payload_quantization", None)
+        api_base_url = str(getattr(data, "api_base_url", None) or f"http://localhost:{os.environ.get('XATRA_BACKEND_PORT', '8088')}").rstrip("/")
+        gadm_tile_layers: List[Dict[str, Any]] = []
+        progressive_geometry = bool(getattr(data, "progressive_geometry", False))
+        view_options: Dict[str, Any] = {}
+        picker_fragments: List[Dict[str, list]] = []
 
         if task_type == "code":
             imports_code = getattr(data, "imports_code", "") or ""
@@ -5155,7 +8736,6 @@ def run_rendering_task(task_type, data, result_queue):
             effective_task_type = "builder"
         
         if effective_task_type == 'picker':
-            apply_basemaps(getattr(data, "basemaps", None))
             valid_entries: List[Tuple[str, int]] = []
             picker_bounds: Optional[Tuple[float, float, float, float]] = None  # min_lat, min_lng, max_lat, max_lng
             for entry in (getattr(data, "entries", None) or []):
@@ -5178,28 +8758,38 @@ def run_rendering_task(task_type, data, result_queue):
                     ("LKA", 1),
                     ("AFG", 2),
                 ]
+            fragments: List[Optional[Dict[str, list]]] = []
             for country, level in valid_entries:
                 try:
-                    m.Admin(gadm=country, level=level)
-                    try:
-                        territory = gadm(country)
-                        geom = territory.to_geometry() if territory is not None else None
-                        if geom is not None and not geom.is_empty:
-                            min_lng, min_lat, max_lng, max_lat = geom.bounds
-                            if picker_bounds is None:
-                                picker_bounds = (min_lat, min_lng, max_lat, max_lng)
-                            else:
-                                picker_bounds = (
-                                    min(picker_bounds[0], min_lat),
-                                    min(picker_bounds[1], min_lng),
-                                    max(picker_bounds[2], max_lat),
-                                    max(picker_bounds[3], max_lng),
-                                )
-                    except Exception:
-                        # Focus fallback is best-effort; admin rendering is the source of truth.
-                        pass
+                    fragments.append(_picker_admin_fragment(country, level))
+                except Exception as e:
+                    print(f"[xatra] Warning: picker fragment for {country} level {level} unavailable: {e}", file=sys.stderr)
+                    fragments.append(None)
+            # Fragment misses render on scratch maps, so start the preview from a fresh one.
+            xatra.new_map()
+            m = xatra.get_current_map()
+            apply_basemaps(getattr(data, "basemaps", None))
+            for (country, level), fragment in zip(valid_entries, fragments):
+                try:
+                    if fragment is not None:
+                        picker_fragments.append(fragment)
+                    else:
+                        m.Admin(gadm=country, level=level)
                 except Exception as e:
                     print(f"[xatra] Warning: picker Admin({country}, level={level}) failed: {e}", file=sys.stderr)
+                    continue
+                bounds = _picker_country_bounds(country)
+                if bounds is not None:
+                    min_lng, min_lat, max_lng, max_lat = bounds
+                    if picker_bounds is None:
+                        picker_bounds = (min_lat, min_lng, max_lat, max_lng)
+                    else:
+                        picker_bounds = (
+                            min(picker_bounds[0], min_lat),
+                            min(picker_bounds[1], min_lng),
+                            max(picker_bounds[2], max_lat),
+                            max(picker_bounds[3], max_lng),
+                        )
             if data.adminRivers and valid_entries:
                 m.AdminRivers()
             if picker_bounds is not None:
@@ -5717,7 +9307,12 @@ def run_rendering_task(task_type, data, result_queue):
                     elif el_type == "admin":
                         if "label" in args:
                             del args["label"]
-                        m.Admin(gadm=resolve_builder_value(el_value, builder_exec_globals), **args)
+                        gadm_value = resolve_builder_value(el_value, builder_exec_globals)
+                        tile_spec = _gadm_tile_layer_spec(gadm_value, args, api_base_url) if args.pop("tiles", False) else None
+                        if tile_spec is not None:
+                            gadm_tile_layers.append(tile_spec)
+                        else:
+                            m.Admin(gadm=gadm_value, **args)
 
                     elif el_type == "admin_rivers":
                         if "label" in args:
@@ -5783,11 +9378,33 @@ def run_rendering_task(task_type, data, result_queue):
                 apply_imports_code_parsed(runtime_imports_effective, builder_exec_globals)
             _flush_pending_import_elements()
             _apply_builder_elements(runtime_elements)
+            view_options = {**(getattr(data, "options", None) or {}), **(runtime_options if isinstance(runtime_options, dict) else {})}
 
         m.TitleBox("<i>made with <a href='https://github.com/srajma/xatra'>xatra</a></i>")
         payload = m._export_json()
+        for fragment in picker_fragments:
+            for key, items in fragment.items():
+                payload[key] = list(payload.get(key) or []) + items
+        geometry_detail: Dict[str, Any] = {}
+        if progressive_geometry:
+            payload, geometry_detail = _progressive_split_payload(payload, view_options)
         html = export_html_string(payload)
+        if gadm_tile_layers:
+            html = _inject_gadm_tile_layers(html, gadm_tile_layers)
+        detail_digest = None
+        if geometry_detail:
+            detail_digest = hashlib.sha256(json.dumps(geometry_detail, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+            html = _inject_progressive_geometry(html, f"{api_base_url}/render/detail/{detail_digest}")
         result = {"html": html, "payload": payload}
+        if payload_encoding == "topo":
+            encoded = _topo_encode_payload(payload, payload_quantization)
+            html = _embed_encoded_payload(html, payload, encoded, _TOPO_DECODER_JS, "window.__xatraDecodeTopo") or html
+            result = {"html": html, "payload": encoded, "payload_encoding": "topo"}
+        elif payload_encoding == "binary":
+            manifest, buffer = _binary_encode_payload(payload, payload_quantization)
+            inline = {**manifest, "data": base64.b64encode(buffer).decode("ascii")}
+            html = _embed_encoded_payload(html, payload, inline, _TOPO_DECODER_JS + _BINARY_DECODER_JS, "window.__xatraDecodeBinary") or html
+            result = {"html": html, "payload": manifest, "payload_encoding": "binary", "geometry_buffer": buffer}
         if task_type == 'territory_library':
             source = (getattr(data, "source", "builtin") or "builtin").strip().lower()
             code = getattr(data, "predefined_code", "") or ""
@@ -5795,6 +9412,9 @@ def run_rendering_task(task_type, data, result_queue):
             catalog = _get_territory_catalog(source, code, hub_path)
             result["available_names"] = catalog.get("names", [])
             result["index_names"] = catalog.get("index_names", [])
+        if detail_digest:
+            result["geometry_detail"] = geometry_detail
+            result["geometry_detail_digest"] = detail_digest
         result_queue.put(result)
         
     except Exception as e:
@@ -5807,9 +9427,11 @@ def run_rendering_task(task_type, data, result_queue):
             except Exception:
                 pass
 
-def _request_actor_key(request: Request) -> Tuple[str, str]:
+def _request_actor_key(request: Request, conn: Optional[sqlite3.Connection] = None) -> Tuple[str, str]:
     ip = (request.client.host if request.client else "unknown")
-    conn = _hub_db_conn()
+    own_conn = conn is None
+    if own_conn:
+        conn = _hub_db_conn(readonly=True)
     try:
         user = _request_user(conn, request)
         if user is not None:
@@ -5823,7 +9445,8 @@ def _request_actor_key(request: Request) -> Tuple[str, str]:
         actor = f"ip:{ip}"
         return actor, actor
     finally:
-        conn.close()
+        if own_conn:
+            conn.close()
 
 
 def _terminate_process(proc: Optional[multiprocessing.Process], timeout: float = 3.0) -> None:
@@ -5850,19 +9473,90 @@ def _terminate_process(proc: Optional[multiprocessing.Process], timeout: float =
         pass
 
 
-def _hub_render_dependency_epoch() -> str:
-    conn = _hub_db_conn()
+_XATRAHUB_CALL_RE = re.compile(r"\bxatrahub\s*\(")
+_XATRAHUB_LITERAL_CALL_RE = re.compile(r"""\bxatrahub\s*\(\s*(?:"([^"\n]*)"|'([^'\n]*)')""")
+
+
+def _render_hub_dependencies(payload: Any) -> Optional[List[Tuple[str, str, str]]]:
+    """Hub artifacts a render payload imports directly (xatrahub literals, hub_path fields).
+
+    None when some xatrahub() call doesn't take a literal path, since its target can't be known.
+    """
+    deps: Dict[Tuple[str, str, str], None] = {}
+    pending = [payload]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, dict):
+            hub_path = value.get("hub_path")
+            if isinstance(hub_path, str) and hub_path.strip():
+                key = _xatrahub_dependency_key(hub_path)
+                if key is not None:
+                    deps[key] = None
+            pending.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            pending.extend(value)
+        elif isinstance(value, str) and "xatrahub" in value:
+            literals = _XATRAHUB_LITERAL_CALL_RE.findall(value)
+            if len(literals) != len(_XATRAHUB_CALL_RE.findall(value)):
+                return None
+            for double_quoted, single_quoted in literals:
+                key = _xatrahub_dependency_key(double_quoted or single_quoted)
+                if key is not None:
+                    deps[key] = None
+    return list(deps)
+
+
+def _hub_render_dependency_epoch(conn: Optional[sqlite3.Connection] = None, payload: Any = None) -> str:
+    """Changes whenever a hub artifact the render can reach (through hub_dependencies) changes.
+
+    Renders that import nothing never go stale; payloads whose imports can't be determined
+    statically fall back to the newest write anywhere in the hub.
+    """
+    roots = _render_hub_dependencies(payload)
+    if roots == []:
+        return "none"
+    own_conn = conn is None
+    if own_conn:
+        conn = _hub_db_conn(readonly=True)
     try:
+        if roots is None:
+            row = conn.execute(
+                """
+                SELECT
+                    COALESCE((SELECT MAX(updated_at) FROM hub_artifacts), '') AS artifact_epoch,
+                    COALESCE((SELECT MAX(created_at) FROM hub_artifact_versions), '') AS version_epoch
+                """
+            ).fetchone()
+            return f"{row['artifact_epoch']}|{row['version_epoch']}"
+        # Published versions never change, so only alpha targets contribute their updated_at.
         row = conn.execute(
             """
+            WITH RECURSIVE reach(kind, name, version) AS (
+                SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), json_extract(value, '$[2]')
+                FROM json_each(?)
+                UNION
+                SELECT d.dep_kind, d.dep_name, d.dep_version
+                FROM reach r
+                JOIN hub_artifacts a ON a.kind = r.kind AND a.name = r.name
+                JOIN hub_dependencies d ON d.artifact_id = a.id
+                    AND d.version = CASE r.version WHEN 'alpha' THEN 0 ELSE CAST(r.version AS INTEGER) END
+            )
             SELECT
-                COALESCE((SELECT MAX(updated_at) FROM hub_artifacts), '') AS artifact_epoch,
-                COALESCE((SELECT MAX(created_at) FROM hub_artifact_versions), '') AS version_epoch
-            """
+                COUNT(*) AS resolved,
+                TOTAL(a.id) AS ids,
+                COALESCE(MAX(CASE r.version WHEN 'alpha' THEN a.updated_at ELSE v.created_at END), '') AS epoch
+            FROM reach r
+            JOIN hub_artifacts a ON a.kind = r.kind AND a.name = r.name
+            LEFT JOIN hub_artifact_versions v
+                ON r.version != 'alpha' AND v.artifact_id = a.id AND v.version = CAST(r.version AS INTEGER)
+            WHERE r.version = 'alpha' OR v.id IS NOT NULL
+            """,
+            (json.dumps([list(key) for key in roots]),),
         ).fetchone()
-        return f"{row['artifact_epoch']}|{row['version_epoch']}"
+        return f"{row['resolved']}:{int(row['ids'])}|{row['epoch']}"
     finally:
-        conn.close()
+        if own_conn:
+            conn.close()
 
 
 def _enforce_render_rate_limit(task_type: str, actor_key: str) -> None:
@@ -5882,11 +9576,11 @@ def _enforce_render_rate_limit(task_type: str, actor_key: str) -> None:
     )
 
 
-def run_in_process(task_type, data, actor_key: str):
+def run_in_process(task_type, data, actor_key: str, conn: Optional[sqlite3.Connection] = None):
     cache_key = None
     try:
         payload = data.model_dump() if hasattr(data, "model_dump") else data.dict()
-        cache_key = f"{task_type}:{json.dumps(payload, sort_keys=True, default=str)}:hub={_hub_render_dependency_epoch()}"
+        cache_key = f"{task_type}:{json.dumps(payload, sort_keys=True, default=str)}:hub={_hub_render_dependency_epoch(conn, payload)}"
     except Exception:
         cache_key = None
 
@@ -5896,7 +9590,7 @@ def run_in_process(task_type, data, actor_key: str):
             if cached is not None:
                 # Maintain LRU order
                 render_cache.move_to_end(cache_key)
-                return cached
+                return _stash_render_artifacts(cached)
 
     queue = multiprocessing.Queue()
     p = multiprocessing.Process(target=run_rendering_task, args=(task_type, data, queue))
@@ -5937,29 +9631,66 @@ def run_in_process(task_type, data, actor_key: str):
             while len(render_cache) > RENDER_CACHE_MAX_ENTRIES:
                 render_cache.popitem(last=False)
 
-    return result
+    return _stash_render_artifacts(result) if isinstance(result, dict) else result
+
+@app.get("/render/geometry/{digest}")
+def render_geometry_buffer(digest: str):
+    with geometry_buffer_lock:
+        buffer = geometry_buffer_cache.get(digest)
+        if buffer is not None:
+            geometry_buffer_cache.move_to_end(digest)
+    if buffer is None:
+        raise HTTPException(status_code=404, detail="Geometry buffer not found (it may have expired; re-render)")
+    return Response(
+        content=buffer,
+        media_type="application/octet-stream",
+        headers={"Cache-Control": "public, max-age=31536000, immutable", "ETag": f'"{digest}"'},
+    )
+
+@app.get("/render/detail/{digest}")
+def render_geometry_detail(digest: str, ids: Optional[str] = None):
+    with geometry_buffer_lock:
+        detail = geometry_detail_cache.get(digest)
+        if detail is not None:
+            geometry_detail_cache.move_to_end(digest)
+    if detail is None:
+        raise HTTPException(status_code=404, detail="Geometry detail not found (it may have expired; re-render)")
+    if ids:
+        wanted = [x.strip() for x in ids.split(",") if x.strip()]
+        detail = {k: detail[k] for k in wanted if k in detail}
+    # Requested from sandboxed preview iframes (origin "null"); the data is not user-private.
+    return Response(
+        content=json.dumps({"geometries": detail}, separators=(",", ":")),
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=3600", "Access-Control-Allow-Origin": "*"},
+    )
 
 @app.post("/render/picker")
-def render_picker(request: PickerRequest, http_request: Request):
-    actor_key, rate_key = _request_actor_key(http_request)
+def render_picker(request: PickerRequest, http_request: Request, conn: sqlite3.Connection = Depends(_hub_read_db)):
+    actor_key, rate_key = _request_actor_key(http_request, conn)
     _enforce_render_rate_limit("picker", rate_key)
-    result = run_in_process('picker', request, actor_key)
+    result = run_in_process('picker', request, actor_key, conn)
     if "error" in result:
         return result
     return result
 
 @app.post("/render/territory-library")
-def render_territory_library(request: TerritoryLibraryRequest, http_request: Request):
+def render_territory_library(request: TerritoryLibraryRequest, http_request: Request, conn: sqlite3.Connection = Depends(_hub_read_db)):
     _enforce_python_input_limits(request.predefined_code or "", "predefined_code")
-    actor_key, rate_key = _request_actor_key(http_request)
+    actor_key, rate_key = _request_actor_key(http_request, conn)
     _enforce_render_rate_limit("territory_library", rate_key)
-    result = run_in_process('territory_library', request, actor_key)
+    result = run_in_process('territory_library', request, actor_key, conn)
     if "error" in result:
         return result
     return result
 
 @app.post("/render/code")
-def render_code(request: CodeRequest, http_request: Request):
+def render_code(
+    request: CodeRequest,
+    http_request: Request,
+    conn: sqlite3.Connection = Depends(_hub_read_db),
+    user: Optional[sqlite3.Row] = Depends(_request_identity),
+):
     _enforce_python_input_limits(request.code or "", "code")
     _enforce_python_input_limits(request.predefined_code or "", "predefined_code")
     _enforce_python_input_limits(request.imports_code or "", "imports_code")
@@ -5968,20 +9699,22 @@ def render_code(request: CodeRequest, http_request: Request):
     _enforce_python_input_limits(request.runtime_code or "", "runtime_code")
     _enforce_python_input_limits(request.runtime_theme_code or "", "runtime_theme_code")
     _enforce_python_input_limits(request.runtime_predefined_code or "", "runtime_predefined_code")
-    conn = _hub_db_conn()
-    try:
-        request.trusted_user = _is_user_trusted(_request_user(conn, http_request))
-    finally:
-        conn.close()
-    actor_key, rate_key = _request_actor_key(http_request)
+    request.trusted_user = _is_user_trusted(user)
+    request.api_base_url = _public_api_base(http_request, request.api_base_url)
+    actor_key, rate_key = _request_actor_key(http_request, conn)
     _enforce_render_rate_limit("code", rate_key)
-    result = run_in_process('code', request, actor_key)
+    result = run_in_process('code', request, actor_key, conn)
     if "error" in result:
         return result
     return result
 
 @app.post("/render/builder")
-def render_builder(request: BuilderRequest, http_request: Request):
+def render_builder(
+    request: BuilderRequest,
+    http_request: Request,
+    conn: sqlite3.Connection = Depends(_hub_read_db),
+    user: Optional[sqlite3.Row] = Depends(_request_identity),
+):
     _enforce_python_input_limits(request.predefined_code or "", "predefined_code")
     _enforce_python_input_limits(request.imports_code or "", "imports_code")
     _enforce_python_input_limits(request.runtime_imports_code or "", "runtime_imports_code")
@@ -5989,14 +9722,14 @@ def render_builder(request: BuilderRequest, http_request: Request):
     _enforce_python_input_limits(request.runtime_code or "", "runtime_code")
     _enforce_python_input_limits(request.runtime_theme_code or "", "runtime_theme_code")
     _enforce_python_input_limits(request.runtime_predefined_code or "", "runtime_predefined_code")
-    conn = _hub_db_conn()
-    try:
-        request.trusted_user = _is_user_trusted(_request_user(conn, http_request))
-    finally:
-        conn.close()
-    actor_key, rate_key = _request_actor_key(http_request)
+    request.trusted_user = _is_user_trusted(user)
+    request.api_base_url = _public_api_base(http_request, request.api_base_url)
+    for el in [*request.elements, *(request.runtime_elements or [])]:
+        if el.type == "flag":
+            el.value = _expand_gadm_flag_value(el.value)
+    actor_key, rate_key = _request_actor_key(http_request, conn)
     _enforce_render_rate_limit("builder", rate_key)
-    result = run_in_process('builder', request, actor_key)
+    result = run_in_process('builder', request, actor_key, conn)
     if "error" in result:
         return result
     return result
@@ -6034,6 +9767,20 @@ def _startup_populate_builder_elements():
         print(f"[xatra] Warning: startup element seeding failed: {e}", file=sys.stderr)
 
 
+@app.on_event("startup")
+def _startup_session_sweeper():
+    """Delete expired sessions now and then hourly, off the request path."""
+    def _run():
+        while True:
+            try:
+                _sweep_expired_sessions()
+            except Exception as e:
+                print(f"[xatra] Warning: expired session sweep failed: {e}", file=sys.stderr)
+            time.sleep(SESSION_SWEEP_INTERVAL_SECONDS)
+
+    threading.Thread(target=_run, daemon=True).start()
+
+
 if __name__ == "__main__":
     import uvicorn
     # Use spawn for multiprocessing compatibility